@@ -1,11 +1,119 @@
 from django.contrib import admin
-from .models import BookInstance, Book, Language, Genre, Author
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
+from django.http import QueryDict
+from .autocomplete import prefix_range
+from .models import BookInstance, Book, Hold, Language, Genre, Author, fold
+from .pagination import EstimatedCountPaginator
 
 # Register your models here.
 
+# The admin must stay usable with millions of copies. The change lists load the
+# foreign keys they show with a join, count large tables from the statistics of
+# the database (see catalog/pagination.py) and the foreign keys are edited with
+# autocomplete widgets, which only load the chosen object instead of rendering a
+# <select> of every user or book. The inlines show one page of objects at a time.
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """    
+    An inline formset with the forms of one page of the related objects. The page
+    is given by the <prefix>-page parameter of the url. The change form posts to
+    the url it was shown at, so the forms posted are the ones of the page shown.
+    """    
+    per_page = 20
+    page_number = None
+    # the query string of the request, kept in the links to the other pages
+    query = None
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            # the pages only split the objects right in a total order. The ordering of
+            # the model can repeat, eg the empty due_back of the available copies, so
+            # the primary key breaks the ties.
+            queryset = super().get_queryset()
+            ordering = queryset.query.order_by or queryset.model._meta.ordering
+            paginator = Paginator(queryset.order_by(*ordering, 'pk'), self.per_page)
+            self.page = paginator.get_page(self.page_number)
+            self._queryset = self.page.object_list
+        return self._queryset
+
+    @classmethod
+    def page_param(cls):
+        return f'{cls.get_default_prefix()}-page'
+
+    def page_url(self, number):
+        """
+        Args:
+            number (int): the number of a page
+
+        Returns:
+            str: the query string of the change form showing that page of the inline
+        """
+        query = self.query.copy() if self.query is not None else QueryDict(mutable=True)
+        query[self.page_param()] = number
+        return f'?{query.urlencode()}'
+
+    @property
+    def previous_page_url(self):
+        return self.page_url(self.page.previous_page_number())
+
+    @property
+    def next_page_url(self):
+        return self.page_url(self.page.next_page_number())
+
+
+class PaginatedInlineMixin:
+    """    
+    A mixin for TabularInlines showing the related objects one page at a time.
+    """    
+    formset = PaginatedInlineFormSet
+    template = 'catalog/admin/paginated_tabular.html'
+    per_page = 20
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.page_number = request.GET.get(formset.page_param())
+        formset.query = request.GET
+        return formset
+
+
+class FoldedSearchMixin:
+    """    
+    A mixin for the ModelAdmins searched by the start of their names. Django matches
+    the '^' fields of search_fields with an istartswith, which compares UPPER() or
+    LIKE on the column and which its index does not answer. The mixin matches them
+    with a range over their case folded copy, <field>_folded (see FoldedField in
+    catalog/models.py), as the autocomplete of the book forms does:
+
+        WHERE last_name_folded >= 'aus' AND last_name_folded < 'aut'
+
+    The '=' fields are matched exactly, the others with an icontains. The whole
+    search term is the prefix, it is not split into words.
+    """    
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        start, end = prefix_range(fold(term))
+        condition = Q()
+        for field in self.get_search_fields(request):
+            if field.startswith('^'):
+                condition |= Q(**{f'{field[1:]}_folded__gte': start, f'{field[1:]}_folded__lt': end})
+            elif field.startswith('='):
+                condition |= Q(**{field[1:]: term})
+            else:
+                condition |= Q(**{f'{field}__icontains': term})
+        # none of the fields are across a many to many relation, so no duplicates
+        return queryset.filter(condition), False
+
+
 # class BooksInline is used to enable Authors to be displayed with the
 # number of their books instances. It is used with the inline word
-class BooksInline(admin.TabularInline):
+class BooksInline(PaginatedInlineMixin, admin.TabularInline):
     model = Book
 
     # the extra feature shows the number of arbitrary new books object that are included
@@ -14,15 +122,18 @@ class BooksInline(admin.TabularInline):
     # it should be done via 'Add Book'.
     extra = 0
 
+    # every row would otherwise render a <select> of every language and genre
+    autocomplete_fields = ('language', 'genre')
+
 
 # admin.site.register(Author)
-class AuthorAdmin(admin.ModelAdmin):
-    """
+class AuthorAdmin(FoldedSearchMixin, admin.ModelAdmin):
+    """    
     A class That allows the configuration of the admin properties for the Author Model
 
     Args:
         admin.ModelAdmin
-    """   
+    """    
     # for viewing a list of Author objects. list_display will display the lists
     # of fields as listed in the tuple. 
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
@@ -36,19 +147,31 @@ class AuthorAdmin(admin.ModelAdmin):
     # of the number of books each author has written.
     inlines = [BooksInline]
 
+    # the search of the list and of the autocomplete widgets matches the start of the
+    # names ('^') on their folded copies, which their indexes answer without scanning
+    # every author (see FoldedSearchMixin).
+    search_fields = ('^last_name', '^first_name')
+    ordering = ('last_name', 'first_name')
+
 # now register the Author model with the associated Class model just created.
 admin.site.register(Author, AuthorAdmin)
 
 
 # class BookInstanceInline is used to enable Books to be displayed with the
 # number of their books instances. It is used with the inline word
-class BooksInstanceInline(admin.TabularInline):
+class BooksInstanceInline(PaginatedInlineMixin, admin.TabularInline):
     model = BookInstance
     extra = 0
+    autocomplete_fields = ('borrower',)
+    readonly_fields = ('overdue', 'days_overdue')
+
+    # every row shows its copy with BookInstance.__str__, which reads the book
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('book')
 
 # admin.site.register(Book)
-class BookAdmin(admin.ModelAdmin):
-    """
+class BookAdmin(FoldedSearchMixin, admin.ModelAdmin):
+    """    
     A class That allows the configuration of the admin properties for the Book Model
 
     Args:
@@ -56,8 +179,19 @@ class BookAdmin(admin.ModelAdmin):
     """    
     list_display = ('title', 'author', 'display_genre')
 
+    # load the author with the book, and the genres of the page in one query, as
+    # display_genre reads them for every row
+    list_select_related = ('author',)
+    # the start of the title, on its folded copy (see FoldedSearchMixin), or the isbn
+    search_fields = ('^title', '=isbn')
+    autocomplete_fields = ('author', 'language', 'genre')
+    paginator = EstimatedCountPaginator
+
     inlines = [BooksInstanceInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('genre')
+
 admin.site.register(Book, BookAdmin)
 
 #admin.site.register(BookInstance)
@@ -65,24 +199,64 @@ admin.site.register(Book, BookAdmin)
 # way of doing it.
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
-    """
+    """    
     A class That allows the configuration of the admin properties for the BookInstance Model
 
     Args:
         admin.ModelAdmin
     """    
-    list_display = ('book', 'status', 'borrower', 'due_back', 'id')
-    list_filter = ('status', 'due_back')
+    list_display = ('book', 'status', 'borrower', 'due_back', 'days_overdue', 'id')
+    # the overdue filter reads the flag stored by the overdue sweep (catalog/overdue.py).
+    # The due_back filter offers fixed date ranges, answered by the due_back index.
+    list_filter = ('status', 'overdue', 'due_back')
+    readonly_fields = ('overdue', 'days_overdue')
     fieldsets = (
         (None, {
             'fields': ('book', 'imprint', 'id')
         }),
         ('Availability', {
-            'fields': ('status', 'due_back', 'borrower')
+            'fields': ('status', 'due_back', 'borrower', ('overdue', 'days_overdue'))
         }),
     )
 
+    # book and borrower can be null, so Django does not join them on its own
+    list_select_related = ('book', 'borrower')
+    autocomplete_fields = ('book', 'borrower')
+    # the unfiltered list is counted from the statistics of the database, and a
+    # filtered list does not count the whole table as well
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    """    
+    A class That allows the configuration of the admin properties for the Hold Model
+
+    Args:
+        admin.ModelAdmin
+    """    
+    list_display = ('book', 'user', 'status', 'placed_at', 'ready_at')
+    list_filter = ('status',)
+    # the queues are changed through catalog/holds.py, which keeps the copies in step
+    readonly_fields = ('book', 'user', 'status', 'copy', 'placed_at', 'ready_at')
+
+    list_select_related = ('book', 'user')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # the holds are placed with holds.place_hold, which queues them and reserves a
+    # copy. The add form would have no field to fill.
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Language)
+class LanguageAdmin(FoldedSearchMixin, admin.ModelAdmin):
+    # searched by the autocomplete widgets of the books
+    search_fields = ('^name',)
 
-admin.site.register(Language)
-admin.site.register(Genre)
 
+@admin.register(Genre)
+class GenreAdmin(FoldedSearchMixin, admin.ModelAdmin):
+    search_fields = ('^name',)
@@ -0,0 +1,540 @@
+"""
+JSON API over the catalog, for the kiosk and mobile clients.
+
+Every resource has a collection and a detail url:
+
+    GET    /catalog/api/books/                 a page of books
+    POST   /catalog/api/books/                 create a book
+    GET    /catalog/api/books/<id>/            one book
+    PUT    /catalog/api/books/<id>/            replace the writable fields of a book
+    PATCH  /catalog/api/books/<id>/            change some fields of a book
+    DELETE /catalog/api/books/<id>/            delete a book
+
+The resources are books, authors, copies, genres and languages. A GET accepts:
+
+    ?fields=title,isbn      sparse fieldsets: only these fields are selected from
+                            the database (with .only()) and returned, plus the id
+    ?include=author,genre   embed the related objects instead of their ids. They
+                            are loaded with a join (foreign keys) or one query per
+                            relation (many to many), whatever the number of rows
+    ?limit=50&cursor=...    cursor pagination (see catalog/pagination.py), the
+                            response links to the next and previous pages
+
+Responses carry a strong ETag computed from the url and from versions of the
+models they show, kept in the cache and bumped whenever one of the models
+changes (see invalidate_api). A client polling with If-None-Match gets a 304
+without a single catalog query while nothing changed.
+
+Reading needs a logged in user, writing the add, change or delete permission of
+the model. Requests are authenticated with the session, so writes need the CSRF
+token like the forms of the site.
+"""
+
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch, ProtectedError, RestrictedError
+from django.forms import modelform_factory
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import urlencode
+
+from .cache import bump_version, get_version
+from .models import Author, Book, BookInstance, Genre, Language
+from .pagination import CursorPaginator, InvalidCursor
+
+# the number of objects on a page when the client does not ask for a number
+DEFAULT_PAGE_SIZE = 20
+
+# the largest page a client can ask for
+MAX_PAGE_SIZE = 100
+
+
+class ApiError(Exception):
+    """
+    Raised to answer a request with an error.
+
+    Args:
+        message (str): the description of the error sent to the client
+        status (int): the HTTP status of the response
+        errors (dict): the errors of the fields of the object, if any
+    """
+
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+class Resource:
+    """
+    A model exposed by the API.
+
+    Args:
+        model (Model): the model
+        fields (tuple): the fields returned by default, which are the only ones a client can ask for
+        ordering (list): the fields the pages are ordered by
+        relations (dict): the resource name of every relation field that can be included
+        writable (tuple): the fields a client can set
+        private (dict): the permission needed to see some of the fields
+    """
+
+    def __init__(self, model, fields, ordering, relations=None, writable=None, private=None):
+        self.model = model
+        self.fields = fields
+        self.ordering = ordering
+        self.relations = relations or {}
+        self.writable = writable or fields
+        self.private = private or {}
+
+    def visible_fields(self, user):
+        """
+        Args:
+            user (User): the user making the request
+
+        Returns:
+            tuple: the fields the user may see
+        """
+        return tuple(
+            name for name in self.fields if name not in self.private or user.has_perm(self.private[name])
+        )
+
+    def embedded_fields(self, user):
+        """
+        Args:
+            user (User): the user making the request
+
+        Returns:
+            tuple: the fields shown when an object is embedded in another one. Many
+                   to many relations are left out so embedding costs no extra query.
+        """
+        return tuple(
+            name for name in self.visible_fields(user) if not self.model._meta.get_field(name).many_to_many
+        )
+
+    def permission(self, action):
+        """
+        Args:
+            action (str): 'add', 'change' or 'delete'
+
+        Returns:
+            str: the permission needed to do the action on the model
+        """
+        return f'{self.model._meta.app_label}.{action}_{self.model._meta.model_name}'
+
+
+RESOURCES = {
+    'books': Resource(
+        Book,
+        fields=(
+            'title', 'author', 'summary', 'isbn', 'genre', 'language', 'copies_total', 'copies_available',
+            'copies_on_loan', 'copies_reserved', 'copies_maintenance', 'copies_overdue',
+        ),
+        ordering=['title'],
+        relations={'author': 'authors', 'genre': 'genres', 'language': 'languages'},
+        writable=('title', 'author', 'summary', 'isbn', 'genre', 'language'),
+    ),
+    'authors': Resource(
+        Author,
+        fields=('first_name', 'last_name', 'date_of_birth', 'date_of_death'),
+        ordering=['last_name', 'first_name'],
+    ),
+    'copies': Resource(
+        BookInstance,
+        fields=('book', 'imprint', 'due_back', 'status', 'borrower', 'overdue', 'days_overdue'),
+        ordering=['due_back'],
+        relations={'book': 'books'},
+        writable=('book', 'imprint', 'due_back', 'status', 'borrower'),
+        # who borrowed a copy is only shown to the librarians
+        private={'borrower': 'catalog.can_mark_returned'},
+    ),
+    'genres': Resource(Genre, fields=('name',), ordering=['name']),
+    'languages': Resource(Language, fields=('name', 'code'), ordering=['name']),
+}
+
+
+def api_namespace(model):
+    """
+    Args:
+        model (Model): a model exposed by the API
+
+    Returns:
+        str: the name of the version of the responses showing the model
+    """
+    return f'api:{model._meta.model_name}'
+
+
+def invalidate_api(*models):
+    """
+    Change the ETags of the responses showing some models. The signal receivers
+    call it when an object is saved or deleted, and the code changing objects
+    with QuerySet.update or bulk queries calls it itself.
+
+    Args:
+        models (Model): the models that changed
+    """
+    for model in set(models):
+        bump_version(api_namespace(model))
+
+
+def _split(value):
+    """
+    Args:
+        value (str): a comma separated list of names from the query string
+
+    Returns:
+        list: the names, without blanks
+    """
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def _get_resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(f'There is no resource {name!r}.', status=404)
+    return resource
+
+
+def _fields_and_include(request, resource):
+    """
+    Read the sparse fieldset and the relations to include from the query string.
+
+    Args:
+        request (HttpRequest): the request
+        resource (Resource): the resource requested
+
+    Returns:
+        tuple: the fields to return and the relations to embed
+
+    Raises:
+        ApiError: if a field or relation is unknown
+    """
+    visible = resource.visible_fields(request.user)
+    fields = _split(request.GET.get('fields')) or list(visible)
+    unknown = [name for name in fields if name not in visible]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}.')
+
+    include = _split(request.GET.get('include'))
+    unknown = [name for name in include if name not in resource.relations or name not in visible]
+    if unknown:
+        raise ApiError(f'Cannot include: {", ".join(unknown)}.')
+    # an included relation is returned even when it was not in the fieldset
+    fields += [name for name in include if name not in fields]
+    return fields, include
+
+
+def _queryset(resource, fields, include, user):
+    """
+    Build the query selecting only the columns needed for the response.
+
+    Args:
+        resource (Resource): the resource requested
+        fields (list): the fields to return
+        include (list): the relations to embed
+        user (User): the user making the request
+
+    Returns:
+        QuerySet: the objects of the resource, with their relations loaded in a
+                  fixed number of queries
+    """
+    model = resource.model
+    only = [model._meta.pk.name]
+    joined = []
+    prefetches = []
+    for name in fields:
+        field = model._meta.get_field(name)
+        target = RESOURCES[resource.relations[name]] if name in include else None
+        if field.many_to_many:
+            columns = target.embedded_fields(user) if target else ()
+            prefetches.append(Prefetch(name, queryset=field.related_model.objects.only('pk', *columns)))
+            continue
+        only.append(name)
+        if target:
+            joined.append(name)
+            only.extend(f'{name}__{column}' for column in target.embedded_fields(user))
+    return model.objects.select_related(*joined).prefetch_related(*prefetches).only(*only)
+
+
+def _serialize(resource, obj, fields, include, user):
+    """
+    Args:
+        resource (Resource): the resource of the object
+        obj (Model): the object, loaded by _queryset
+        fields (list): the fields to return
+        include (list): the relations to embed
+        user (User): the user making the request
+
+    Returns:
+        dict: the object as JSON
+    """
+    data = {'id': obj.pk}
+    for name in fields:
+        field = resource.model._meta.get_field(name)
+        if not field.is_relation:
+            data[name] = getattr(obj, name)
+            continue
+
+        target = RESOURCES[resource.relations[name]] if name in include else None
+        if field.many_to_many:
+            related = getattr(obj, name).all()
+            data[name] = [
+                _serialize(target, item, target.embedded_fields(user), (), user) if target else item.pk
+                for item in related
+            ]
+        elif target:
+            related = getattr(obj, name)
+            data[name] = _serialize(target, related, target.embedded_fields(user), (), user) if related else None
+        else:
+            data[name] = getattr(obj, field.attname)
+    return data
+
+
+def _etag(request, resource, include, private):
+    """
+    Args:
+        request (HttpRequest): the request
+        resource (Resource): the resource requested
+        include (list): the relations embedded in the response
+        private (bool): whether the response shows private fields
+
+    Returns:
+        str: a strong ETag of the response, which changes with the url and with
+             the versions of the models the response shows
+    """
+    models = {resource.model} | {RESOURCES[resource.relations[name]].model for name in include}
+    versions = sorted((api_namespace(model), get_version(api_namespace(model))) for model in models)
+    state = json.dumps([request.get_full_path(), versions, private])
+    return '"%s"' % hashlib.sha1(state.encode()).hexdigest()
+
+
+def _conditional(request, resource, include, build):
+    """
+    Answer a GET with a 304 if the client has the current version of the
+    response, otherwise with the response built by build.
+
+    Args:
+        request (HttpRequest): the request
+        resource (Resource): the resource requested
+        include (list): the relations embedded in the response
+        build (callable): returns the JSON body of the response
+
+    Returns:
+        HttpResponse: the response, with its ETag
+    """
+    private = any(name in resource.visible_fields(request.user) for name in resource.private)
+    etag = _etag(request, resource, include, private)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = etag
+    # the client must check the ETag before using its copy
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be a number.')
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{urlencode(sorted(params.items()))}'
+
+
+def _list(request, resource):
+    fields, include = _fields_and_include(request, resource)
+    paginator = CursorPaginator(
+        _queryset(resource, fields, include, request.user), _page_size(request), resource.ordering
+    )
+
+    def build():
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise ApiError('Invalid page cursor.')
+        return {
+            'data': [_serialize(resource, obj, fields, include, request.user) for obj in page],
+            'next': _page_url(request, page.next_cursor),
+            'previous': _page_url(request, page.previous_cursor),
+        }
+
+    return _conditional(request, resource, include, build)
+
+
+def _get_object(resource, pk, queryset=None):
+    """
+    Args:
+        resource (Resource): the resource requested
+        pk (str): the primary key from the url
+        queryset (QuerySet): the query to load the object with
+
+    Returns:
+        Model: the object
+
+    Raises:
+        ApiError: if there is no such object
+    """
+    queryset = resource.model.objects.all() if queryset is None else queryset
+    try:
+        return queryset.get(pk=resource.model._meta.pk.to_python(pk))
+    except (resource.model.DoesNotExist, ValidationError, ValueError) as error:
+        # a malformed primary key is not found either
+        raise ApiError('Not found.', status=404) from error
+
+
+def _retrieve(request, resource, pk):
+    fields, include = _fields_and_include(request, resource)
+
+    def build():
+        obj = _get_object(resource, pk, _queryset(resource, fields, include, request.user))
+        return {'data': _serialize(resource, obj, fields, include, request.user)}
+
+    return _conditional(request, resource, include, build)
+
+
+def _payload(request):
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        raise ApiError('The body is not valid JSON.')
+    if not isinstance(payload, dict):
+        raise ApiError('The body must be an object.')
+    return payload
+
+
+def _check_permission(request, resource, action):
+    if not request.user.has_perm(resource.permission(action)):
+        raise ApiError('Permission denied.', status=403)
+
+
+def _current_data(resource, instance):
+    """
+    Args:
+        resource (Resource): the resource of the object
+        instance (Model): the object
+
+    Returns:
+        dict: the writable fields of the object, as a client would send them
+    """
+    data = {}
+    for name in resource.writable:
+        field = resource.model._meta.get_field(name)
+        if field.many_to_many:
+            data[name] = [item.pk for item in getattr(instance, name).all()]
+        else:
+            data[name] = getattr(instance, field.attname)
+    return data
+
+
+def _save(request, resource, instance=None, partial=False):
+    """
+    Validate the body of a request with a model form of the writable fields and save it.
+
+    Args:
+        request (HttpRequest): the request
+        resource (Resource): the resource of the object
+        instance (Model): the object to change, None to create one
+        partial (bool): whether the body may leave fields out, which keep their values
+
+    Returns:
+        JsonResponse: the object saved
+
+    Raises:
+        ApiError: if the body is not valid
+    """
+    payload = _payload(request)
+    unknown = [name for name in payload if name not in resource.writable]
+    if unknown:
+        raise ApiError(f'Fields that cannot be written: {", ".join(unknown)}.')
+
+    data = {**_current_data(resource, instance), **payload} if partial else payload
+    form = modelform_factory(resource.model, fields=resource.writable)(data=data, instance=instance)
+    if not form.is_valid():
+        raise ApiError('The object is not valid.', errors=form.errors.get_json_data())
+    obj = form.save()
+
+    fields, include = list(resource.visible_fields(request.user)), []
+    obj = _get_object(resource, obj.pk, _queryset(resource, fields, include, request.user))
+    return JsonResponse(
+        {'data': _serialize(resource, obj, fields, include, request.user)}, status=201 if instance is None else 200
+    )
+
+
+def _delete(request, resource, pk):
+    _check_permission(request, resource, 'delete')
+    instance = _get_object(resource, pk)
+    try:
+        instance.delete()
+    except (ProtectedError, RestrictedError):
+        raise ApiError('Other objects depend on this one, delete them first.', status=409)
+    return HttpResponse(status=204)
+
+
+def _respond(request, resource_name, handlers):
+    """
+    Run the handler of the request method and turn the errors into JSON responses.
+
+    Args:
+        request (HttpRequest): the request
+        resource_name (str): the name of the resource in the url
+        handlers (dict): the function handling each method, taking the resource
+
+    Returns:
+        HttpResponse: the response
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    handler = handlers.get(request.method)
+    if handler is None:
+        response = JsonResponse({'error': 'Method not allowed.'}, status=405)
+        response['Allow'] = ', '.join(handlers)
+        return response
+    try:
+        return handler(_get_resource(resource_name))
+    except ApiError as error:
+        body = {'error': error.message}
+        if error.errors:
+            body['errors'] = error.errors
+        return JsonResponse(body, status=error.status)
+
+
+def collection(request, resource):
+    """
+        List the objects of a resource, or create one.
+    """
+    def create(resource):
+        _check_permission(request, resource, 'add')
+        return _save(request, resource)
+
+    return _respond(request, resource, {
+        'GET': lambda resource: _list(request, resource),
+        'HEAD': lambda resource: _list(request, resource),
+        'POST': create,
+    })
+
+
+def detail(request, resource, pk):
+    """
+        Show, change or delete an object of a resource.
+    """
+    def update(resource):
+        _check_permission(request, resource, 'change')
+        return _save(request, resource, _get_object(resource, pk), partial=request.method == 'PATCH')
+
+    return _respond(request, resource, {
+        'GET': lambda resource: _retrieve(request, resource, pk),
+        'HEAD': lambda resource: _retrieve(request, resource, pk),
+        'PUT': update,
+        'PATCH': update,
+        'DELETE': lambda resource: _delete(request, resource, pk),
+    })
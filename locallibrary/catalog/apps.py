@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
+
+    def ready(self):
+        # connect the signal receivers that keep the cached catalog data fresh
+        from . import signals  # noqa: F401
+        # register the system checks
+        from . import checks  # noqa: F401
+
+        # tune the SQLite connections when a profile is configured
+        from django.db.backends.signals import connection_created
+        from .sqlite import configure_connection
+        connection_created.connect(configure_connection, dispatch_uid='catalog_sqlite_profile')
+
+        # compile the templates before the first request in the production template mode
+        from django.conf import settings
+        if getattr(settings, 'CATALOG_TEMPLATE_MODE', None) == 'production':
+            from .templating import warm_templates
+            warm_templates()
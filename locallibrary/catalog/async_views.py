@@ -0,0 +1,255 @@
+"""
+Async versions of the read-only catalog pages, served under ASGI.
+
+Under ASGI a sync view is run in a thread, one at a time per request, so
+whatever it does waits for the step before. These views run the independent
+steps of a page at the same time instead: loading the user and the session
+alongside the home page statistics, the page of books or the cached fragment
+version, and the loans of a user alongside their holds.
+
+Django 3.2 has no async ORM, so every step that queries the database is a sync
+function run with sync_to_async. Independent steps are gathered with
+asyncio.gather and each runs in its own thread with its own database
+connection, which only works outside a request-wide transaction: the
+connections of the other threads do not see the uncommitted rows. When
+ATOMIC_REQUESTS is on, or when CATALOG_ASYNC_PARALLEL_QUERIES is False (eg in a
+TestCase), the steps run one after another on the request thread.
+
+The pages reuse the querysets, pagination and templates of the sync views in
+catalog/views.py, so both versions show exactly the same content, and answer the
+conditional GETs the same way (see catalog/conditional.py): what the page shows
+is looked up while the user is loaded, and the page is only loaded when the
+client does not have it yet. The catalog
+urls use these views when CATALOG_ASYNC_VIEWS is set, which
+locallibrary/asgi.py does.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from django.shortcuts import render
+
+from . import views, visits
+from .stats import get_index_statistics
+
+
+def parallel_queries():
+    """
+    Returns:
+        bool: whether the independent steps of a page may run on their own connections
+    """
+    default = not settings.DATABASES[DEFAULT_DB_ALIAS].get('ATOMIC_REQUESTS', False)
+    return getattr(settings, 'CATALOG_ASYNC_PARALLEL_QUERIES', default)
+
+
+def _on_own_connection(function):
+    """
+    Args:
+        function (callable): a step that queries the database
+
+    Returns:
+        callable: the step, closing the connection of its thread afterwards when
+                  CONN_MAX_AGE says so, as Django does at the end of a request
+    """
+    def run():
+        try:
+            return function()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather(*functions):
+    """
+    Run independent sync steps of a page, at the same time when possible.
+
+    Args:
+        functions (callable): the steps, without arguments
+
+    Returns:
+        list: the results of the steps, in order
+    """
+    if not parallel_queries():
+        return [await sync_to_async(function)() for function in functions]
+    return await asyncio.gather(*[
+        sync_to_async(_on_own_connection(function), thread_sensitive=False)() for function in functions
+    ])
+
+
+def _authenticate(request):
+    """
+    Load the user of a request, and with it the session, so the rest of the view
+    can use them without querying the database.
+
+    Args:
+        request (HttpRequest): the request
+
+    Returns:
+        bool: whether the user is logged in
+    """
+    return request.user.is_authenticated
+
+
+async def _conditional(instance, state, render):
+    """
+    Args:
+        instance (ConditionalGetMixin): the view set up for the request
+        state (tuple): the state returned by its get_conditional_state
+        render (callable): returns the response of the view
+
+    Returns:
+        HttpResponse: a 304 if the client has the current version of the page,
+                      otherwise the response of render, with its validators
+    """
+    response = instance.get_not_modified(state)
+    if response is None:
+        response = await render()
+    return instance.add_validators(response, state)
+
+
+async def _render(response):
+    """
+    Args:
+        response (TemplateResponse): the response of a view
+
+    Returns:
+        TemplateResponse: the response, rendered. The templates may still query the
+                          database (eg the permissions of the user), so they are
+                          rendered in a thread.
+    """
+    await sync_to_async(response.render)()
+    return response
+
+
+async def index(request):
+    """
+    The home page. The statistics are loaded while the user and the session are.
+
+    Args:
+        request (HTTP):
+
+    Returns:
+        html that is displayed to the end-user.
+    """
+    authenticated, statistics = await gather(lambda: _authenticate(request), get_index_statistics)
+    if not authenticated:
+        return redirect_to_login(request.get_full_path(), '/accounts/login')
+
+    num_visits = await sync_to_async(visits.record_visit)(request)
+    context = {
+        **statistics,
+        'num_visits': num_visits
+    }
+    return await sync_to_async(render)(request, 'catalog/index.html', context=context)
+
+
+def _setup(view_class, request, kwargs):
+    """
+    Args:
+        view_class (View): the sync view whose behaviour is reused
+        request (HttpRequest): the request
+        kwargs (dict): the arguments captured from the url
+
+    Returns:
+        View: an instance of the view set up for the request
+    """
+    view = view_class()
+    view.setup(request, **kwargs)
+    return view
+
+
+def _list_context(view, **kwargs):
+    """
+    Args:
+        view (ListView): a list view set up for a request
+        kwargs: extra context
+
+    Returns:
+        dict: the context of the page, with the objects of the page loaded
+    """
+    view.object_list = view.get_queryset()
+    context = view.get_context_data(**kwargs)
+    # evaluate the page here, rather than while the template renders
+    list(context['object_list'])
+    return context
+
+
+def _list_view(view_class):
+    """
+    Args:
+        view_class (ListView): a sync list view using ConditionalGetMixin
+
+    Returns:
+        coroutine function: the async view, looking up what the page shows while
+                            the user is loaded
+    """
+    async def view(request, **kwargs):
+        instance = _setup(view_class, request, kwargs)
+        authenticated, state = await gather(lambda: _authenticate(request), instance.get_conditional_state)
+        if not authenticated:
+            return instance.handle_no_permission()
+
+        async def render():
+            context = await sync_to_async(_list_context)(instance)
+            return await _render(instance.render_to_response(context))
+        return await _conditional(instance, state, render)
+
+    view.view_class = view_class
+    view.__doc__ = f'Async version of {view_class.__name__}.'
+    return view
+
+
+def _detail_view(view_class):
+    """
+    Args:
+        view_class (DetailView): a sync detail view using ConditionalGetMixin and
+                                 FragmentCacheMixin
+
+    Returns:
+        coroutine function: the async view, looking up what the page shows and the
+                            cached fragment while the user is loaded
+    """
+    def detail_response(instance):
+        instance.object = instance.get_object()
+        return instance.render_to_response(instance.get_context_data(object=instance.object))
+
+    async def view(request, **kwargs):
+        instance = _setup(view_class, request, kwargs)
+        authenticated, state, (instance.fragment_version, instance.fragment_cached) = await gather(
+            lambda: _authenticate(request), instance.get_conditional_state, instance.get_fragment_state
+        )
+        if not authenticated:
+            return instance.handle_no_permission()
+
+        async def render():
+            return await _render(await sync_to_async(detail_response)(instance))
+        return await _conditional(instance, state, render)
+
+    view.view_class = view_class
+    view.__doc__ = f'Async version of {view_class.__name__}.'
+    return view
+
+
+book_list = _list_view(views.BookListView)
+author_list = _list_view(views.AuthorListView)
+book_detail = _detail_view(views.BookDetailView)
+author_detail = _detail_view(views.AuthorDetailView)
+
+
+async def loaned_books_by_user(request):
+    """
+    Async version of LoanedBooksByUserListView. The loans and the holds of the user
+    are loaded at the same time.
+    """
+    instance = _setup(views.LoanedBooksByUserListView, request, {})
+    if not await sync_to_async(_authenticate)(request):
+        return instance.handle_no_permission()
+
+    context, user_holds = await gather(
+        lambda: _list_context(instance, holds=None), lambda: list(instance.get_holds())
+    )
+    context['holds'] = user_holds
+    return await _render(instance.render_to_response(context))
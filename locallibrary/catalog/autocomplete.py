@@ -0,0 +1,246 @@
+"""
+Autocomplete of the authors, genres and languages of the book forms.
+
+A <select> of every author makes the book forms megabytes of HTML once the
+catalog has tens of thousands of authors. The book forms use the widgets below
+instead: they only render the chosen objects, and the page looks the others up
+as the user types, from
+
+    GET /catalog/autocomplete/<source>/?q=<prefix>
+
+where the source is authors, genres or languages. The response lists the first
+objects whose name starts with the prefix, whatever the case:
+
+    {"results": [{"id": 3, "text": "Austen, Jane"}, ...]}
+
+The names are matched with a range over their case folded copy (see
+FoldedField in catalog/models.py),
+
+    WHERE name_folded >= 'ab' AND name_folded < 'ac'
+
+which the indexes of the folded columns answer without scanning the table. The
+case is folded in Python rather than with LOWER(), which SQLite only applies to
+ASCII letters, so 'émile' finds 'Émile'.
+
+The short prefixes are the ones typed most and match the most rows, so their
+results are kept in a small in-process LRU cache. The entries are keyed by a
+version of the source that the signal receivers in catalog/signals.py bump when
+one of its objects changes (see invalidate_autocomplete).
+"""
+
+import threading
+from collections import OrderedDict
+
+from django import forms
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+
+from .cache import bump_version, get_version
+from .models import Author, Genre, Language, fold
+
+# the model of every source and the fields matched with the prefix, in the order of the
+# results. Every field has a case folded copy, <field>_folded, which is matched.
+SOURCES = {
+    'authors': (Author, ('last_name', 'first_name')),
+    'genres': (Genre, ('name',)),
+    'languages': (Language, ('name',)),
+}
+
+# the number of objects a lookup returns
+MAX_RESULTS = 10
+
+# the results of the prefixes up to this length are cached. Longer prefixes match
+# few rows, which the indexes find quickly, and would push the hot ones out.
+HOT_PREFIX_LENGTH = 3
+
+
+class LRUCache:
+    """
+    A thread-safe least recently used cache, kept in the memory of the process.
+
+    Args:
+        maxsize (int): the number of entries kept
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+            the value of the key, or None if it is not cached
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+hot_prefixes = LRUCache(getattr(settings, 'CATALOG_AUTOCOMPLETE_CACHE_SIZE', 256))
+
+
+def autocomplete_namespace(model):
+    """
+    Args:
+        model (Model): the model of a source
+
+    Returns:
+        str: the name of the version of the cached results of the model
+    """
+    return f'autocomplete:{model._meta.model_name}'
+
+
+def invalidate_autocomplete(*models):
+    """
+    Drop the cached results of some models. The signal receivers call it when an
+    object is saved or deleted, and the code creating objects with bulk queries
+    calls it itself.
+
+    Args:
+        models (Model): the models that changed
+    """
+    for model in set(models):
+        bump_version(autocomplete_namespace(model))
+
+
+def prefix_range(prefix):
+    """
+    Args:
+        prefix (str): a case folded prefix
+
+    Returns:
+        tuple: the smallest string starting with the prefix and the smallest string
+               after every string starting with it
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def prefix_queryset(source, prefix):
+    """
+    Args:
+        source (str): the name of a source of SOURCES
+        prefix (str): the case folded start of the names looked for
+
+    Returns:
+        QuerySet: the objects of the source whose name starts with the prefix, in order
+    """
+    model, fields = SOURCES[source]
+    queryset = model.objects.order_by(*fields, 'pk')
+    if not prefix:
+        return queryset
+    start, end = prefix_range(prefix)
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}_folded__gte': start, f'{field}_folded__lt': end})
+    return queryset.filter(condition)
+
+
+def search(source, prefix):
+    """
+    Args:
+        source (str): the name of a source of SOURCES
+        prefix (str): the start of the names looked for, in any case
+
+    Returns:
+        list: the (id, text) of the first objects whose name starts with the prefix,
+              or of the first objects when the prefix is empty
+    """
+    model, _ = SOURCES[source]
+    prefix = fold(prefix.strip())
+
+    key = None
+    if len(prefix) <= HOT_PREFIX_LENGTH:
+        key = (source, prefix, get_version(autocomplete_namespace(model)))
+        results = hot_prefixes.get(key)
+        if results is not None:
+            return results
+
+    results = [(obj.pk, str(obj)) for obj in prefix_queryset(source, prefix)[:MAX_RESULTS]]
+
+    if key is not None:
+        hot_prefixes.set(key, results)
+    return results
+
+
+@login_required
+def lookup(request, source):
+    """
+    The objects of a source whose name starts with the prefix in the q parameter.
+
+    Args:
+        request (HttpRequest): the request
+        source (str): the name of a source of SOURCES
+
+    Returns:
+        JsonResponse: the id and text of the objects found
+    """
+    if source not in SOURCES:
+        raise Http404(f'There is no autocomplete for {source}.')
+    results = search(source, request.GET.get('q', ''))
+    return JsonResponse({'results': [{'id': pk, 'text': text} for pk, text in results]})
+
+
+class AutocompleteMixin:
+    """
+    A mixin for the select widgets of a ModelChoiceField that only renders the
+    chosen objects, and lets catalog/autocomplete.js look up the others.
+
+    Args:
+        source (str): the name of the source of SOURCES the objects are looked up in
+    """
+
+    def __init__(self, source, attrs=None):
+        super().__init__(attrs)
+        self.source = source
+
+    class Media:
+        js = ('catalog/autocomplete.js',)
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse('autocomplete', args=[self.source])
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        options = []
+        if not self.is_required and not self.allow_multiple_selected:
+            options.append(self.create_option(name, '', '---------', not any(value), 0))
+
+        field = self.choices.field
+        chosen = [pk for pk in value if pk not in field.empty_values]
+        try:
+            objects = list(self.choices.queryset.filter(pk__in=chosen)) if chosen else []
+        except (ValueError, ValidationError):
+            # the submitted value is not a primary key, the form shows the error
+            objects = []
+        for obj in objects:
+            options.append(self.create_option(
+                name, obj.pk, field.label_from_instance(obj), True, len(options), attrs=attrs,
+            ))
+        return [(None, options, 0)]
+
+
+class AutocompleteSelect(AutocompleteMixin, forms.Select):
+    pass
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, forms.SelectMultiple):
+    pass
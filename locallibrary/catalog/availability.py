@@ -0,0 +1,137 @@
+"""
+Availability counters of the books.
+
+Every Book carries the number of its copies in total and in each loan status,
+and the number of its copies that are overdue (by their stored overdue flag, see
+catalog/overdue.py). The counters are kept up to date
+by the signal receivers in catalog/signals.py: when a copy is created, deleted
+or changes book, status or overdue flag, the counters of the books involved are
+adjusted with F() expressions in the same transaction as the change to the
+copy (see BookInstance.save and BookInstance.delete). The pages and the home
+page statistics then read availability from the books without counting copies.
+
+Changes that bypass the signals, eg bulk_create or QuerySet.update, have to be
+followed by recount_availability, which the recount_availability command runs
+for the whole catalog. It also renders again the cached pages of the books it
+recounts.
+"""
+
+from collections import Counter
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .fragments import invalidate_fragments
+from .models import Book, BookInstance
+
+# the counter of the copies in each loan status
+STATUS_COUNTERS = {
+    'a': 'copies_available',
+    'o': 'copies_on_loan',
+    'r': 'copies_reserved',
+    'm': 'copies_maintenance',
+}
+
+COUNTER_FIELDS = ('copies_total', *STATUS_COUNTERS.values(), 'copies_overdue')
+
+
+def copy_state(book_id, status, overdue):
+    """
+    Args:
+        book_id (int): the book of a copy
+        status (str): the loan status of the copy
+        overdue (bool): the stored overdue status of the copy
+
+    Returns:
+        Counter: the counters of the book the copy adds to, keyed by book and field
+    """
+    state = Counter()
+    if book_id is None:
+        return state
+    state[book_id, 'copies_total'] += 1
+    if status in STATUS_COUNTERS:
+        state[book_id, STATUS_COUNTERS[status]] += 1
+    if overdue:
+        state[book_id, 'copies_overdue'] += 1
+    return state
+
+
+def saved_state(copy, using=None):
+    """
+    Read the state of a copy as it is in the database, locking its row until the
+    end of the transaction so concurrent changes to the copy are counted in order.
+
+    Args:
+        copy (BookInstance): a copy that is about to be saved or deleted
+        using (str): the database alias
+
+    Returns:
+        Counter: the counters the stored copy adds to, empty if it is not stored yet
+    """
+    if copy.pk is None:
+        return Counter()
+    row = (
+        BookInstance.objects.using(using).select_for_update().filter(pk=copy.pk)
+        .values_list('book_id', 'status', 'overdue').first()
+    )
+    return copy_state(*row) if row else Counter()
+
+
+def apply_changes(before, after, using=None):
+    """
+    Adjust the counters of the books from the state of some copies before and
+    after a change.
+
+    Args:
+        before (Counter): the counters the copies added to before the change
+        after (Counter): the counters the copies add to after the change
+        using (str): the database alias
+    """
+    changes = Counter(after)
+    changes.subtract(before)
+
+    updates = {}
+    for (book_id, field), delta in changes.items():
+        if delta:
+            updates.setdefault(book_id, {})[field] = F(field) + delta
+    now = timezone.now()
+    for book_id, values in updates.items():
+        Book.objects.using(using).filter(pk=book_id).update(updated_at=now, **values)
+
+
+def _count_copies(**filters):
+    """
+    Returns:
+        Expression: the number of copies of the outer book matching the filters
+    """
+    copies = BookInstance.objects.filter(book=OuterRef('pk'), **filters)
+    count = copies.order_by().values('book').annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(count, output_field=IntegerField()), 0)
+
+
+def recount_availability(book_ids=None, using=None):
+    """
+    Recount the counters of some books from their copies, in one UPDATE query, and
+    make their detail pages render again.
+
+    Args:
+        book_ids (iterable): the primary keys of the books, every book when None
+        using (str): the database alias
+
+    Returns:
+        int: the number of books recounted
+    """
+    books = Book.objects.using(using)
+    if book_ids is not None:
+        book_ids = list(book_ids)
+        books = books.filter(pk__in=book_ids)
+
+    counters = {'copies_total': _count_copies()}
+    for status, field in STATUS_COUNTERS.items():
+        counters[field] = _count_copies(status=status)
+    counters['copies_overdue'] = _count_copies(overdue=True)
+
+    recounted = books.update(updated_at=timezone.now(), **counters)
+    invalidate_fragments(Book, book_ids)
+    return recounted
@@ -0,0 +1,638 @@
+"""
+Benchmark suite for the catalog app.
+
+The suite seeds the catalog with a synthetic dataset of a configurable size and
+then requests every page in catalog/urls.py a number of times, measuring the
+latency, the number of queries and the peak memory used by each page. The
+results are returned as a plain dictionary that the benchmark_catalog command
+writes out as JSON, so the reports of two commits can be diffed.
+
+run_http_benchmark loads a running server with concurrent requests, to compare
+the same pages served by a WSGI server and by an ASGI server with the async
+views of catalog/async_views.py (see the benchmark_server command).
+
+run_sqlite_benchmark measures the concurrent read and write throughput of a copy
+of the SQLite database, with stock SQLite and with a tuning profile of
+catalog/sqlite.py (see the benchmark_sqlite command).
+
+run_session_benchmark counts the database writes of the home page with the visits
+saved in the session on every visit and with the batched visit counter of
+catalog/visits.py, for every session backend (see the benchmark_sessions command).
+"""
+
+import datetime
+import math
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, reverse
+
+from . import search, sqlite
+from .api import invalidate_api
+from .autocomplete import invalidate_autocomplete
+from .availability import recount_availability
+from .models import Author, Book, BookInstance, Genre, Language
+from .overdue import sweep_overdue
+from . import urls as catalog_urls
+
+# words used to build the synthetic titles and summaries
+WORDS = (
+    'The', 'library', 'river', 'silent', 'garden', 'night', 'empire', 'stone', 'winter',
+    'journey', 'secret', 'city', 'light', 'shadow', 'ocean', 'king', 'house', 'memory',
+)
+
+GENRES = ('Fantasy', 'Science Fiction', 'History', 'Poetry', 'Biography', 'Romance', 'Horror')
+
+LANGUAGES = (('English', 'en'), ('French', 'fr'), ('Spanish', 'es'), ('Swahili', 'sw'))
+
+# name of the user that requests the pages during a benchmark
+BENCHMARK_USERNAME = 'benchmark'
+
+# routes that only accept POST requests, which the benchmark does not send
+POST_ONLY_ROUTES = {'renew-books-librarian', 'api-renewals', 'place-hold', 'cancel-hold'}
+
+# the session backends compared by run_session_benchmark
+SESSION_MODES = ('db', 'cached_db', 'cache', 'signed_cookies')
+
+# the statements that write to the database
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def _chunks(count, size):
+    """
+    Args:
+        count (int): the total number of items
+        size (int): the size of each chunk
+
+    Yields:
+        range: consecutive ranges of at most size items covering range(count)
+    """
+    for start in range(0, count, size):
+        yield range(start, min(start + size, count))
+
+
+def _sentence(rng, length):
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+
+def seed_catalog(authors=100, books=1000, copies=10000, batch_size=5000, seed=0, stdout=None):
+    """
+    Fill the catalog with a synthetic dataset. Rows are inserted with bulk_create in
+    batches, each batch in its own transaction, so seeding millions of rows does not
+    need millions of queries or a huge transaction.
+
+    Args:
+        authors (int): the number of authors to create
+        books (int): the number of books to create, spread over the authors
+        copies (int): the number of book instances to create, spread over the books
+        batch_size (int): the number of rows inserted per query
+        seed (int): the seed of the random generator, the same seed gives the same data
+        stdout (OutputWrapper): where to write progress messages, if anywhere
+
+    Returns:
+        User: the user that owns the borrowed copies and requests the pages
+    """
+    rng = random.Random(seed)
+
+    def progress(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME, defaults={'is_staff': True, 'is_superuser': True})
+    genres = [Genre.objects.get_or_create(name=name)[0] for name in GENRES]
+    languages = [Language.objects.get_or_create(name=name, code=code)[0] for name, code in LANGUAGES]
+
+    for chunk in _chunks(authors, batch_size):
+        with transaction.atomic():
+            Author.objects.bulk_create(
+                [Author(first_name=f'First {number}', last_name=f'Last {number}',
+                        date_of_birth=datetime.date(1900, 1, 1) + datetime.timedelta(days=rng.randrange(36500)))
+                 for number in chunk],
+                batch_size=batch_size,
+            )
+    progress(f'Created {authors} authors')
+
+    author_ids = list(Author.objects.values_list('id', flat=True))
+    # number the isbns after the existing books so seeding twice keeps them unique
+    offset = Book.objects.count()
+    for chunk in _chunks(books, batch_size):
+        with transaction.atomic():
+            created = Book.objects.bulk_create(
+                [Book(title=_sentence(rng, 3).capitalize(), summary=_sentence(rng, 20),
+                      isbn=f'{offset + number:013d}', author_id=rng.choice(author_ids), language=rng.choice(languages))
+                 for number in chunk],
+                batch_size=batch_size,
+            )
+            # bulk_create does not return primary keys on every database, so read
+            # them back by isbn which is unique in the synthetic data
+            book_ids = Book.objects.filter(isbn__in=[book.isbn for book in created]).values_list('id', flat=True)
+            Book.genre.through.objects.bulk_create(
+                [Book.genre.through(book_id=book_id, genre_id=rng.choice(genres).id) for book_id in book_ids],
+                batch_size=batch_size,
+            )
+    progress(f'Created {books} books')
+
+    book_ids = list(Book.objects.values_list('id', flat=True))
+    today = datetime.date.today()
+    for chunk in _chunks(copies, batch_size):
+        instances = []
+        for _ in chunk:
+            status = rng.choice('moar')
+            borrowed = status == 'o'
+            instances.append(BookInstance(
+                id=uuid.UUID(int=rng.getrandbits(128)),
+                book_id=rng.choice(book_ids) if book_ids else None,
+                imprint=_sentence(rng, 2).capitalize(),
+                status=status,
+                borrower=user if borrowed else None,
+                due_back=today + datetime.timedelta(days=rng.randrange(-14, 28)) if borrowed else None,
+            ))
+        with transaction.atomic():
+            BookInstance.objects.bulk_create(instances, batch_size=batch_size)
+    progress(f'Created {copies} copies')
+
+    # bulk_create does not send signals, so index the new books and count their copies in one go
+    search.get_backend().rebuild()
+    progress('Rebuilt the search index')
+    sweep_overdue()
+    recount_availability()
+    progress('Counted the available and overdue copies')
+    invalidate_api(Author, Book, BookInstance, Genre, Language)
+    invalidate_autocomplete(Author, Genre, Language)
+
+    return user
+
+
+def _sample_kwargs():
+    """
+    Returns:
+        dict: an existing primary key for every kind of url parameter in catalog/urls.py
+    """
+    return {
+        'book': Book.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'author': Author.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'bookinstance': BookInstance.objects.order_by('pk').values_list('pk', flat=True).first(),
+    }
+
+
+def catalog_routes():
+    """
+    Build the url of every named route in catalog/urls.py using existing objects for
+    the primary key parameters.
+
+    Returns:
+        list: (route name, url) pairs. Routes whose parameters cannot be filled in
+              because there are no objects are left out.
+    """
+    samples = _sample_kwargs()
+    routes = []
+    for pattern in catalog_urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name or pattern.name in POST_ONLY_ROUTES:
+            continue
+
+        kwargs = {}
+        for name, converter in pattern.pattern.converters.items():
+            # uuid keys belong to book instances, integer keys to books or authors, the api shows
+            # books and the autocomplete looks up authors
+            if name == 'resource':
+                kwargs[name] = 'books'
+            elif name == 'source':
+                kwargs[name] = 'authors'
+            elif converter.__class__.__name__ == 'UUIDConverter':
+                kwargs[name] = samples['bookinstance']
+            elif pattern.name.startswith('author'):
+                kwargs[name] = samples['author']
+            else:
+                kwargs[name] = samples['book']
+
+        if None in kwargs.values():
+            continue
+        routes.append((pattern.name, reverse(pattern.name, kwargs=kwargs)))
+    return routes
+
+
+def _percentile(values, percent):
+    """
+    Args:
+        values (list): the measured values
+        percent (int): the percentile to compute, between 0 and 100
+
+    Returns:
+        float: the value below which percent of the measurements fall
+    """
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def _client_host():
+    """
+    Returns:
+        str: a host name accepted by ALLOWED_HOSTS to send the benchmark requests to.
+             Django always accepts localhost when DEBUG is on and ALLOWED_HOSTS is empty.
+    """
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+def measure_route(client, url, iterations=20, warmup=2):
+    """
+    Request a page several times and measure it.
+
+    Args:
+        client (Client): the logged in test client used for the requests
+        url (str): the url of the page
+        iterations (int): the number of measured requests
+        warmup (int): the number of requests made before measuring
+
+    Returns:
+        dict: the status code, latency percentiles in milliseconds, the number of
+              queries of the last request and the peak memory in KiB, measured by
+              one more request traced on its own
+    """
+    for _ in range(warmup):
+        client.get(url).content
+
+    timings = []
+    queries = 0
+    status_code = None
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = client.get(url)
+            response.content
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = len(context.captured_queries)
+        status_code = response.status_code
+
+    # tracing the allocations slows the request down several times, so the peak
+    # memory is measured by a request of its own, outside of the timed ones
+    tracemalloc.start()
+    try:
+        client.get(url).content
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'url': url,
+        'status': status_code,
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p95_ms': round(_percentile(timings, 95), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': queries,
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+
+
+def run_benchmark(iterations=20, warmup=2, routes=None):
+    """
+    Measure every page of the catalog app with the benchmark user logged in.
+
+    Args:
+        iterations (int): the number of measured requests per page
+        warmup (int): the number of requests made before measuring each page
+        routes (list): the names of the routes to measure, all of them when None
+
+    Returns:
+        dict: the size of the dataset and the measurements of every route
+    """
+    user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME, defaults={'is_staff': True, 'is_superuser': True})
+    client = Client(HTTP_HOST=_client_host())
+    client.force_login(user)
+
+    results = {}
+    for name, url in catalog_routes():
+        if routes and name not in routes:
+            continue
+        results[name] = measure_route(client, url, iterations=iterations, warmup=warmup)
+
+    return {
+        'dataset': {
+            'authors': Author.objects.count(),
+            'books': Book.objects.count(),
+            'copies': BookInstance.objects.count(),
+        },
+        'iterations': iterations,
+        'database': connection.vendor,
+        'routes': results,
+    }
+
+
+def _session_cookie(user):
+    """
+    Log a user in without a request, as the test client's force_login does.
+
+    Args:
+        user (User): the user
+
+    Returns:
+        str: the Cookie header of the session
+    """
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+def run_http_benchmark(base_url, concurrency=20, requests=200, routes=None):
+    """
+    Request every page of the catalog app from a running server, with many
+    requests in flight at once, as the benchmark user. The server must use the
+    same database and sessions as this process, eg run the benchmark next to:
+
+        gunicorn locallibrary.wsgi --threads 20
+        uvicorn locallibrary.asgi:application
+
+    Args:
+        base_url (str): the url of the server, eg http://127.0.0.1:8000
+        concurrency (int): the number of requests in flight at once
+        requests (int): the number of requests per page
+        routes (list): the names of the routes to measure, all of them when None
+
+    Returns:
+        dict: the throughput, latency percentiles and failed requests of every route
+    """
+    user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME, defaults={'is_staff': True, 'is_superuser': True})
+    headers = {'Cookie': _session_cookie(user)}
+
+    def fetch(url):
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        return status, (time.perf_counter() - started) * 1000
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for name, url in catalog_routes():
+            if routes and name not in routes:
+                continue
+            started = time.perf_counter()
+            responses = list(pool.map(fetch, [base_url.rstrip('/') + url] * requests))
+            elapsed = time.perf_counter() - started
+            timings = [timing for _, timing in responses]
+            results[name] = {
+                'url': url,
+                'requests_per_second': round(requests / elapsed, 1),
+                'p50_ms': round(_percentile(timings, 50), 3),
+                'p95_ms': round(_percentile(timings, 95), 3),
+                'failed': sum(status != 200 for status, _ in responses),
+            }
+
+    return {
+        'server': base_url,
+        'concurrency': concurrency,
+        'requests': requests,
+        'routes': results,
+    }
+
+
+def compare_reports(baseline, current, metrics=('p50_ms', 'p95_ms', 'queries', 'peak_memory_kib')):
+    """
+    Compare two benchmark reports route by route.
+
+    Args:
+        baseline (dict): the report of the reference commit
+        current (dict): the report of the commit being measured
+        metrics (tuple): the measurements to compare
+
+    Returns:
+        dict: for every route present in both reports, the baseline value, the
+              current value and the difference of every metric
+    """
+    changes = {}
+    for name, result in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        changes[name] = {
+            metric: {
+                'baseline': before[metric],
+                'current': result[metric],
+                'change': round(result[metric] - before[metric], 3),
+            }
+            for metric in metrics
+        }
+    return changes
+
+
+def _sqlite_workload(path, pragmas, readers, writers, seconds):
+    """
+    Run readers and writers against an SQLite file at the same time.
+
+    Readers load pages of the book list, writers change the due date of random
+    copies, each statement in its own transaction as Django runs them in
+    autocommit mode. Without pragmas every operation opens its own connection,
+    like requests with CONN_MAX_AGE = 0; with pragmas every thread keeps its
+    connection, like persistent connections.
+
+    Args:
+        path (str): the database file
+        pragmas (dict): the pragmas of the profile, empty for stock SQLite
+        readers (int): the number of reading threads
+        writers (int): the number of writing threads
+        seconds (float): how long the threads run
+
+    Returns:
+        dict: the throughput, the p95 latencies and the number of lock errors of the reads and the writes
+    """
+    books = Book._meta.db_table
+    copies = BookInstance._meta.db_table
+    with sqlite3.connect(path) as setup:
+        copy_ids = [row[0] for row in setup.execute(f'SELECT id FROM {copies} LIMIT 1000')]
+        book_count = setup.execute(f'SELECT COUNT(*) FROM {books}').fetchone()[0]
+
+    def read(db, rng):
+        db.execute(
+            f'SELECT id, title, copies_available, copies_total FROM {books} ORDER BY title, id LIMIT 10 OFFSET ?',
+            [rng.randrange(max(book_count, 1))],
+        ).fetchall()
+
+    def write(db, rng):
+        if copy_ids:
+            due_back = datetime.date.today() + datetime.timedelta(days=rng.randrange(28))
+            db.execute(f'UPDATE {copies} SET due_back = ? WHERE id = ?', [due_back.isoformat(), rng.choice(copy_ids)])
+
+    start = threading.Barrier(readers + writers)
+    results = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+
+    def worker(kind, operation, number):
+        rng = random.Random(number)
+        timings, failed = [], 0
+        # isolation_level=None is autocommit, like Django
+        persistent = sqlite3.connect(path, isolation_level=None, check_same_thread=False) if pragmas else None
+        if persistent is not None:
+            sqlite.apply_pragmas(persistent, pragmas)
+        start.wait()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            db = persistent or sqlite3.connect(path, isolation_level=None)
+            try:
+                operation(db, rng)
+                timings.append((time.perf_counter() - started) * 1000)
+            except sqlite3.OperationalError:
+                # 'database is locked' once the busy timeout ran out
+                failed += 1
+            finally:
+                if persistent is None:
+                    db.close()
+        if persistent is not None:
+            persistent.close()
+        with lock:
+            results[kind].extend(timings)
+            errors[kind] += failed
+
+    threads = [threading.Thread(target=worker, args=('read', read, number)) for number in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write', write, readers + number)) for number in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report = {}
+    for kind in ('read', 'write'):
+        timings = results[kind]
+        report[f'{kind}s_per_second'] = round(len(timings) / seconds, 1)
+        report[f'{kind}_p95_ms'] = round(_percentile(timings, 95), 3) if timings else None
+        report[f'{kind}_errors'] = errors[kind]
+    return report
+
+
+def run_sqlite_benchmark(readers=8, writers=2, seconds=5.0, profile='production'):
+    """
+    Compare the concurrent throughput of stock SQLite with a tuning profile, on a
+    copy of the default database so the data is realistic and left untouched.
+
+    Args:
+        readers (int): the number of reading threads
+        writers (int): the number of writing threads
+        seconds (float): how long each configuration runs
+        profile (str): the profile of catalog/sqlite.py to compare with stock SQLite
+
+    Returns:
+        dict: the measurements of both configurations and the speedup of the profile
+
+    Raises:
+        ValueError: if the default database is not SQLite
+    """
+    if connection.vendor != 'sqlite':
+        raise ValueError('The SQLite benchmark needs an SQLite default database.')
+    configurations = {
+        # rollback journal and full syncs, whatever the copied file used
+        'stock': ({'journal_mode': 'DELETE', 'synchronous': 'FULL'}, {}),
+        profile: (sqlite.profile_pragmas(profile), sqlite.profile_pragmas(profile)),
+    }
+
+    connection.ensure_connection()
+    report = {'readers': readers, 'writers': writers, 'seconds': seconds, 'books': Book.objects.count()}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (file_pragmas, pragmas) in configurations.items():
+            path = os.path.join(directory, f'{name}.sqlite3')
+            target = sqlite3.connect(path)
+            try:
+                connection.connection.backup(target)
+                # the journal mode is stored in the file
+                sqlite.apply_pragmas(target, file_pragmas)
+            finally:
+                target.close()
+            report[name] = _sqlite_workload(path, pragmas, readers, writers, seconds)
+
+    report['speedup'] = {
+        kind: round(report[profile][kind] / report['stock'][kind], 2) if report['stock'][kind] else None
+        for kind in ('reads_per_second', 'writes_per_second')
+    }
+    return report
+
+
+def _measure_index_writes(requests):
+    """
+    Request the home page as the benchmark user with the current session settings.
+
+    Args:
+        requests (int): the number of measured requests
+
+    Returns:
+        dict: the database writes and queries per request and the latency percentiles
+    """
+    user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME, defaults={'is_staff': True, 'is_superuser': True})
+    # a new client, so its handler loads the session middleware with the current engine
+    client = Client(HTTP_HOST=_client_host())
+    client.force_login(user)
+    url = reverse('index')
+    try:
+        client.get(url)
+        timings = []
+        writes = queries = 0
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries += len(context.captured_queries)
+            writes += sum(
+                query['sql'].lstrip().upper().startswith(WRITE_STATEMENTS) for query in context.captured_queries
+            )
+    finally:
+        client.logout()
+
+    return {
+        'writes': writes,
+        'writes_per_request': round(writes / requests, 3),
+        'queries_per_request': round(queries / requests, 3),
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p95_ms': round(_percentile(timings, 95), 3),
+    }
+
+
+def run_session_benchmark(requests=100, modes=SESSION_MODES):
+    """
+    Count the database writes of the home page with the visits saved in the session
+    on every visit, as before catalog/visits.py, and with the batched visit counter,
+    for every session backend.
+
+    Args:
+        requests (int): the number of measured requests per configuration
+        modes (iterable): the session backends to measure, as CATALOG_SESSION_MODE values
+
+    Returns:
+        dict: the measurements of every configuration
+    """
+    configurations = {'per-visit': ('db', 0)}
+    interval = getattr(settings, 'CATALOG_VISITS_FLUSH_INTERVAL', 5 * 60) or 5 * 60
+    for mode in modes:
+        configurations[f'batched-{mode}'] = (mode, interval)
+
+    report = {'requests': requests, 'flush_interval': interval}
+    for name, (mode, flush_interval) in configurations.items():
+        with override_settings(
+            SESSION_ENGINE=f'django.contrib.sessions.backends.{mode}',
+            CATALOG_VISITS_FLUSH_INTERVAL=flush_interval,
+        ):
+            report[name] = _measure_index_writes(requests)
+    return report
@@ -0,0 +1,146 @@
+"""
+Helpers for versioned cache entries used by the catalog app.
+
+Rather than deleting every cached value that depends on a model when that model
+changes, cached values are stored under a key that includes a version number.
+Bumping the version makes all the old entries unreachable, and the cache backend
+expires them on its own.
+
+The versions live in the default cache, so every process of the site must share
+it (see CACHES in the settings): a bump made by a management command or by
+another worker has to reach the worker serving the page.
+
+A version bumped inside a transaction is bumped again when the transaction
+commits. Between the two bumps a request of another connection can still read
+the data of before the transaction and cache it under the new version; the
+second bump drops it.
+
+With read replicas, a bump is remembered for CATALOG_PRIMARY_PIN_SECONDS, and a
+request reading the version of the namespace during that time reads the
+database from the primary (see catalog/routers.py), so the new version is not
+filled from a replica that has not seen the change yet.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import pin_seconds, pin_to_primary, read_replicas
+
+
+def _fresh_version():
+    """
+    Returns:
+        int: a version number based on the current time. Starting new versions
+             from the clock means a namespace whose version was evicted from the
+             cache never goes back to a number that was already used.
+    """
+    return int(time.time() * 1000)
+
+
+def version_key(namespace):
+    """
+    Args:
+        namespace (str): the name of the group of cached values, eg 'index-stats'
+
+    Returns:
+        str: the cache key under which the version of the namespace is stored
+    """
+    return f'catalog:version:{namespace}'
+
+
+def bumped_key(namespace):
+    """
+    Args:
+        namespace (str): the name of the group of cached values
+
+    Returns:
+        str: the cache key set for a few seconds after the version of the
+             namespace is bumped
+    """
+    return f'catalog:bumped:{namespace}'
+
+
+def get_version(namespace):
+    """
+    Get the current version of a namespace, creating it if it does not exist yet.
+    The reads of the current request go to the primary if the version was bumped
+    a moment ago.
+
+    Args:
+        namespace (str): the name of the group of cached values
+
+    Returns:
+        int: the current version of the namespace
+    """
+    key = version_key(namespace)
+
+    if read_replicas():
+        values = cache.get_many([key, bumped_key(namespace)])
+        if bumped_key(namespace) in values:
+            pin_to_primary()
+        version = values.get(key)
+    else:
+        version = cache.get(key)
+    if version is None:
+        # add() only sets the value if the key is missing, so two requests racing
+        # to create the version will not reset each other.
+        cache.add(key, _fresh_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """
+    Increase the version of a namespace so that all the values cached under the
+    previous version are no longer used. Inside a transaction, the version is
+    bumped again once it commits.
+
+    Args:
+        namespace (str): the name of the group of cached values
+
+    Returns:
+        int: the new version of the namespace
+    """
+    version = _bump(namespace)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(namespace))
+    return version
+
+
+def _bump(namespace):
+    """
+    Args:
+        namespace (str): the name of the group of cached values
+
+    Returns:
+        int: the new version of the namespace
+    """
+    if read_replicas():
+        cache.set(bumped_key(namespace), True, timeout=pin_seconds())
+    key = version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the key has been evicted (or never existed). Start again from a version
+        # that cannot collide with the one that was lost.
+        version = _fresh_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def versioned_key(namespace, *parts):
+    """
+    Build a cache key for a value that belongs to a versioned namespace.
+
+    Args:
+        namespace (str): the name of the group of cached values
+        parts: any extra values that identify the cached value, eg an object id
+
+    Returns:
+        str: a cache key that changes whenever the namespace version is bumped
+    """
+    suffix = ':'.join(str(part) for part in parts)
+    key = f'catalog:{namespace}:v{get_version(namespace)}'
+    return f'{key}:{suffix}' if suffix else key
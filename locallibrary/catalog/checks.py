@@ -0,0 +1,29 @@
+"""
+System checks of the catalog app, run by `manage.py check`.
+"""
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# the cache backends kept in the memory of one process
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn when the default cache is not shared by the processes of the site. The
+    versions of the cached data live there (see catalog/cache.py), so a change made
+    by one process would not be seen by the others.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Warning(
+        'The default cache is not shared by the processes of the site.',
+        hint='Set CATALOG_CACHE_LOCATION to the memcached servers.',
+        id='catalog.W001',
+    )]
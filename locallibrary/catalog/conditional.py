@@ -0,0 +1,157 @@
+"""
+Conditional GETs of the catalog pages.
+
+The book and author pages send a Last-Modified and an ETag header. A browser
+revisiting a page sends them back (If-Modified-Since, If-None-Match) and, when
+nothing the page shows has changed, gets an empty 304 Not Modified: the page is
+neither loaded from the database nor rendered, one aggregate query answers it.
+
+Last-Modified is the latest updated_at of the objects shown by the page, eg of
+the book, its author and its copies for a book page. Every save sets updated_at
+(auto_now), and the code changing rows with QuerySet.update sets it itself.
+
+The list pages only send an ETag, made of the versions of the models they show
+(see api_namespace in catalog/api.py), which change whenever one of their objects
+is saved or deleted. An aggregate over the objects of a list would read the
+whole table on every visit, while the versions are read from the cache.
+
+The ETag of a detail page also changes when updated_at cannot tell:
+
+- when an object is deleted: it includes the number of objects shown;
+- when the genres or the language of a book change: it includes the version of
+  the cached fragment of the page (see catalog/fragments.py);
+- for another user, or once the CSRF token of the user changes, as the pages show
+  the name of the user and carry a form;
+- for another url, eg another page of a list.
+
+The responses are marked private and no-cache, so browsers check them on every
+visit and shared caches do not keep them.
+"""
+
+import hashlib
+import json
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.generic.detail import SingleObjectMixin
+
+from .api import api_namespace
+from .cache import get_version
+from .fragments import fragment_version
+
+
+class ConditionalGetMixin:
+    """
+    A mixin for the ListViews and DetailViews of the catalog answering conditional
+    GETs with a 304, without loading or rendering the page.
+
+    last_modified_fields lists the updated_at fields of the objects the page shows,
+    as lookups from the model of the view. A DetailView only looks at its object
+    and the objects related to it. A ListView lists the models it shows in
+    version_models instead.
+    """
+    last_modified_fields = ('updated_at',)
+    version_models = ()
+
+    def get(self, request, *args, **kwargs):
+        state = self.get_conditional_state()
+        response = self.get_not_modified(state)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.add_validators(response, state)
+
+    def get_conditional_queryset(self):
+        """
+        Returns:
+            QuerySet: the objects of the model of the view the page shows
+        """
+        queryset = self.model._default_manager.all()
+        if isinstance(self, SingleObjectMixin):
+            queryset = queryset.filter(pk=self.kwargs.get(self.pk_url_kwarg))
+        return queryset
+
+    def get_conditional_state(self):
+        """
+        Look up what the page shows, in a single query. The request is not used,
+        so this can run in another thread than the one loading the user.
+
+        Returns:
+            tuple: the last modification time of the page (None if unknown) and the
+                   rest of the state the ETag is made of, or None if the page does
+                   not exist (eg the book of a detail page)
+        """
+        if self.version_models:
+            versions = sorted((api_namespace(model), get_version(api_namespace(model))) for model in self.version_models)
+            return None, versions
+
+        aggregates = {}
+        for index, field in enumerate(self.last_modified_fields):
+            aggregates[f'modified_{index}'] = Max(field)
+            # the relation the field belongs to, counted to notice deletes
+            relation = field.rpartition('__')[0] or 'pk'
+            aggregates[f'count_{relation}'] = Count(relation, distinct=True)
+        values = self.get_conditional_queryset().aggregate(**aggregates)
+
+        if isinstance(self, SingleObjectMixin) and not values['count_pk']:
+            return None
+        modified = [value for name, value in values.items() if name.startswith('modified_') and value]
+        state = sorted(values.items())
+        if getattr(self, 'fragment_name', None):
+            state.append(('fragment_version', fragment_version(self.model, self.kwargs.get(self.pk_url_kwarg))))
+        return max(modified, default=None), state
+
+    def get_etag(self, state):
+        """
+        Args:
+            state (tuple): the state returned by get_conditional_state
+
+        Returns:
+            str: a strong ETag of the page for the user of the request
+        """
+        request = self.request
+        # the template responses render after the view returns, so the CSRF cookie
+        # of a first visit is created here rather than by the {% csrf_token %} tag
+        get_token(request)
+        user = [request.user.pk, request.META['CSRF_COOKIE']]
+        data = json.dumps([request.get_full_path(), user, state[1]], default=str)
+        return '"%s"' % hashlib.sha1(data.encode()).hexdigest()
+
+    def get_not_modified(self, state):
+        """
+        Args:
+            state (tuple): the state returned by get_conditional_state
+
+        Returns:
+            HttpResponse: a 304 if the client has the current version of the page,
+                          otherwise None
+        """
+        # the messages are shown once, by the next page that is rendered
+        if state is None or len(get_messages(self.request)):
+            return None
+        last_modified, _ = state
+        return get_conditional_response(
+            self.request, etag=self.get_etag(state),
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+
+    def add_validators(self, response, state):
+        """
+        Args:
+            response (HttpResponse): the response of the view
+            state (tuple): the state returned by get_conditional_state
+
+        Returns:
+            HttpResponse: the response, with its Last-Modified and ETag headers
+        """
+        if state is None or response.status_code not in (200, 304):
+            return response
+        last_modified, _ = state
+        response['ETag'] = self.get_etag(state)
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        # the client must check the page before using its copy
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,193 @@
+"""
+Streaming export of the catalog inventory.
+
+An export has one row per copy (BookInstance) joined with its book, the author,
+the language and the genres of the book. Books without copies are exported
+with empty copy columns so the whole catalog is covered.
+
+The rows are read with values_list and iterator(chunk_size=...) so only one
+chunk of rows is in memory at a time, and the genres of each chunk of books
+are fetched with one extra query. The output is produced as a generator of
+text or bytes, so it can be written to a file by the export_catalog command or
+streamed to the client by a StreamingHttpResponse.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+from .models import Book, BookInstance
+
+# columns of an export, in order
+COLUMNS = (
+    'book_id', 'title', 'isbn', 'author', 'language', 'genres',
+    'copy_id', 'imprint', 'status', 'due_back',
+)
+
+FORMATS = ('csv', 'jsonl')
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _genres_of(book_ids):
+    """
+    Args:
+        book_ids (iterable): the primary keys of some books
+
+    Returns:
+        dict: the names of the genres of every book, joined with '; '
+    """
+    genres = {}
+    rows = Book.genre.through.objects.filter(book_id__in=book_ids).values_list('book_id', 'genre__name')
+    for book_id, name in rows.order_by('book_id', 'genre__name'):
+        genres.setdefault(book_id, []).append(name)
+    return {book_id: '; '.join(names) for book_id, names in genres.items()}
+
+
+def _chunked(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _author_name(first_name, last_name):
+    if first_name is None and last_name is None:
+        return ''
+    return f'{last_name}, {first_name}'
+
+
+def iter_inventory(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Walk the inventory of the catalog.
+
+    Args:
+        chunk_size (int): the number of rows read from the database at a time
+
+    Yields:
+        dict: a row of the export keyed by the names in COLUMNS
+    """
+    statuses = dict(BookInstance.LOAN_STATUS)
+    copies = BookInstance.objects.order_by('book_id', 'id').values_list(
+        'book_id', 'book__title', 'book__isbn', 'book__author__first_name', 'book__author__last_name',
+        'book__language__name', 'id', 'imprint', 'status', 'due_back',
+    )
+    for chunk in _chunked(copies.iterator(chunk_size=chunk_size), chunk_size):
+        genres = _genres_of({row[0] for row in chunk})
+        for book_id, title, isbn, first_name, last_name, language, copy_id, imprint, status, due_back in chunk:
+            yield {
+                'book_id': book_id,
+                'title': title,
+                'isbn': isbn,
+                'author': _author_name(first_name, last_name),
+                'language': language or '',
+                'genres': genres.get(book_id, ''),
+                'copy_id': str(copy_id),
+                'imprint': imprint,
+                'status': statuses.get(status, status),
+                'due_back': due_back.isoformat() if due_back else '',
+            }
+
+    # books without any copy
+    books = Book.objects.filter(bookinstance__isnull=True).order_by('id').values_list(
+        'id', 'title', 'isbn', 'author__first_name', 'author__last_name', 'language__name',
+    )
+    for chunk in _chunked(books.iterator(chunk_size=chunk_size), chunk_size):
+        genres = _genres_of({row[0] for row in chunk})
+        for book_id, title, isbn, first_name, last_name, language in chunk:
+            yield {
+                'book_id': book_id,
+                'title': title,
+                'isbn': isbn,
+                'author': _author_name(first_name, last_name),
+                'language': language or '',
+                'genres': genres.get(book_id, ''),
+                'copy_id': '',
+                'imprint': '',
+                'status': '',
+                'due_back': '',
+            }
+
+
+def iter_csv(rows):
+    """
+    Args:
+        rows (iterable): rows of the export
+
+    Yields:
+        str: the header then the rows formatted as CSV lines
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writeheader()
+    yield flush()
+    for row in rows:
+        writer.writerow(row)
+        yield flush()
+
+
+def iter_jsonl(rows):
+    """
+    Args:
+        rows (iterable): rows of the export
+
+    Yields:
+        str: every row as a line of JSON
+    """
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def iter_gzip(chunks, batch_size=64 * 1024):
+    """
+    Compress a stream of text with gzip, a batch at a time.
+
+    Args:
+        chunks (iterable): pieces of text
+        batch_size (int): the number of bytes collected before they are compressed
+
+    Yields:
+        bytes: the gzip stream
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= batch_size:
+            compressed = compressor.compress(b''.join(pending))
+            pending, size = [], 0
+            if compressed:
+                yield compressed
+    yield compressor.compress(b''.join(pending)) + compressor.flush()
+
+
+def export_catalog(export_format='csv', compress=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Args:
+        export_format (str): csv or jsonl
+        compress (bool): whether to compress the output with gzip
+        chunk_size (int): the number of rows read from the database at a time
+
+    Returns:
+        generator: the export as str pieces, or bytes when compressed
+    """
+    if export_format not in FORMATS:
+        raise ValueError(f'Unknown export format {export_format!r}, use one of {", ".join(FORMATS)}.')
+    formatter = iter_csv if export_format == 'csv' else iter_jsonl
+    output = formatter(iter_inventory(chunk_size=chunk_size))
+    return iter_gzip(output) if compress else output
@@ -2,6 +2,8 @@ from django import forms
 import datetime
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
+from .autocomplete import AutocompleteSelect, AutocompleteSelectMultiple
+from .models import Book
 
 class RenewBookForm(forms.Form):
     """
@@ -34,3 +36,18 @@ class RenewBookForm(forms.Form):
         # the cleaned data must always be returned
         return data
 
+
+class BookForm(forms.ModelForm):
+    """
+    The form of BookCreate and BookUpdate. The author, language and genres are picked
+    with autocomplete widgets, so the form does not render every author, language
+    and genre of the catalog (see catalog/autocomplete.py).
+    """
+    class Meta:
+        model = Book
+        fields = '__all__'
+        widgets = {
+            'author': AutocompleteSelect('authors'),
+            'language': AutocompleteSelect('languages'),
+            'genre': AutocompleteSelectMultiple('genres'),
+        }
@@ -0,0 +1,118 @@
+"""
+Per-object cached rendering of the detail pages.
+
+The content of a detail page is rendered inside a {% cache %} block whose key
+includes a version number of the object it shows (see catalog/cache.py). The
+signal receivers in catalog/signals.py bump the version of a book when the
+book, one of its copies, its genres, its author or its language changes, and
+the version of an author when the author or one of their books changes. A
+repeat visit to an unchanged page is then served from the cache, and the view
+skips loading the relations the cached fragment already contains.
+"""
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+
+from .cache import bump_version, get_version
+
+
+def fragment_timeout():
+    """
+    Returns:
+        int: how long the rendered fragments are kept, in seconds. 0 disables the cache.
+    """
+    return getattr(settings, 'CATALOG_DETAIL_CACHE_TIMEOUT', 60 * 60)
+
+
+def fragment_cache():
+    """
+    Returns:
+        the cache used by the {% cache %} template tag
+    """
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def fragment_namespace(model, pk):
+    """
+    Args:
+        model (Model): the model of the object shown by the page
+        pk: the primary key of the object
+
+    Returns:
+        str: the name of the version of the object's fragments
+    """
+    return f'fragment:{model._meta.model_name}:{pk}'
+
+
+def fragment_version(model, pk):
+    """
+    Args:
+        model (Model): the model of the object shown by the page
+        pk: the primary key of the object
+
+    Returns:
+        str: the version of the object's fragments, which changes when the object
+             or every object of the model is invalidated
+    """
+    return f'{get_version(fragment_namespace(model, "all"))}.{get_version(fragment_namespace(model, pk))}'
+
+
+def invalidate_fragments(model, pks=None):
+    """
+    Make the detail pages of some objects render again on the next visit.
+
+    Args:
+        model (Model): the model of the objects
+        pks (iterable): the primary keys of the objects, every object of the model
+                        when None
+    """
+    if pks is None:
+        bump_version(fragment_namespace(model, 'all'))
+        return
+    for pk in set(pks):
+        if pk is not None:
+            bump_version(fragment_namespace(model, pk))
+
+
+class FragmentCacheMixin:
+    """
+    A mixin for DetailViews whose template caches its content with:
+
+        {% cache fragment_timeout <fragment_name> object.pk fragment_version %}
+
+    where <fragment_name> is written out, as the cache tag does not resolve it.
+
+    When the fragment is in the cache the object is loaded with fragment_queryset,
+    which only needs what the rest of the page uses, instead of the full queryset.
+    """
+    fragment_name = None
+    fragment_queryset = None
+
+    def get(self, request, *args, **kwargs):
+        self.fragment_version, self.fragment_cached = self.get_fragment_state()
+        return super().get(request, *args, **kwargs)
+
+    def get_fragment_state(self):
+        """
+        Returns:
+            tuple: the version of the fragment of the object and whether it is cached
+        """
+        pk = self.kwargs.get(self.pk_url_kwarg)
+        version = fragment_version(self.model, pk)
+        key = make_template_fragment_key(self.fragment_name, [pk, version])
+        return version, fragment_timeout() != 0 and fragment_cache().get(key) is not None
+
+    def get_queryset(self):
+        if self.fragment_cached and self.fragment_queryset is not None:
+            return self.fragment_queryset.all()
+        return super().get_queryset()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['fragment_version'] = self.fragment_version
+        context['fragment_timeout'] = fragment_timeout()
+        return context
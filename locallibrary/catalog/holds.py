@@ -0,0 +1,215 @@
+"""
+The hold queues of the books.
+
+A user who cannot borrow a book places a hold on it. The waiting holds of a book
+are served first come, first served: whenever copies of the book become
+available (a copy is returned, a reservation is cancelled or expires, a copy is
+saved as available, see catalog/signals.py) they are reserved for the oldest
+waiting holds, and the holds become ready. A ready hold is fulfilled when its
+user borrows the reserved copy (see loans.checkout), or expires after
+loans.RESERVATION_PERIOD and the copy goes to the next hold.
+
+The queue is the partial index hold_queue_idx on the waiting holds of each book,
+so the next holds are found with an index range scan whatever the length of the
+queue, and the copies returned at once are allocated with one query per table.
+"""
+
+import datetime
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from . import loans
+from .models import Book, BookInstance, Hold
+
+
+class HoldError(Exception):
+    """Raised when a hold cannot be placed or cancelled."""
+
+
+class _Conflict(Exception):
+    """Raised when another transaction changed the copies or holds being allocated."""
+
+
+def _allocate(book_id, until):
+    """
+    Reserve the available copies of a book for its oldest waiting holds.
+
+    Args:
+        book_id (int): the primary key of the book
+        until (date): the end of the reservations
+
+    Returns:
+        list: the holds that became ready
+
+    Raises:
+        _Conflict: if another transaction took one of the copies or holds
+    """
+    # the counter tells how many holds can be served without counting the copies
+    available = Book.objects.filter(pk=book_id).values_list('copies_available', flat=True).first()
+    if not available:
+        return []
+    holds = list(
+        Hold.objects.select_for_update(skip_locked=True).filter(book_id=book_id, status='w')
+        .order_by('pk').only('pk', 'user_id')[:available]
+    )
+    if not holds:
+        return []
+    copies = list(
+        BookInstance.objects.select_for_update(skip_locked=True).filter(book_id=book_id, status='a')
+        .order_by().only('pk', 'book_id', 'status', 'overdue')[:len(holds)]
+    )
+    pairs = list(zip(copies, holds))
+    if not pairs:
+        return []
+
+    copy_ids = [copy.pk for copy, _ in pairs]
+    reserved = BookInstance.objects.filter(pk__in=copy_ids, status='a').update(
+        status='r', due_back=until, overdue=False, days_overdue=0, updated_at=timezone.now(),
+        borrower=Case(
+            *[When(pk=copy.pk, then=Value(hold.user_id)) for copy, hold in pairs],
+            output_field=models.IntegerField(),
+        ),
+    )
+    ready = Hold.objects.filter(pk__in=[hold.pk for _, hold in pairs], status='w').update(
+        status='r', ready_at=timezone.now(),
+        copy=Case(
+            *[When(pk=hold.pk, then=Value(copy.pk)) for copy, hold in pairs],
+            output_field=models.UUIDField(),
+        ),
+    )
+    if reserved != len(pairs) or ready != len(pairs):
+        raise _Conflict()
+
+    loans.record_changes([copy for copy, _ in pairs], 'r')
+    return [hold for _, hold in pairs]
+
+
+def allocate_holds(books, until=None):
+    """
+    Reserve the available copies of some books for their oldest waiting holds.
+
+    Args:
+        books (iterable): the books or their primary keys
+        until (date): the end of the reservations, in loans.RESERVATION_PERIOD by default
+
+    Returns:
+        list: the primary keys of the holds that became ready
+    """
+    until = until or datetime.date.today() + loans.RESERVATION_PERIOD
+    ready = []
+    for book_id in sorted({getattr(book, 'pk', book) for book in books}):
+        for _ in range(loans.MAX_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    ready.extend(hold.pk for hold in _allocate(book_id, until))
+                break
+            except _Conflict:
+                continue
+    return ready
+
+
+def place_hold(book, user):
+    """
+    Put a user in the queue of a book. The hold is ready at once if a copy is
+    available and nobody is waiting before the user.
+
+    Args:
+        book (Book or int): the book or its primary key
+        user (User): the user who wants the book
+
+    Returns:
+        Hold: the hold
+
+    Raises:
+        HoldError: if the user already has a waiting or ready hold on the book
+    """
+    book_id = getattr(book, 'pk', book)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                hold = Hold.objects.create(book_id=book_id, user=user)
+        except IntegrityError:
+            raise HoldError('You already have a hold on this book.')
+        allocate_holds([book_id])
+    hold.refresh_from_db()
+    return hold
+
+
+def _release(holds, status):
+    """
+    End some holds and make the copies reserved for the ready ones available to
+    the next holds.
+
+    Args:
+        holds (list): the holds, locked, with their book_id, status and copy_id
+        status (str): the new status of the holds
+    """
+    Hold.objects.filter(pk__in=[hold.pk for hold in holds]).update(status=status)
+    copy_ids = [hold.copy_id for hold in holds if hold.status == 'r' and hold.copy_id]
+    if copy_ids:
+        copies = list(
+            BookInstance.objects.select_for_update().filter(pk__in=copy_ids, status='r')
+            .only('pk', 'book_id', 'status', 'overdue')
+        )
+        BookInstance.objects.filter(pk__in=[copy.pk for copy in copies], status='r').update(
+            status='a', borrower=None, due_back=None, overdue=False, days_overdue=0, updated_at=timezone.now(),
+        )
+        loans.record_changes(copies, 'a')
+        allocate_holds({copy.book_id for copy in copies})
+
+
+def cancel_hold(hold, user=None):
+    """
+    Take a hold out of the queue. The copy reserved for a ready hold goes to the
+    next hold.
+
+    Args:
+        hold (Hold or int): the hold or its primary key
+        user (User): the user cancelling the hold, who must own it if given
+
+    Raises:
+        HoldError: if the hold is not waiting or ready, or belongs to another user
+    """
+    hold_id = getattr(hold, 'pk', hold)
+    with transaction.atomic():
+        hold = Hold.objects.select_for_update().filter(pk=hold_id).first()
+        if hold is None or (user is not None and hold.user_id != user.pk):
+            raise HoldError('There is no such hold.')
+        if hold.status not in ('w', 'r'):
+            raise HoldError('The hold is not waiting or ready.')
+        _release([hold], 'c')
+
+
+def expire_holds(today=None):
+    """
+    End the ready holds whose copy was not borrowed before the end of its
+    reservation, and give the copies to the next holds.
+
+    Args:
+        today (date): the date of the check, today by default
+
+    Returns:
+        int: the number of holds expired
+    """
+    today = today or datetime.date.today()
+    with transaction.atomic():
+        expired = list(
+            Hold.objects.select_for_update(of=('self',)).filter(status='r', copy__due_back__lt=today)
+            .only('pk', 'book_id', 'status', 'copy_id')
+        )
+        if expired:
+            _release(expired, 'e')
+    return len(expired)
+
+
+def queue_position(hold):
+    """
+    Args:
+        hold (Hold): a waiting hold
+
+    Returns:
+        int: the position of the hold in the queue of its book, starting at 1
+    """
+    return Hold.objects.filter(book_id=hold.book_id, status='w', pk__lte=hold.pk).count()
@@ -0,0 +1,415 @@
+"""
+Bulk import of books, authors, genres, languages and copies into the catalog.
+
+An import reads a feed file one record at a time and writes the records in
+chunks. Every chunk is written in its own transaction with a handful of
+bulk_create queries, whatever the number of records in it:
+
+    * authors, genres and languages are looked up in maps held in memory and
+      only the ones that are not in the catalog yet are created
+    * books are matched on their isbn, so importing a feed twice does not
+      duplicate them
+    * copies get an id derived from the feed and the position of the record, so
+      a chunk that is imported again after a failure is skipped
+
+After each chunk the number of records done is saved in a state file next to the
+feed, which lets an interrupted import resume where it stopped.
+
+Three feed formats are supported, all describing one book per record:
+
+    * csv: a header row with the columns title, author (or first_name and
+      last_name), summary, isbn, genres, language, language_code, copies,
+      imprint and status. Genres are separated by ';' or '|'.
+    * jsonl: one JSON object per line with the same keys. genres may be a list.
+    * marc: a simplified MARC record per block of lines, separated by a blank
+      line. Each line is a tag followed by its value: 020 isbn, 041 language
+      code, 100 author ('Last, First'), 245 title, 520 summary, 546 language,
+      650 genre (repeatable) and 852 the imprint of a copy (repeatable).
+"""
+
+import csv
+import json
+import os
+import re
+import time
+import uuid
+from itertools import islice
+
+from django.db import transaction
+
+from . import search
+from .api import invalidate_api
+from .autocomplete import invalidate_autocomplete
+from .availability import recount_availability
+from .fragments import invalidate_fragments
+from .models import Author, Book, BookInstance, Genre, Language
+from .stats import invalidate_index_statistics
+
+# namespace of the ids of the imported copies, see _copy_id
+COPY_NAMESPACE = uuid.UUID('0f8c6a8e-6d0b-4d55-8d3e-5c2e0a7f4b11')
+
+MARC_TAGS = {
+    '020': 'isbn',
+    '041': 'language_code',
+    '100': 'author',
+    '245': 'title',
+    '520': 'summary',
+    '546': 'language',
+}
+
+
+class CatalogImportError(Exception):
+    """Raised when a feed cannot be read or contains an invalid record."""
+
+
+def _text(value):
+    """
+    Returns:
+        str: a raw value as stripped text. The values of a JSON feed can be numbers.
+    """
+    return '' if value is None else str(value).strip()
+
+
+def _split_genres(value):
+    if isinstance(value, (list, tuple)):
+        return [_text(name) for name in value if _text(name)]
+    return [name.strip() for name in re.split(r'[;|]', _text(value)) if name.strip()]
+
+
+def _split_author(record):
+    """
+    Returns:
+        tuple: the first and last name of the author of a record, or None
+    """
+    first_name = _text(record.get('first_name'))
+    last_name = _text(record.get('last_name'))
+    author = _text(record.get('author'))
+    if not (first_name or last_name) and author:
+        if ',' in author:
+            last_name, _, first_name = author.partition(',')
+        else:
+            first_name, _, last_name = author.rpartition(' ')
+    first_name, last_name = first_name.strip(), last_name.strip()
+    return (first_name, last_name) if first_name or last_name else None
+
+
+def normalise(record):
+    """
+    Turn a record read from a feed into the values the importer writes.
+
+    Args:
+        record (dict): the raw values of a record
+
+    Returns:
+        dict: the title, summary, isbn, author, genres, language and copies of the book
+
+    Raises:
+        CatalogImportError: if the record is not an object, has no title or isbn, or
+            has an invalid copy
+    """
+    if not isinstance(record, dict):
+        raise CatalogImportError(f'A record must be an object: {record!r}')
+    title = _text(record.get('title'))
+    isbn = _text(record.get('isbn')).replace('-', '')
+    if not title or not isbn:
+        raise CatalogImportError(f'A record needs a title and an isbn: {record!r}')
+
+    imprints = record.get('imprints')
+    if imprints is None:
+        try:
+            copies = int(record.get('copies') or 0)
+        except (TypeError, ValueError):
+            raise CatalogImportError(f'Invalid number of copies {record.get("copies")!r} for isbn {isbn}')
+        imprints = [_text(record.get('imprint'))] * copies
+    elif isinstance(imprints, (list, tuple)):
+        imprints = [_text(imprint) for imprint in imprints]
+    else:
+        raise CatalogImportError(f'The imprints of isbn {isbn} must be a list: {imprints!r}')
+
+    status = _text(record.get('status')) or 'a'
+    if status not in dict(BookInstance.LOAN_STATUS):
+        raise CatalogImportError(f'Unknown copy status {status!r} for isbn {isbn}')
+
+    language = _text(record.get('language'))
+    return {
+        'title': title[:200],
+        'summary': _text(record.get('summary'))[:1000],
+        'isbn': isbn[:13],
+        'author': _split_author(record),
+        'genres': _split_genres(record.get('genres')),
+        'language': (language[:50], _text(record.get('language_code'))[:2] or None) if language else None,
+        'imprints': imprints,
+        'status': status,
+    }
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as feed:
+        yield from csv.DictReader(feed)
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as feed:
+        for number, line in enumerate(feed, start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as error:
+                    raise CatalogImportError(f'Line {number} of {path} is not valid JSON: {error}')
+
+
+def read_marc(path):
+    def finish(record, genres, imprints):
+        record['genres'] = genres
+        record['imprints'] = imprints
+        return record
+
+    record, genres, imprints = {}, [], []
+    with open(path, encoding='utf-8') as feed:
+        for line in feed:
+            line = line.strip()
+            if not line:
+                if record:
+                    yield finish(record, genres, imprints)
+                record, genres, imprints = {}, [], []
+                continue
+
+            tag, _, value = line.partition(' ')
+            value = value.strip()
+            if tag == '650':
+                genres.append(value)
+            elif tag == '852':
+                imprints.append(value)
+            elif tag in MARC_TAGS:
+                record[MARC_TAGS[tag]] = value
+    if record:
+        yield finish(record, genres, imprints)
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+    'marc': read_marc,
+}
+
+
+def detect_format(path):
+    """
+    Args:
+        path (str): the path of a feed file
+
+    Returns:
+        str: the format of the feed, guessed from its extension
+    """
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return {'json': 'jsonl', 'ndjson': 'jsonl', 'mrc': 'marc', 'txt': 'marc'}.get(extension, extension)
+
+
+class CatalogImporter:
+    """
+    Imports feed files into the catalog in chunks.
+
+    Args:
+        chunk_size (int): the number of records written per transaction
+        stdout (OutputWrapper): where to write progress messages, if anywhere
+    """
+
+    def __init__(self, chunk_size=1000, stdout=None):
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+        self.authors = {}
+        self.genres = {}
+        self.languages = {}
+        self.books = {}
+        self.counts = {'records': 0, 'books': 0, 'authors': 0, 'genres': 0, 'languages': 0, 'copies': 0}
+
+    def _progress(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def load_lookups(self):
+        """
+        Load the existing authors, genres and languages in memory so that they are
+        not created again.
+        """
+        self.authors = {(first, last): pk for pk, first, last
+                        in Author.objects.values_list('pk', 'first_name', 'last_name').iterator()}
+        self.genres = {name: pk for pk, name in Genre.objects.values_list('pk', 'name')}
+        self.languages = {name: pk for pk, name in Language.objects.values_list('pk', 'name')}
+
+    def _create_missing(self, lookup, keys, build, key_of, fetch):
+        """
+        Create the objects whose keys are not in a lookup map and add them to it.
+
+        Args:
+            lookup (dict): maps the key of every known object to its primary key
+            keys (iterable): the keys needed by the chunk
+            build (callable): makes an unsaved object from a key
+            key_of (callable): the key of an object
+            fetch (callable): returns a queryset containing the objects with the given keys
+
+        Returns:
+            int: the number of objects created
+        """
+        missing = list(dict.fromkeys(key for key in keys if key not in lookup))
+        if not missing:
+            return 0
+        objects = [build(key) for key in missing]
+        objects[0].__class__.objects.bulk_create(objects, batch_size=self.chunk_size)
+
+        # bulk_create does not return primary keys on every database, so read the
+        # new rows back by their keys when they are missing
+        if any(obj.pk is None for obj in objects):
+            objects = fetch(missing)
+        for obj in objects:
+            if key_of(obj) in missing:
+                lookup.setdefault(key_of(obj), obj.pk)
+        return len(missing)
+
+    def _copy_id(self, source, position, copy_number):
+        """
+        Returns:
+            UUID: the same id every time the same copy of the same record is imported
+        """
+        return uuid.uuid5(COPY_NAMESPACE, f'{source}:{position}:{copy_number}')
+
+    def import_chunk(self, records, source, start):
+        """
+        Write a chunk of normalised records in one transaction.
+
+        Args:
+            records (list): the records of the chunk, see normalise
+            source (str): the name of the feed, used for the ids of the copies
+            start (int): the position of the first record of the chunk in the feed
+
+        Returns:
+            list: the primary keys of the books created by the chunk
+        """
+        with transaction.atomic():
+            self.counts['authors'] += self._create_missing(
+                self.authors, [record['author'] for record in records if record['author']],
+                build=lambda key: Author(first_name=key[0], last_name=key[1]),
+                key_of=lambda author: (author.first_name, author.last_name),
+                fetch=lambda keys: Author.objects.filter(
+                    first_name__in={key[0] for key in keys}, last_name__in={key[1] for key in keys}
+                ),
+            )
+            self.counts['genres'] += self._create_missing(
+                self.genres, [name for record in records for name in record['genres']],
+                build=lambda name: Genre(name=name),
+                key_of=lambda genre: genre.name,
+                fetch=lambda names: Genre.objects.filter(name__in=names),
+            )
+            languages = {record['language'][0]: record['language'][1] for record in records if record['language']}
+            self.counts['languages'] += self._create_missing(
+                self.languages, languages,
+                build=lambda name: Language(name=name, code=languages[name]),
+                key_of=lambda language: language.name,
+                fetch=lambda names: Language.objects.filter(name__in=names),
+            )
+
+            # books already in the catalog (or earlier in the feed) are not created again
+            isbns = {record['isbn'] for record in records} - set(self.books)
+            self.books.update(Book.objects.filter(isbn__in=isbns).values_list('isbn', 'pk'))
+            new_books = {}
+            for record in records:
+                if record['isbn'] not in self.books and record['isbn'] not in new_books:
+                    new_books[record['isbn']] = record
+            Book.objects.bulk_create([
+                Book(
+                    title=record['title'],
+                    summary=record['summary'],
+                    isbn=isbn,
+                    author_id=self.authors.get(record['author']),
+                    language_id=self.languages.get(record['language'][0]) if record['language'] else None,
+                )
+                for isbn, record in new_books.items()
+            ], batch_size=self.chunk_size)
+            created = dict(Book.objects.filter(isbn__in=new_books).values_list('isbn', 'pk'))
+            self.books.update(created)
+            self.counts['books'] += len(created)
+
+            Book.genre.through.objects.bulk_create([
+                Book.genre.through(book_id=created[isbn], genre_id=self.genres[name])
+                for isbn, record in new_books.items()
+                for name in dict.fromkeys(record['genres'])
+            ], batch_size=self.chunk_size)
+
+            copies = [
+                BookInstance(
+                    id=self._copy_id(source, start + offset, number),
+                    book_id=self.books[record['isbn']],
+                    imprint=imprint[:200],
+                    status=record['status'],
+                )
+                for offset, record in enumerate(records)
+                for number, imprint in enumerate(record['imprints'])
+            ]
+            # copies written by an earlier, interrupted run of the same chunk are skipped,
+            # and not counted again
+            written = set(
+                BookInstance.objects.filter(pk__in=[copy.id for copy in copies]).values_list('pk', flat=True)
+            )
+            new_copies = [copy for copy in copies if copy.id not in written]
+            BookInstance.objects.bulk_create(new_copies, batch_size=self.chunk_size, ignore_conflicts=True)
+            self.counts['copies'] += len(new_copies)
+
+            # bulk_create does not send signals, so count the copies of the books in one go,
+            # which renders their pages again, and render again the pages of the authors
+            # that got books
+            recount_availability({copy.book_id for copy in copies})
+            invalidate_fragments(Author, {self.authors.get(record['author']) for record in new_books.values()})
+            search.index_books(created.values())
+        return list(created.values())
+
+    def run(self, path, feed_format=None, resume=False, state_path=None):
+        """
+        Import a feed file.
+
+        Args:
+            path (str): the path of the feed
+            feed_format (str): csv, jsonl or marc. Guessed from the extension when None.
+            resume (bool): whether to skip the records imported by a previous run
+            state_path (str): where to save the progress, next to the feed by default
+
+        Returns:
+            dict: the number of records read and of objects created
+        """
+        feed_format = feed_format or detect_format(path)
+        if feed_format not in READERS:
+            raise CatalogImportError(f'Unknown feed format {feed_format!r}, use one of {", ".join(READERS)}.')
+        state_path = state_path or f'{path}.import-state'
+        source = os.path.basename(path)
+
+        done = 0
+        if resume and os.path.exists(state_path):
+            with open(state_path) as state_file:
+                done = json.load(state_file)['records']
+            self._progress(f'Resuming after {done} records')
+
+        self.load_lookups()
+        records = islice(READERS[feed_format](path), done, None)
+        started = time.monotonic()
+        position = done
+        while True:
+            chunk = [normalise(record) for record in islice(records, self.chunk_size)]
+            if not chunk:
+                break
+            self.import_chunk(chunk, source, position)
+            position += len(chunk)
+            self.counts['records'] += len(chunk)
+
+            with open(state_path, 'w') as state_file:
+                json.dump({'records': position}, state_file)
+
+            elapsed = time.monotonic() - started
+            self._progress(f'{position} records imported ({self.counts["records"] / max(elapsed, 1e-9):.0f} rows/s)')
+
+        invalidate_index_statistics()
+        invalidate_api(Author, Book, BookInstance, Genre, Language)
+        invalidate_autocomplete(Author, Genre, Language)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+        self.counts['seconds'] = round(time.monotonic() - started, 3)
+        return self.counts
@@ -0,0 +1,127 @@
+"""
+Load test of the loan service (catalog/loans.py).
+
+Many workers, each in its own thread with its own database connection, try to
+borrow a copy of the same book at the same moment. The test passes when no copy
+is lent twice, every available copy is lent exactly once and the availability
+counters of the book match its copies. Run it against the production database
+engine, eg:
+
+    python manage.py loadtest_loans --workers 200 --copies 50
+
+Databases report lock conflicts between concurrent transactions as errors (eg
+'database is locked' on SQLite, serialization failures on PostgreSQL), which the
+workers handle the way a web request should: by retrying the whole transaction.
+"""
+
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+
+from . import loans
+from .availability import recount_availability
+from .models import Book, BookInstance
+
+# prefix of the usernames of the workers
+WORKER_PREFIX = 'loadtest-'
+
+
+def _retry(operation, timeout=60):
+    """
+    Run an operation, retrying it with a random exponential backoff when the
+    database reports a lock conflict.
+
+    Args:
+        operation (callable): the operation, run in its own transaction
+        timeout (float): how many seconds to keep trying before giving up
+
+    Returns:
+        the result of the operation
+    """
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        try:
+            return operation()
+        except OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            attempt += 1
+            time.sleep(random.uniform(0, 0.001 * 2 ** min(attempt, 10)))
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def run_checkout_load_test(workers=100, copies=50):
+    """
+    Args:
+        workers (int): the number of concurrent borrowers
+        copies (int): the number of available copies of the book they all want
+
+    Returns:
+        dict: the number of checkouts, of copies lent twice, of workers that found no
+              copy, the throughput and latencies, and whether the counters are right
+    """
+    run = uuid.uuid4().hex[:8]
+    book = Book.objects.create(title=f'Load test {run}', summary='Load test', isbn=run)
+    BookInstance.objects.bulk_create([
+        BookInstance(book=book, imprint='Load test', status='a') for _ in range(copies)
+    ])
+    recount_availability([book.pk])
+    User.objects.bulk_create([User(username=f'{WORKER_PREFIX}{run}-{number}') for number in range(workers)])
+    users = list(User.objects.filter(username__startswith=f'{WORKER_PREFIX}{run}-'))
+
+    start = threading.Barrier(workers)
+
+    def borrow(user):
+        start.wait()
+        started = time.perf_counter()
+        try:
+            copy = _retry(lambda: loans.checkout(book, user))
+            return copy.pk, time.perf_counter() - started
+        except loans.NoCopyAvailable:
+            return None, time.perf_counter() - started
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(borrow, users))
+    elapsed = time.perf_counter() - started
+
+    lent = [copy_id for copy_id, _ in results if copy_id is not None]
+    latencies = [latency * 1000 for _, latency in results]
+    book.refresh_from_db()
+    on_loan = BookInstance.objects.filter(book=book, status='o')
+    report = {
+        'workers': workers,
+        'copies': copies,
+        'checkouts': len(lent),
+        'double_lent': len(lent) - len(set(lent)),
+        'unavailable': len(results) - len(lent),
+        'seconds': round(elapsed, 3),
+        'checkouts_per_second': round(len(lent) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(_percentile(latencies, 50), 3),
+        'p95_ms': round(_percentile(latencies, 95), 3),
+        'counters_match': (
+            book.copies_on_loan == on_loan.count() == len(lent)
+            and book.copies_available == copies - len(lent)
+        ),
+        'borrowers_match': on_loan.values('borrower').distinct().count() == len(lent),
+    }
+
+    # remove the data of the run
+    BookInstance.objects.filter(book=book).delete()
+    book.delete()
+    User.objects.filter(username__startswith=f'{WORKER_PREFIX}{run}-').delete()
+    return report
@@ -0,0 +1,229 @@
+"""
+Checkout, return and reservation of copies.
+
+Every operation runs in one transaction and changes the copy with a conditional
+UPDATE (WHERE status = <expected status>), so a copy can never be lent twice:
+
+- checkout and reserve pick a copy of the book with
+  SELECT ... FOR UPDATE SKIP LOCKED. Concurrent requests for the same book each
+  lock a different copy instead of queueing behind the first one, which keeps
+  throughput up when a popular book is requested by many users at once.
+- return_copies locks the copies it returns, then reserves them for the waiting
+  holds on their books (see catalog/holds.py).
+
+On databases without row locks (SQLite) the FOR UPDATE clause is left out and
+the conditional UPDATE alone rejects a copy changed by another transaction; the
+operation then tries the next copy.
+
+The changes are written with QuerySet.update, which does not send signals, so
+the availability counters, the cached book page and the home page statistics
+are updated here (see catalog/signals.py for the same on save).
+"""
+
+import datetime
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import availability, holds
+from .api import invalidate_api
+from .fragments import invalidate_fragments
+from .models import Book, BookInstance, Hold
+from .stats import invalidate_index_statistics
+
+# how long a copy is lent for
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+# how long a reserved copy is kept for its borrower
+RESERVATION_PERIOD = datetime.timedelta(days=3)
+
+# how many copies checkout and reserve try when another transaction takes the copy they picked
+MAX_ATTEMPTS = 5
+
+
+class LoanError(Exception):
+    """Raised when a loan operation cannot be done."""
+
+
+class NoCopyAvailable(LoanError):
+    """Raised when a book has no copy that can be lent or reserved."""
+
+
+class InvalidLoanState(LoanError):
+    """Raised when a copy is not in the state the operation needs, eg returning a copy that is not on loan."""
+
+
+def record_changes(copies, status):
+    """
+    Update what depends on some copies after their status was changed with
+    QuerySet.update: the availability counters of their books, the cached pages of
+    the books, the API ETags and the home page statistics. A copy whose status changes is no
+    longer overdue.
+
+    Args:
+        copies (iterable): the copies, as they were before the change
+        status (str): the new status of the copies
+    """
+    before, after = Counter(), Counter()
+    for copy in copies:
+        before.update(availability.copy_state(copy.book_id, copy.status, copy.overdue))
+        after.update(availability.copy_state(copy.book_id, status, False))
+    if not before:
+        return
+    availability.apply_changes(before, after)
+    invalidate_fragments(Book, {book_id for book_id, _ in before})
+    invalidate_api(BookInstance, Book)
+    invalidate_index_statistics()
+
+
+def _change_copy(copy, **changes):
+    """
+    Change a copy if it is still in the status it was read with, and update what
+    depends on the copy.
+
+    Args:
+        copy (BookInstance): the copy, with its book_id, status and overdue fields
+        changes: the new values of the fields of the copy, including its status
+
+    Returns:
+        bool: whether the copy was changed
+    """
+    changed = BookInstance.objects.filter(pk=copy.pk, status=copy.status).update(
+        overdue=False, days_overdue=0, updated_at=timezone.now(), **changes
+    )
+    if changed:
+        record_changes([copy], changes['status'])
+    return bool(changed)
+
+
+def _take_copy(candidates, status, **changes):
+    """
+    Lock one of the candidate copies and change it, trying the next copy when
+    another transaction took it first.
+
+    Args:
+        candidates (QuerySet): the copies that can be taken
+        status (str): the new status of the copy
+        changes: the other new values of the fields of the copy
+
+    Returns:
+        BookInstance: the copy, as it was changed
+
+    Raises:
+        NoCopyAvailable: if there is no candidate copy left
+    """
+    candidates = candidates.select_for_update(skip_locked=True).only('pk', 'book_id', 'status', 'overdue')
+    for _ in range(MAX_ATTEMPTS):
+        copy = candidates.first()
+        if copy is None:
+            break
+        if _change_copy(copy, status=status, **changes):
+            return BookInstance.objects.select_related('book', 'borrower').get(pk=copy.pk)
+        candidates = candidates.exclude(pk=copy.pk)
+    raise NoCopyAvailable('There is no copy of this book available.')
+
+
+def checkout(book, borrower, due_back=None):
+    """
+    Lend a copy of a book. A copy reserved for the borrower is lent first, then any
+    available copy.
+
+    Args:
+        book (Book or int): the book or its primary key
+        borrower (User): the user who borrows the copy
+        due_back (date): when the copy must be returned, in LOAN_PERIOD by default
+
+    Returns:
+        BookInstance: the copy lent
+
+    Raises:
+        NoCopyAvailable: if no copy of the book is reserved for the borrower or available
+    """
+    book_id = getattr(book, 'pk', book)
+    due_back = due_back or datetime.date.today() + LOAN_PERIOD
+    copies = BookInstance.objects.filter(book_id=book_id).order_by()
+    with transaction.atomic():
+        try:
+            copy = _take_copy(copies.filter(status='r', borrower=borrower), 'o', borrower=borrower, due_back=due_back)
+        except NoCopyAvailable:
+            return _take_copy(copies.filter(status='a'), 'o', borrower=borrower, due_back=due_back)
+        # the copy was reserved for a hold of the borrower
+        Hold.objects.filter(copy=copy, status='r').update(status='f')
+        return copy
+
+
+def reserve(book, borrower, until=None):
+    """
+    Put an available copy of a book aside for a borrower.
+
+    Args:
+        book (Book or int): the book or its primary key
+        borrower (User): the user the copy is reserved for
+        until (date): when the reservation ends, in RESERVATION_PERIOD by default
+
+    Returns:
+        BookInstance: the copy reserved
+
+    Raises:
+        NoCopyAvailable: if no copy of the book is available
+    """
+    book_id = getattr(book, 'pk', book)
+    until = until or datetime.date.today() + RESERVATION_PERIOD
+    copies = BookInstance.objects.filter(book_id=book_id, status='a').order_by()
+    with transaction.atomic():
+        return _take_copy(copies, 'r', borrower=borrower, due_back=until)
+
+
+def return_copies(copies):
+    """
+    Take back copies that are on loan or reserved, and make them available. The
+    returned copies are then reserved for the waiting holds on their books.
+
+    Args:
+        copies (iterable): the copies or their primary keys
+
+    Returns:
+        int: the number of copies returned
+
+    Raises:
+        InvalidLoanState: if one of the copies is not on loan or reserved
+    """
+    copy_ids = {getattr(copy, 'pk', copy) for copy in copies}
+    with transaction.atomic():
+        returned = list(
+            BookInstance.objects.select_for_update().filter(pk__in=copy_ids, status__in=('o', 'r'))
+            .only('pk', 'book_id', 'status', 'overdue')
+        )
+        if len(returned) != len(copy_ids):
+            raise InvalidLoanState('The copy is not on loan or reserved.')
+        changed = BookInstance.objects.filter(pk__in=copy_ids, status__in=('o', 'r')).update(
+            status='a', borrower=None, due_back=None, overdue=False, days_overdue=0, updated_at=timezone.now(),
+        )
+        if changed != len(returned):
+            # another transaction returned one of the copies first
+            raise InvalidLoanState('The copy is not on loan or reserved.')
+        # a copy reserved for a hold is released, the hold is cancelled
+        Hold.objects.filter(copy__in=copy_ids, status='r').update(status='c')
+        record_changes(returned, 'a')
+        holds.allocate_holds({copy.book_id for copy in returned if copy.book_id is not None})
+    return len(returned)
+
+
+def return_copy(copy):
+    """
+    Take back a copy that is on loan or reserved, and make it available or reserve
+    it for the next waiting hold on its book.
+
+    Args:
+        copy (BookInstance or UUID): the copy or its primary key
+
+    Returns:
+        BookInstance: the copy, as it was changed
+
+    Raises:
+        InvalidLoanState: if the copy is not on loan or reserved
+    """
+    copy_id = getattr(copy, 'pk', copy)
+    return_copies([copy_id])
+    return BookInstance.objects.select_related('book', 'borrower').get(pk=copy_id)
@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from catalog.benchmarks import compare_reports, run_benchmark, seed_catalog
+
+
+class Command(BaseCommand):
+    """
+    Measure the latency, query count and peak memory of every catalog page and
+    write the results as JSON. Run it against a seeded database (see seed_catalog,
+    or pass --seed-authors/--seed-books/--seed-copies) and keep the report of each
+    commit to compare them:
+
+        python manage.py benchmark_catalog --output before.json
+        python manage.py benchmark_catalog --output after.json --compare before.json
+    """
+    help = 'Benchmark every page of the catalog app and write a JSON report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Measured requests per page')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests made before measuring a page')
+        parser.add_argument('--route', action='append', dest='routes', help='Only measure this route name (repeatable)')
+        parser.add_argument('--seed-authors', type=int, default=0, help='Seed this many authors before measuring')
+        parser.add_argument('--seed-books', type=int, default=0, help='Seed this many books before measuring')
+        parser.add_argument('--seed-copies', type=int, default=0, help='Seed this many book instances before measuring')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout')
+        parser.add_argument('--compare', help='A previous report to compare the results with')
+
+    def handle(self, *args, **options):
+        if options['seed_authors'] or options['seed_books'] or options['seed_copies']:
+            seed_catalog(
+                authors=options['seed_authors'],
+                books=options['seed_books'],
+                copies=options['seed_copies'],
+                stdout=self.stderr,
+            )
+
+        report = run_benchmark(
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            routes=options['routes'],
+        )
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                report['comparison'] = compare_reports(json.load(baseline_file), report)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+            self.stderr.write(f'Report written to {options["output"]}')
+        else:
+            self.stdout.write(output)
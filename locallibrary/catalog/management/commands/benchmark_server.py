@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from catalog.benchmarks import compare_reports, run_http_benchmark
+
+
+class Command(BaseCommand):
+    """
+    Load a running server with concurrent requests to every catalog page and write
+    the throughput and latencies as JSON. Compare a WSGI server with the ASGI
+    application, which serves the async read-only views:
+
+        gunicorn locallibrary.wsgi --threads 20 &
+        python manage.py benchmark_server --url http://127.0.0.1:8000 --output wsgi.json
+        uvicorn locallibrary.asgi:application --port 8001 &
+        python manage.py benchmark_server --url http://127.0.0.1:8001 --output asgi.json --compare wsgi.json
+    """
+    help = 'Benchmark the catalog pages of a running server and write a JSON report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='The url of the server')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per page')
+        parser.add_argument('--route', action='append', dest='routes', help='Only measure this route name (repeatable)')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout')
+        parser.add_argument('--compare', help='A previous report to compare the results with')
+
+    def handle(self, *args, **options):
+        report = run_http_benchmark(
+            options['url'],
+            concurrency=options['concurrency'],
+            requests=options['requests'],
+            routes=options['routes'],
+        )
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                report['comparison'] = compare_reports(
+                    json.load(baseline_file), report, metrics=('requests_per_second', 'p50_ms', 'p95_ms', 'failed')
+                )
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+            self.stderr.write(f'Report written to {options["output"]}')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from catalog.benchmarks import SESSION_MODES, run_session_benchmark
+
+
+class Command(BaseCommand):
+    """
+    Count the database writes per request of the home page with the visits saved
+    in the session on every visit and with the batched visit counter of
+    catalog/visits.py, for every session backend, and write the results as JSON.
+    """
+    help = 'Count the database writes of the home page for every session backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Number of measured requests per configuration')
+        parser.add_argument(
+            '--mode', action='append', choices=SESSION_MODES, dest='modes',
+            help='A session backend to measure, all of them by default. Can be repeated.',
+        )
+
+    def handle(self, *args, **options):
+        report = run_session_benchmark(requests=options['requests'], modes=options['modes'] or SESSION_MODES)
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmarks import run_sqlite_benchmark
+from catalog.sqlite import PROFILES
+
+
+class Command(BaseCommand):
+    """
+    Measure the concurrent read and write throughput of a copy of the SQLite
+    database with stock SQLite and with a tuning profile (see catalog/sqlite.py),
+    and write the results as JSON. Seed the database first for realistic numbers,
+    eg with python manage.py seed_catalog.
+    """
+    help = 'Compare the concurrent throughput of stock SQLite with a tuning profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Number of reading threads')
+        parser.add_argument('--writers', type=int, default=2, help='Number of writing threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='How long each configuration runs')
+        parser.add_argument('--profile', default='production', choices=sorted(PROFILES), help='The profile to compare')
+
+    def handle(self, *args, **options):
+        try:
+            report = run_sqlite_benchmark(
+                readers=options['readers'],
+                writers=options['writers'],
+                seconds=options['seconds'],
+                profile=options['profile'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
@@ -0,0 +1,199 @@
+import datetime
+import re
+import uuid
+from types import SimpleNamespace
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from catalog.admin import BookInstanceAdmin
+from catalog.models import BookInstance
+from catalog.pagination import CursorPaginator
+from catalog.views import (
+    AllBorrowedBooks, AuthorListView, BookListView, LoanedBooksByUserListView, OverdueBooksListView,
+)
+
+# lines of an EXPLAIN output that mean a table is read from start to end. SQLite
+# reports 'SCAN <table>' (without 'USING ... INDEX') and PostgreSQL 'Seq Scan on <table>'.
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (TABLE )?(?P<table>\w+)(?!.*USING (COVERING )?INDEX)'),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+}
+
+# lines of an EXPLAIN output that mean the rows are sorted after they are read. The
+# pages of the list views must come in the order of an index.
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF |LAST TERM OF )?ORDER BY'),
+    'postgresql': re.compile(r'^\s*(->\s*)?(Incremental )?Sort\b'),
+}
+
+# the views paginated with cursors (see catalog/pagination.py)
+KEYSET_VIEWS = (BookListView, AuthorListView, LoanedBooksByUserListView, AllBorrowedBooks, OverdueBooksListView)
+
+# the values of the keys of the cursor of the page checked, by type of field. Any
+# value gives the same plan.
+SAMPLE_KEY_VALUES = {
+    'CharField': 'm',
+    'DateField': datetime.date(2022, 1, 1),
+    'UUIDField': uuid.UUID(int=1),
+}
+
+# statements run before the plans are read. PostgreSQL rightly prefers a seq scan
+# on the small tables of CI and fresh installs, so the statistics are refreshed and
+# seq scans are priced out for the transaction of the check: a query still planned
+# with one has no index it could use.
+PLANNER_SETUP = {
+    'postgresql': ('ANALYZE {table}', 'SET LOCAL enable_seqscan = off'),
+}
+
+
+def _scanned_table(pattern, line):
+    """
+    Args:
+        pattern (Pattern): the full scan pattern of the database vendor
+        line (str): a line of the EXPLAIN output
+
+    Returns:
+        str: the name of the table the line reads in full, or None
+    """
+    match = pattern.search(line)
+    return match.group('table') if match else None
+
+
+def _view(view_class, user):
+    """
+    Args:
+        view_class (View): a list view with a get_queryset method
+        user (User): the user making the request
+
+    Returns:
+        View: the view set up for a request of the user
+    """
+    view = view_class()
+    view.setup(SimpleNamespace(user=user))
+    return view
+
+
+def _view_queryset(view_class, user):
+    """
+    Args:
+        view_class (View): a list view with a get_queryset method
+        user (User): the user making the request
+
+    Returns:
+        QuerySet: the queryset the view would display for the user
+    """
+    return _view(view_class, user).get_queryset()
+
+
+def hot_queries():
+    """
+    Returns:
+        dict: the querysets of the BookInstance loan status hot paths keyed by a
+              description of where they run
+    """
+    # the plan does not depend on which user is asking, only the primary key is used
+    user = User(pk=1)
+    admin_ordering = BookInstanceAdmin(BookInstance, admin.site).get_ordering(None) or BookInstance._meta.ordering
+    return {
+        'LoanedBooksByUserListView.get_queryset': _view_queryset(LoanedBooksByUserListView, user),
+        'AllBorrowedBooks.get_queryset': _view_queryset(AllBorrowedBooks, user),
+        'OverdueBooksListView.get_queryset': _view_queryset(OverdueBooksListView, user),
+        'index: available copies': BookInstance.objects.filter(status__exact='a'),
+        'admin list_filter: status': BookInstance.objects.filter(status__exact='o').order_by(*admin_ordering),
+        'admin list_filter: overdue': BookInstance.objects.filter(overdue__exact=True).order_by(*admin_ordering),
+        'admin list_filter: due_back': BookInstance.objects.filter(
+            due_back__gte='2022-01-01', due_back__lt='2022-02-01'
+        ).order_by(*admin_ordering),
+    }
+
+
+def keyset_queries():
+    """
+    Returns:
+        dict: the queries of the first page, of a next page and of a previous page of
+              the views paginated with cursors, keyed by a description of the page
+    """
+    user = User(pk=1)
+    queries = {}
+    for view_class in KEYSET_VIEWS:
+        view = _view(view_class, user)
+        paginator = CursorPaginator(view.get_queryset(), view.paginate_by, list(view.get_ordering() or []))
+        values = [SAMPLE_KEY_VALUES.get(field.get_internal_type(), 1) for field, _ in paginator.keys]
+        name = view_class.__name__
+        queries[f'{name}: first page'] = paginator.page_queryset()
+        queries[f'{name}: next page'] = paginator.page_queryset(values)
+        queries[f'{name}: previous page'] = paginator.page_queryset(values, backwards=True)
+    return queries
+
+
+class Command(BaseCommand):
+    """
+    Run EXPLAIN on the BookInstance loan status queries and on the pages of the
+    list views, and fail if any of them reads its whole table instead of using an
+    index, or if a page is sorted instead of read in the order of an index. Meant to
+    run in CI after the migrations, eg:
+
+        python manage.py check_query_plans
+    """
+    help = 'Fail if a hot query falls back to a full table scan, or a list page to a sort.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan of every query')
+
+    def handle(self, *args, **options):
+        using = router.db_for_read(BookInstance)
+        connection = connections[using]
+        vendor = connection.vendor
+        pattern = FULL_SCAN_PATTERNS.get(vendor)
+        if pattern is None:
+            raise CommandError(f'Query plans cannot be checked on {vendor} databases.')
+
+        # (queryset, whether the rows must come in the order of an index)
+        queries = {name: (queryset, False) for name, queryset in hot_queries().items()}
+        queries.update({name: (queryset, True) for name, queryset in keyset_queries().items()})
+
+        failures = []
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            tables = sorted({queryset.model._meta.db_table for queryset, _ in queries.values()})
+            for statement in PLANNER_SETUP.get(vendor, ()):
+                for table in tables if '{table}' in statement else [None]:
+                    cursor.execute(statement.format(table=table and connection.ops.quote_name(table)))
+            for name, (queryset, ordered) in queries.items():
+                if not self.check_plan(name, queryset.using(using), vendor, ordered, options['verbose_plans']):
+                    failures.append(name)
+
+        if failures:
+            raise CommandError(f'{len(failures)} queries fall back to a full scan or a sort.')
+
+    def check_plan(self, name, queryset, vendor, ordered, verbose_plans):
+        """
+        Explain a query and report whether it reads its table through an index.
+
+        Args:
+            name (str): the description of the query
+            queryset (QuerySet): the query
+            vendor (str): the vendor of the database
+            ordered (bool): whether the rows must also come in the order of an index
+            verbose_plans (bool): whether to print the plan
+
+        Returns:
+            bool: whether the plan is fine
+        """
+        plan = queryset.explain()
+        if verbose_plans:
+            self.stdout.write(f'{name}:\n{plan}\n')
+
+        table = queryset.model._meta.db_table
+        lines = plan.splitlines()
+        full_scans = [line for line in lines if _scanned_table(FULL_SCAN_PATTERNS[vendor], line) == table]
+        sorts = [line for line in lines if SORT_PATTERNS[vendor].search(line)] if ordered else []
+        if full_scans:
+            self.stdout.write(self.style.ERROR(f'FULL SCAN  {name}: {full_scans[0].strip()}'))
+        elif sorts:
+            self.stdout.write(self.style.ERROR(f'SORT       {name}: {sorts[0].strip()}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'OK         {name}'))
+        return not (full_scans or sorts)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from catalog.holds import expire_holds
+
+
+class Command(BaseCommand):
+    """
+    Expire the ready holds whose reserved copy was not borrowed in time, and reserve
+    the copies for the next holds in the queues. Run it every day, eg from cron with
+    sweep_overdue:
+
+        python manage.py expire_holds
+    """
+    help = 'Expire the holds whose reserved copy was not picked up, and serve the next holds.'
+
+    def handle(self, *args, **options):
+        expired = expire_holds()
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} holds'))
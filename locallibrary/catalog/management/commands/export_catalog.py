@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from catalog.exporters import DEFAULT_CHUNK_SIZE, FORMATS, export_catalog
+
+
+class Command(BaseCommand):
+    """
+    Write the whole inventory of the catalog, one row per copy, eg for the nightly dump:
+
+        python manage.py export_catalog --format jsonl --gzip --output inventory.jsonl.gz
+
+    The rows are streamed from the database so the memory used does not depend on
+    the size of the catalog.
+    """
+    help = 'Export the catalog inventory as CSV or JSON lines without loading it all in memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Output format')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows read from the database at a time')
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        chunks = export_catalog(options['format'], compress=options['gzip'], chunk_size=options['chunk_size'])
+
+        if options['output']:
+            mode, encoding = ('wb', None) if options['gzip'] else ('w', 'utf-8')
+            with open(options['output'], mode, encoding=encoding, newline='' if encoding else None) as output:
+                output.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f'Catalog exported to {options["output"]}'))
+        elif options['gzip']:
+            sys.stdout.buffer.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.importers import READERS, CatalogImporter, CatalogImportError
+
+
+class Command(BaseCommand):
+    """
+    Import books, authors, genres, languages and copies from feed files, eg:
+
+        python manage.py import_catalog branch.csv
+        python manage.py import_catalog branch.jsonl --chunk-size 5000 --resume
+
+    See catalog/importers.py for the feed formats.
+    """
+    help = 'Bulk import catalog records from CSV, JSONL or MARC-like feed files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Feed files to import')
+        parser.add_argument('--format', choices=sorted(READERS), help='Feed format, guessed from the extension by default')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Records written per transaction')
+        parser.add_argument('--resume', action='store_true', help='Skip the records imported by an interrupted run')
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            importer = CatalogImporter(chunk_size=options['chunk_size'], stdout=self.stdout)
+            try:
+                counts = importer.run(path, feed_format=options['format'], resume=options['resume'])
+            except (CatalogImportError, OSError) as error:
+                raise CommandError(f'{path}: {error} (run again with --resume to continue)')
+
+            rate = counts['records'] / counts['seconds'] if counts['seconds'] else counts['records']
+            self.stdout.write(self.style.SUCCESS(
+                f'{path}: {counts["records"]} records in {counts["seconds"]}s ({rate:.0f} rows/s). '
+                f'Created {counts["books"]} books, {counts["authors"]} authors, {counts["genres"]} genres, '
+                f'{counts["languages"]} languages and {counts["copies"]} copies.'
+            ))
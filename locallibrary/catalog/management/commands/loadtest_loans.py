@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.loadtest import run_checkout_load_test
+
+
+class Command(BaseCommand):
+    """
+    Check that concurrent checkouts never lend a copy twice, and measure their
+    throughput. The book, copies and users of the test are removed afterwards:
+
+        python manage.py loadtest_loans --workers 200 --copies 50
+    """
+    help = 'Borrow the same book from many concurrent workers and check no copy is lent twice.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=100, help='Number of concurrent borrowers')
+        parser.add_argument('--copies', type=int, default=50, help='Number of available copies of the book')
+
+    def handle(self, *args, **options):
+        report = run_checkout_load_test(workers=options['workers'], copies=options['copies'])
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+
+        expected = min(options['workers'], options['copies'])
+        if report['double_lent'] or report['checkouts'] != expected or not report['counters_match']:
+            raise CommandError('The checkouts are inconsistent.')
+        self.stdout.write(self.style.SUCCESS(f'{report["checkouts"]} checkouts, no copy lent twice'))
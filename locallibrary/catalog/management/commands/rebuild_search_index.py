@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from catalog.search import get_backend
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the full-text search documents of every book. The index is kept up to
+    date by signals, so this is only needed after changes that bypass them, eg a
+    bulk_create or a raw SQL update.
+    """
+    help = 'Rebuild the full-text search index of the catalog books.'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.create()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt ({backend.connection.vendor})'))
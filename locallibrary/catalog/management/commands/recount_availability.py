@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from catalog.api import invalidate_api
+from catalog.availability import recount_availability
+from catalog.models import Book
+from catalog.stats import invalidate_index_statistics
+
+
+class Command(BaseCommand):
+    """
+    Recount the availability counters of the books from their copies. The counters
+    are kept up to date by signals, so this repairs them after changes that bypass
+    the signals, eg a bulk_create or a raw SQL update.
+    """
+    help = 'Recount the availability counters of the catalog books.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int, help='Only recount these books')
+
+    def handle(self, *args, **options):
+        books = recount_availability(options['book_ids'] or None)
+        invalidate_index_statistics()
+        invalidate_api(Book)
+        self.stdout.write(self.style.SUCCESS(f'Recounted the availability of {books} books'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from catalog.benchmarks import seed_catalog
+
+
+class Command(BaseCommand):
+    """
+    Fill the catalog with a synthetic dataset, eg for benchmarking:
+
+        python manage.py seed_catalog --authors 10000 --books 100000 --copies 1000000
+    """
+    help = 'Fill the catalog with a synthetic dataset of authors, books and copies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=100, help='Number of authors to create')
+        parser.add_argument('--books', type=int, default=1000, help='Number of books to create')
+        parser.add_argument('--copies', type=int, default=10000, help='Number of book instances to create')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows inserted per query')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random data generator')
+
+    def handle(self, *args, **options):
+        seed_catalog(
+            authors=options['authors'],
+            books=options['books'],
+            copies=options['copies'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS('Catalog seeded'))
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.overdue import sweep_overdue
+
+
+class Command(BaseCommand):
+    """
+    Store which copies are overdue and by how many days. Run it every day, eg from
+    cron, so BookInstance.objects.overdue() stays current:
+
+        python manage.py sweep_overdue
+    """
+    help = 'Mark the copies on loan past their due date as overdue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Sweep as of this date (YYYY-MM-DD) instead of today')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f'Invalid date {options["date"]!r}, use YYYY-MM-DD.')
+
+        result = sweep_overdue(today)
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {result["copies"]} copies, recounted {result["books"]} books'
+        ))
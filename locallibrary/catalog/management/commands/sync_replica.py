@@ -0,0 +1,37 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from catalog.routers import read_replicas
+
+
+class Command(BaseCommand):
+    """
+    Copy the default SQLite database over its read replicas. SQLite has no
+    replication, so this stands in for it when trying the replica routing locally
+    with two database files (see CATALOG_SQLITE_REPLICA in the settings): run it
+    after migrating, and again whenever the replica should catch up.
+    """
+    help = 'Copy the default SQLite database to the read replicas.'
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied, use the replication of your database.')
+        replicas = read_replicas()
+        if not replicas:
+            raise CommandError('There is no read replica in CATALOG_READ_REPLICAS.')
+
+        primary.ensure_connection()
+        for alias in replicas:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'The replica {alias} is not an SQLite database.')
+            connections[alias].close()
+            target = sqlite3.connect(str(settings.DATABASES[alias]['NAME']))
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'Copied the primary to {alias}'))
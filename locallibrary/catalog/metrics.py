@@ -0,0 +1,465 @@
+"""
+Request metrics of the site, exported in the Prometheus text format.
+
+With CATALOG_METRICS set, RequestMetricsMiddleware measures the requests and
+records, for every url name (eg 'books', 'author-detail'):
+
+    catalog_http_requests_total             the requests, by method and status
+    catalog_http_request_duration_seconds   a histogram of their latency
+    catalog_http_response_size_bytes        a histogram of the size of their responses
+    catalog_db_queries_total                the queries they ran
+    catalog_db_query_duration_seconds_total the time spent running them
+    catalog_cache_requests_total            the cache lookups, by result (hit or miss)
+
+The metrics endpoint (/catalog/metrics/) serves them to the staff, and to the
+scrapers sending the CATALOG_METRICS_TOKEN in an 'Authorization: Bearer <token>'
+header. The address of the client is not trusted, as behind a proxy every
+request comes from the address of the proxy. With CATALOG_METRICS_SAMPLE_RATE
+below 1, only that share of the requests is measured, and the counts are the
+ones of the requests measured.
+
+Every thread adds its measurements to its own shard of the metrics, so the
+requests never wait for each other to record them. The endpoint sums the shards
+of the threads of the process. The shards of the threads that ended, eg of a
+server starting a thread per request, are merged into one. Like the counters of
+any process, they start from zero when it starts, and every process of the site
+is scraped on its own.
+
+The queries are counted by an execute wrapper of the connections, and the cache
+lookups by wrapping the get and get_many methods of the cache backends, as Django
+has no signal for them.
+"""
+
+import contextvars
+import hmac
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+# the upper bounds of the buckets of the histograms
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# the label of the requests whose url has no name, eg a 404
+UNNAMED = '<unnamed>'
+
+# the help and type of every metric, in the order they are exported
+METRICS = (
+    ('catalog_http_requests_total', 'counter', 'The requests measured.'),
+    ('catalog_http_request_duration_seconds', 'histogram', 'The time taken to answer the requests.'),
+    ('catalog_http_response_size_bytes', 'histogram', 'The size of the responses, streamed ones excepted.'),
+    ('catalog_db_queries_total', 'counter', 'The database queries run by the requests.'),
+    ('catalog_db_query_duration_seconds_total', 'counter', 'The time spent running the queries.'),
+    ('catalog_cache_requests_total', 'counter', 'The cache lookups of the requests.'),
+)
+
+# the measurements of the request running
+_sample = contextvars.ContextVar('catalog_metrics_sample', default=None)
+
+# the shards of the running threads of the process, by thread, and the metrics of
+# the threads that ended. The lock is only taken when a thread records its first
+# request and when the metrics are collected.
+_local = threading.local()
+_shards = {}
+_shards_lock = threading.Lock()
+
+
+def metrics_enabled():
+    """
+    Returns:
+        bool: whether the requests are measured
+    """
+    return getattr(settings, 'CATALOG_METRICS', False)
+
+
+class Sample:
+    """
+    The measurements of one request.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # the lookups of a get_many are counted once, not for each get it makes
+        self.in_get_many = False
+
+
+class Shard:
+    """
+    The metrics recorded by one thread. Only that thread writes to it.
+    """
+
+    def __init__(self):
+        # (name, labels) -> value
+        self.counters = {}
+        # (name, labels) -> [count of every bucket..., sum, count]
+        self.histograms = {}
+
+    def increment(self, name, labels, amount=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, buckets, value):
+        key = (name, labels)
+        values = self.histograms.get(key)
+        if values is None:
+            values = self.histograms[key] = [0] * (len(buckets) + 2)
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                values[index] += 1
+                break
+        values[-2] += value
+        values[-1] += 1
+
+    def merge(self, other):
+        """
+        Add the metrics of another shard to this one.
+
+        Args:
+            other (Shard): a shard no thread writes to any more
+        """
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in other.histograms.items():
+            total = self.histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+
+    def clear(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+
+_retired = Shard()
+
+
+def _retire_finished():
+    """
+    Merge the shards of the threads that ended into _retired, so the shards do not
+    pile up with the threads. Called with _shards_lock held.
+    """
+    for thread in [thread for thread in _shards if not thread.is_alive()]:
+        _retired.merge(_shards.pop(thread))
+
+
+def _shard():
+    """
+    Returns:
+        Shard: the shard of the current thread
+    """
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = Shard()
+        with _shards_lock:
+            _retire_finished()
+            _shards[threading.current_thread()] = shard
+    return shard
+
+
+def _time_query(execute, sql, params, many, context):
+    sample = _sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.query_seconds += time.perf_counter() - start
+
+
+def _watch_connection(sender=None, connection=None, **kwargs):
+    """
+    Measure the queries of a connection for the request running them.
+    """
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+_MISSING = object()
+
+
+def _counted_get(get):
+    def counted_get(self, key, default=None, version=None):
+        sample = _sample.get()
+        if sample is None or sample.in_get_many:
+            return get(self, key, default, version)
+        value = get(self, key, _MISSING, version)
+        if value is _MISSING:
+            sample.cache_misses += 1
+            return default
+        sample.cache_hits += 1
+        return value
+    counted_get.measured = True
+    return counted_get
+
+
+def _counted_get_many(get_many):
+    def counted_get_many(self, keys, version=None):
+        sample = _sample.get()
+        if sample is None or sample.in_get_many:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        sample.in_get_many = True
+        try:
+            values = get_many(self, keys, version)
+        finally:
+            sample.in_get_many = False
+        sample.cache_hits += len(values)
+        sample.cache_misses += len(keys) - len(values)
+        return values
+    counted_get_many.measured = True
+    return counted_get_many
+
+
+def install():
+    """
+    Measure the queries of the connections and the lookups of the cache backends.
+    Installing it twice does nothing.
+    """
+    connection_created.connect(_watch_connection, dispatch_uid='catalog_metrics')
+    for connection in connections.all():
+        _watch_connection(connection=connection)
+
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        if not getattr(backend.get, 'measured', False):
+            backend.get = _counted_get(backend.get)
+        if not getattr(backend.get_many, 'measured', False):
+            backend.get_many = _counted_get_many(backend.get_many)
+
+
+def record(view, method, status, seconds, size, sample):
+    """
+    Add the measurements of a request to the shard of the current thread.
+
+    Args:
+        view (str): the name of the url of the request
+        method (str): the method of the request
+        status (int): the status of the response
+        seconds (float): how long the request took
+        size (int): the size of the response, or None when it was streamed
+        sample (Sample): the queries and cache lookups of the request
+    """
+    shard = _shard()
+    labels = (('view', view),)
+    shard.increment('catalog_http_requests_total', labels + (('method', method), ('status', str(status))))
+    shard.observe('catalog_http_request_duration_seconds', labels, DURATION_BUCKETS, seconds)
+    if size is not None:
+        shard.observe('catalog_http_response_size_bytes', labels, SIZE_BUCKETS, size)
+    shard.increment('catalog_db_queries_total', labels, sample.queries)
+    shard.increment('catalog_db_query_duration_seconds_total', labels, sample.query_seconds)
+    shard.increment('catalog_cache_requests_total', labels + (('result', 'hit'),), sample.cache_hits)
+    shard.increment('catalog_cache_requests_total', labels + (('result', 'miss'),), sample.cache_misses)
+
+
+def collect():
+    """
+    Sum the shards of the threads of the process.
+
+    Returns:
+        tuple: the counters, {(name, labels): value}, and the histograms,
+               {(name, labels): [count of every bucket..., sum, count]}
+    """
+    total = Shard()
+    with _shards_lock:
+        _retire_finished()
+        total.merge(_retired)
+        for shard in list(_shards.values()):
+            # copying a dict or a list is atomic, the owner may be adding to it meanwhile
+            copy = Shard()
+            copy.counters = dict(shard.counters)
+            copy.histograms = {key: list(values) for key, values in dict(shard.histograms).items()}
+            total.merge(copy)
+    return total.counters, total.histograms
+
+
+def reset():
+    """
+    Forget the metrics of the process.
+    """
+    with _shards_lock:
+        _retired.clear()
+        for shard in _shards.values():
+            shard.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition():
+    """
+    Returns:
+        str: the metrics of the process in the Prometheus text format
+    """
+    counters, histograms = collect()
+    buckets = {
+        'catalog_http_request_duration_seconds': DURATION_BUCKETS,
+        'catalog_http_response_size_bytes': SIZE_BUCKETS,
+    }
+    lines = []
+    for name, kind, description in METRICS:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets[name], values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {values[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(values[-2])}')
+            lines.append(f'{name}_count{_labels(labels)} {values[-1]}')
+    lines.append('# HELP catalog_metrics_sample_rate The share of the requests measured.')
+    lines.append('# TYPE catalog_metrics_sample_rate gauge')
+    lines.append(f'catalog_metrics_sample_rate {_number(float(sample_rate()))}')
+    return '\n'.join(lines) + '\n'
+
+
+def sample_rate():
+    """
+    Returns:
+        float: the share of the requests measured, from 0 to 1
+    """
+    return getattr(settings, 'CATALOG_METRICS_SAMPLE_RATE', 1.0)
+
+
+def is_allowed(request):
+    """
+    Args:
+        request (HttpRequest): a request for the metrics
+
+    Returns:
+        bool: whether the request comes from a member of the staff, or sends the
+              token of the scrapers
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = getattr(settings, 'CATALOG_METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    # without a token, only the staff can read the metrics
+    return bool(token) and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+
+
+def export(request):
+    """
+    The metrics of the process in the Prometheus text format, for the staff and
+    the scrapers sending CATALOG_METRICS_TOKEN.
+
+    Args:
+        request (HttpRequest): the request
+
+    Returns:
+        HttpResponse: the metrics
+    """
+    if not metrics_enabled():
+        raise Http404('The metrics are not collected.')
+    if not is_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure the requests when CATALOG_METRICS is set. It comes first in MIDDLEWARE,
+    so that the time and queries of the other middleware are counted too. The
+    metrics endpoint itself is not measured. Under ASGI it runs on the event loop,
+    so the async views are not moved to a thread because of it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install()
+
+    def sampled(self):
+        """
+        Returns:
+            bool: whether the request is measured
+        """
+        rate = sample_rate()
+        return rate >= 1 or random.random() < rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        sample = Sample()
+        token = _sample.set(sample)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _sample.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, sample)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        # the threads running the queries of the view get a copy of the context, and
+        # with it the sample of the request
+        sample = Sample()
+        token = _sample.set(sample)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _sample.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, sample)
+
+    def finish(self, request, response, seconds, sample):
+        """
+        Record the measurements of a request.
+
+        Args:
+            request (HttpRequest): the request
+            response (HttpResponse): its response
+            seconds (float): how long the request took
+            sample (Sample): the queries and cache lookups of the request
+
+        Returns:
+            HttpResponse: the response
+        """
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None and match.url_name else UNNAMED
+        if view == 'metrics':
+            return response
+        size = None if response.streaming else len(response.content)
+        record(view, request.method, response.status_code, seconds, size, sample)
+        return response
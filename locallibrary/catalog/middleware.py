@@ -0,0 +1,56 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .routers import PIN_COOKIE, pin_seconds, start_pinning, stop_pinning, wrote_to_primary
+
+
+class PrimaryPinningMiddleware:
+    """
+    Send the catalog reads of a browser to the primary database for a few seconds
+    after it wrote to it (see catalog/routers.py), so that the page shown after a
+    form is posted never comes from a replica that has not caught up yet. Under
+    ASGI it runs on the event loop, so the async views are not moved to a thread
+    because of it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = start_pinning(PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            wrote = wrote_to_primary()
+        finally:
+            stop_pinning(tokens)
+        return self.pin(response, wrote)
+
+    async def __acall__(self, request):
+        tokens = start_pinning(PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+            wrote = wrote_to_primary()
+        finally:
+            stop_pinning(tokens)
+        return self.pin(response, wrote)
+
+    def pin(self, response, wrote):
+        """
+        Args:
+            response (HttpResponse): the response of the request
+            wrote (bool): whether the request wrote to the primary
+
+        Returns:
+            HttpResponse: the response, pinning the browser to the primary if it wrote
+        """
+        if wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=pin_seconds(),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_alter_bookinstance_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='author',
+            name='date_of_death',
+            field=models.DateField(blank=True, null=True, verbose_name='died'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['borrower', 'status', 'due_back'], name='bookinst_borrower_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(condition=models.Q(('borrower__isnull', False)), fields=['borrower', 'due_back'], name='bookinst_borrowed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['status', 'due_back'], name='bookinst_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['due_back'], name='bookinst_due_back_idx'),
+        ),
+    ]
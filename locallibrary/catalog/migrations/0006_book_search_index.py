@@ -0,0 +1,81 @@
+from django.db import migrations
+
+# The full-text index of catalog/search.py, as it was when this migration was
+# written. The SQL is copied here rather than imported so that the migration
+# keeps creating the same index when the search code changes.
+
+# name of the table that holds the search documents
+INDEX_TABLE = 'catalog_book_search'
+
+# the names of the genres of book b, joined by a space, for each vendor
+GENRES_SQL = {
+    'sqlite': (
+        "SELECT group_concat(g.name, ' ') FROM {book_genre} bg "
+        "JOIN {genre} g ON g.id = bg.genre_id WHERE bg.book_id = b.id"
+    ),
+    'postgresql': (
+        "SELECT string_agg(g.name, ' ') FROM {book_genre} bg "
+        "JOIN {genre} g ON g.id = bg.genre_id WHERE bg.book_id = b.id"
+    ),
+}
+
+# the search documents of every book: id, title, summary, isbn, authors and genres
+DOCUMENTS_SQL = (
+    "SELECT b.id, b.title, b.summary, b.isbn, "
+    "COALESCE(a.first_name, '') || ' ' || COALESCE(a.last_name, ''), COALESCE(({genres}), '') "
+    "FROM {book} b LEFT JOIN {author} a ON a.id = b.author_id"
+)
+
+CREATE_SQL = {
+    'sqlite': [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+        f'title, summary, isbn, authors, genres, tokenize="unicode61 remove_diacritics 2")',
+        f'INSERT INTO {INDEX_TABLE} (rowid, title, summary, isbn, authors, genres) {{documents}}',
+    ],
+    'postgresql': [
+        f'CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ('
+        f'book_id bigint PRIMARY KEY REFERENCES {{book}} (id) ON DELETE CASCADE '
+        f'DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)',
+        f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document ON {INDEX_TABLE} USING GIN (document)',
+        f'INSERT INTO {INDEX_TABLE} (book_id, document) '
+        f"SELECT d.id, setweight(to_tsvector('english', d.title), 'A') "
+        f"|| setweight(to_tsvector('simple', d.isbn), 'A') "
+        f"|| setweight(to_tsvector('simple', d.authors), 'B') "
+        f"|| setweight(to_tsvector('english', d.genres), 'C') "
+        f"|| setweight(to_tsvector('english', d.summary), 'D') "
+        f'FROM ({{documents}}) AS d (id, title, summary, isbn, authors, genres)',
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    # the other databases are searched with LIKE, without an index
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_SQL:
+        return
+    book = apps.get_model('catalog', 'Book')
+    tables = {
+        'book': book._meta.db_table,
+        'author': apps.get_model('catalog', 'Author')._meta.db_table,
+        'genre': apps.get_model('catalog', 'Genre')._meta.db_table,
+        'book_genre': book._meta.get_field('genre').remote_field.through._meta.db_table,
+    }
+    documents = DOCUMENTS_SQL.format(genres=GENRES_SQL[vendor].format(**tables), **tables)
+    for sql in CREATE_SQL[vendor]:
+        schema_editor.execute(sql.format(documents=documents, **tables))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_bookinstance_loan_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
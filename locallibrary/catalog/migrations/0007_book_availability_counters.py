@@ -0,0 +1,70 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:17
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_copies(apps, schema_editor):
+    # the historical models are used, the counters of catalog.availability may
+    # depend on fields added by later migrations
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    using = schema_editor.connection.alias
+
+    def count(*conditions, **filters):
+        copies = BookInstance.objects.using(using).filter(book=OuterRef('pk'), *conditions, **filters)
+        count = copies.order_by().values('book').annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(count, output_field=models.IntegerField()), 0)
+
+    Book.objects.using(using).update(
+        copies_total=count(),
+        copies_available=count(status='a'),
+        copies_on_loan=count(status='o'),
+        copies_reserved=count(status='r'),
+        copies_maintenance=count(status='m'),
+        copies_overdue=count(Q(due_back__lt=datetime.date.today()), status='o'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_maintenance',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_overdue',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_reserved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_copies, migrations.RunPython.noop),
+    ]
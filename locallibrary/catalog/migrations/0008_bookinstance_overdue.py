@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:19
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import F, Value
+
+
+def sweep(apps, schema_editor):
+    # the first overdue sweep, with the historical models. The overdue counters of
+    # the books were counted from the same condition by the previous migration.
+    from catalog.overdue import DaysBetween, late_condition
+
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    today = datetime.date.today()
+    BookInstance.objects.using(schema_editor.connection.alias).filter(late_condition(today)).update(
+        overdue=True,
+        days_overdue=DaysBetween(Value(today), F('due_back')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_book_availability_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookinstance',
+            name='days_overdue',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookinstance',
+            name='overdue',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(condition=models.Q(('overdue', True)), fields=['due_back'], name='bookinst_overdue_idx'),
+        ),
+        migrations.RunPython(sweep, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_bookinstance_overdue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['book', 'status'], name='bookinst_book_status_idx'),
+        ),
+    ]
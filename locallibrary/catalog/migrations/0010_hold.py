@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0009_bookinstance_book_status_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('w', 'Waiting'), ('r', 'Ready'), ('f', 'Fulfilled'), ('c', 'Cancelled'), ('e', 'Expired')], default='w', max_length=1)),
+                ('placed_at', models.DateTimeField(auto_now_add=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.book')),
+                ('copy', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.bookinstance')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='hold',
+            index=models.Index(condition=models.Q(('status', 'w')), fields=['book', 'id'], name='hold_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hold',
+            index=models.Index(fields=['user', 'status'], name='hold_user_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hold',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['w', 'r'])), fields=('book', 'user'), name='hold_one_active_per_user'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:56
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='author',
+            options={'ordering': ['last_name', 'first_name']},
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(django.db.models.functions.text.Lower('last_name'), name='author_last_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(django.db.models.functions.text.Lower('first_name'), name='author_first_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='genre_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='language',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='language_name_prefix_idx'),
+        ),
+    ]
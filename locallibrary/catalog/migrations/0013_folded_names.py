@@ -0,0 +1,89 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:18
+
+import catalog.models
+from django.db import migrations, models
+
+# the folded copies of the names of every model
+FOLDED_FIELDS = {
+    'author': {'first_name_folded': 'first_name', 'last_name_folded': 'last_name'},
+    'genre': {'name_folded': 'name'},
+    'language': {'name_folded': 'name'},
+}
+
+
+def fold_names(apps, schema_editor):
+    using = schema_editor.connection.alias
+    for model_name, fields in FOLDED_FIELDS.items():
+        model = apps.get_model('catalog', model_name)
+        objects = list(model.objects.using(using).only('pk', *fields.values()))
+        for obj in objects:
+            for folded, source in fields.items():
+                setattr(obj, folded, catalog.models.fold(getattr(obj, source)))
+        model.objects.using(using).bulk_update(objects, list(fields), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_autocomplete_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='book',
+            options={'ordering': ['title']},
+        ),
+        migrations.RemoveIndex(
+            model_name='author',
+            name='author_last_name_prefix_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='author',
+            name='author_first_name_prefix_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='genre',
+            name='genre_name_prefix_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='language',
+            name='language_name_prefix_idx',
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='first_name_folded',
+            field=catalog.models.FoldedField(max_length=200, source='first_name'),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='last_name_folded',
+            field=catalog.models.FoldedField(max_length=200, source='last_name'),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='name_folded',
+            field=catalog.models.FoldedField(max_length=400, source='name'),
+        ),
+        migrations.AddField(
+            model_name='language',
+            name='name_folded',
+            field=catalog.models.FoldedField(max_length=100, source='name'),
+        ),
+        migrations.RunPython(fold_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['last_name_folded'], name='author_last_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['first_name_folded'], name='author_first_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(fields=['name_folded'], name='genre_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='language',
+            index=models.Index(fields=['name_folded'], name='language_name_prefix_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_folded_names'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bookinstance',
+            name='bookinst_borrower_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='bookinstance',
+            name='bookinst_borrowed_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='bookinstance',
+            name='bookinst_overdue_idx',
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'id'], name='book_title_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinst_borrower_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(condition=models.Q(('borrower__isnull', False)), fields=['borrower', 'id'], name='bookinst_borrowed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(condition=models.Q(('overdue', True)), fields=['due_back', 'id'], name='bookinst_overdue_idx'),
+        ),
+    ]
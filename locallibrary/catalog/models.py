@@ -7,13 +7,57 @@
 @desc: [description]
 """
 
-from django.db import models
+from django.db import models, router, transaction
 from django.urls import reverse
 from django.contrib.auth.models import User
 from datetime import date
 
 # Create your models here.
 
+
+def fold(value):
+    """
+    Args:
+        value (str): a name
+
+    Returns:
+        str: the name case folded, to compare names whatever their case
+    """
+    return (value or '').casefold()
+
+
+class FoldedField(models.CharField):
+    """
+    A case folded copy of another text field of the model, kept up to date when the
+    object is saved or bulk created. The databases only fold the case of ASCII
+    letters (SQLite's LOWER() leaves 'É' as it is), so the names are folded in
+    Python and stored to be matched whatever their case (see catalog/autocomplete.py).
+    Updates made with QuerySet.update() or bulk_update() must set it themselves.
+
+    Args:
+        source (str): the name of the field copied
+    """
+
+    def __init__(self, source, *args, **kwargs):
+        self.source = source
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('default', '')
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        kwargs.pop('editable', None)
+        if kwargs.get('default') == '':
+            kwargs.pop('default')
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = fold(getattr(model_instance, self.source))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class Language(models.Model):
     """
     A model of a language a book is written in. It has a name and a universal code.
@@ -25,6 +69,12 @@ class Language(models.Model):
     name = models.CharField(max_length=50, help_text='Enter the full name of the language in English')
     code = models.CharField(max_length=2, null=True, blank=True, 
                             help_text='Enter the universal language code for the language (eg es for Spanish)')
+
+    # see Author.last_name_folded
+    name_folded = FoldedField('name', max_length=100)
+
+    class Meta:
+        indexes = [models.Index(fields=['name_folded'], name='language_name_prefix_idx')]
     
     def __str__(self) -> str:
         """
@@ -44,6 +94,12 @@ class Genre(models.Model):
 
     name = models.CharField(max_length=200, help_text='Enter a book genre eg Science Fiction')  
 
+    # see Author.last_name_folded
+    name_folded = FoldedField('name', max_length=400)
+
+    class Meta:
+        indexes = [models.Index(fields=['name_folded'], name='genre_name_prefix_idx')]
+
     def __str__(self) -> str:
         """
         Returns:
@@ -60,6 +116,8 @@ class Book(models.Model):
         models (Model): [description]
     """ 
     title = models.CharField(max_length=200)
+    # see Author.last_name_folded. The admin searches the start of the titles with it.
+    title_folded = FoldedField('title', max_length=200)
 
     # foreign key used to link the book model to the author model. This is a
     # one to many relationship. A book has only 1 author but an author can have multiple books.
@@ -77,6 +135,22 @@ class Book(models.Model):
     language = models.ForeignKey(Language, on_delete=models.SET_NULL, null=True, blank=True,
                                     help_text='Select the language the book is written in')
 
+    # the number of copies of the book in total, in each loan status and overdue. They are
+    # maintained when a copy changes (see catalog/availability.py), so showing availability
+    # does not need to count the copies. The overdue count is as of the last change to a
+    # copy or the last overdue sweep.
+    copies_total = models.PositiveIntegerField(default=0, editable=False)
+    copies_available = models.PositiveIntegerField(default=0, editable=False)
+    copies_on_loan = models.PositiveIntegerField(default=0, editable=False)
+    copies_reserved = models.PositiveIntegerField(default=0, editable=False)
+    copies_maintenance = models.PositiveIntegerField(default=0, editable=False)
+    copies_overdue = models.PositiveIntegerField(default=0, editable=False)
+
+    # when the book or its availability counters last changed. The catalog pages send it as
+    # their Last-Modified header (see catalog/conditional.py). The code changing books with
+    # QuerySet.update sets it itself.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
     def __str__(self) -> str:
         """
         Returns:
@@ -102,12 +176,33 @@ class Book(models.Model):
 
     display_genre.short_description = 'Genre'
 
-    class meta:
+    class Meta:
         ordering = ['title']
+        indexes = [
+            # the pages of the book list, in (title, id) order (see catalog/pagination.py)
+            models.Index(fields=['title', 'id'], name='book_title_keyset_idx'),
+            models.Index(fields=['title_folded'], name='book_title_prefix_idx'),
+        ]
 
 
 
 import uuid # Required for unique book instances
+
+
+class BookInstanceQuerySet(models.QuerySet):
+    """
+    Queries of the copies of the books.
+    """
+
+    def overdue(self):
+        """
+        Returns:
+            QuerySet: the copies that were overdue at the last overdue sweep or change
+                      of the copy, see catalog/overdue.py
+        """
+        return self.filter(overdue=True)
+
+
 class BookInstance(models.Model):
     """
     Model representing a specific copy of a book
@@ -138,17 +233,78 @@ class BookInstance(models.Model):
         help_text='Book Availability' 
     )
 
+    # whether the copy is on loan past its due date, and by how many days. They are stored so
+    # overdue copies can be filtered and sorted in SQL. They are refreshed when the copy is
+    # saved and every day by the sweep_overdue command (see catalog/overdue.py).
+    overdue = models.BooleanField(default=False, editable=False)
+    days_overdue = models.PositiveIntegerField(default=0, editable=False)
+
+    # when the copy last changed, see Book.updated_at
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BookInstanceQuerySet.as_manager()
+
     @property
     def is_overdue(self):
         "Check if a book is overdue to be returned"
         if self.due_back and date.today() > self.due_back:
             return True
         return False
+
+    def refresh_overdue(self, today=None):
+        """
+        Set the stored overdue status of the copy from its loan status and due date.
+
+        Args:
+            today (date): the date to compare the due date with, today by default
+        """
+        today = today or date.today()
+        self.overdue = self.status == 'o' and self.due_back is not None and self.due_back < today
+        self.days_overdue = (today - self.due_back).days if self.overdue else 0
+
+    def save(self, *args, **kwargs):
+        self.refresh_overdue()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'overdue', 'days_overdue', 'updated_at'}
+
+        # the availability counters of the book are updated by signal receivers, in
+        # the same transaction as the copy
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(BookInstance, instance=self)):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(BookInstance, instance=self)):
+            return super().delete(*args, **kwargs)
     
 
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Set book as returned"),)
+
+        # indexes for the ways the copies are looked up by their loan status. Each
+        # one matches a query that runs on a busy page, see check_query_plans.
+        indexes = [
+            # the books on loan to a user, ordered by due date (LoanedBooksByUserListView).
+            # The list views page in the order of their ordering and then of the primary
+            # key (see catalog/pagination.py), so their indexes end with it.
+            models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinst_borrower_status_idx'),
+            # all the borrowed books ordered by borrower (AllBorrowedBooks). Only the
+            # borrowed copies are indexed, which keeps the index small.
+            models.Index(fields=['borrower', 'id'], name='bookinst_borrowed_idx',
+                         condition=models.Q(borrower__isnull=False)),
+            # copies by status, eg the available copies on the home page or the status
+            # filter of the admin, in the default due date order
+            models.Index(fields=['status', 'due_back'], name='bookinst_status_due_idx'),
+            # the due date filter and default ordering of the admin
+            models.Index(fields=['due_back'], name='bookinst_due_back_idx'),
+            # the copies of a book in a status, eg the available copy picked by a checkout
+            # (catalog/loans.py)
+            models.Index(fields=['book', 'status'], name='bookinst_book_status_idx'),
+            # the overdue copies, oldest due date first (BookInstance.objects.overdue()). Only
+            # the overdue copies are indexed.
+            models.Index(fields=['due_back', 'id'], name='bookinst_overdue_idx',
+                         condition=models.Q(overdue=True)),
+        ]
     
     def __str__(self) -> str:
         """
@@ -158,6 +314,56 @@ class BookInstance(models.Model):
         return f'{self.id} ({self.book.title})'
     
 
+class Hold(models.Model):
+    """
+    A request of a user to borrow a book as soon as a copy is available. The waiting
+    holds of a book form a queue served in the order they were placed: when a copy
+    is returned it is reserved for the oldest waiting hold (see catalog/holds.py).
+
+    Args:
+        models.Model
+    """
+    HOLD_STATUS = (
+        ('w', 'Waiting'),
+        ('r', 'Ready'),
+        ('f', 'Fulfilled'),
+        ('c', 'Cancelled'),
+        ('e', 'Expired'),
+    )
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=1, choices=HOLD_STATUS, default='w')
+
+    # the copy reserved for the user when the hold is ready
+    copy = models.ForeignKey(BookInstance, on_delete=models.SET_NULL, null=True, blank=True)
+    placed_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # the primary keys increase with time, so they give the order of the queue
+        ordering = ['id']
+        indexes = [
+            # the queue of a book: its waiting holds, oldest first. Only the waiting holds
+            # are indexed, so finding the next hold does not depend on past holds.
+            models.Index(fields=['book', 'id'], name='hold_queue_idx', condition=models.Q(status='w')),
+            # the holds of a user, eg on their borrowed books page
+            models.Index(fields=['user', 'status'], name='hold_user_status_idx'),
+        ]
+        constraints = [
+            # a user waits for a book only once
+            models.UniqueConstraint(fields=['book', 'user'], condition=models.Q(status__in=['w', 'r']),
+                                    name='hold_one_active_per_user'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Returns:
+            str: Representation of the model object
+        """
+        return f'{self.user} - {self.book} ({self.get_status_display()})'
+
+
 class Author(models.Model):
     """
     A model representing an author of a book.
@@ -170,8 +376,23 @@ class Author(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField('died', null=True, blank=True)
 
-    class meta:
-        ordering = ['last_name', 'first_name']  
+    # when the author last changed, see Book.updated_at
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # the autocomplete of the book forms looks the authors up by the start of their
+    # names, whatever the case (see catalog/autocomplete.py). Folding can make a name
+    # longer, eg 'ß' becomes 'ss'.
+    last_name_folded = FoldedField('last_name', max_length=200)
+    first_name_folded = FoldedField('first_name', max_length=200)
+
+    class Meta:
+        ordering = ['last_name', 'first_name']
+        indexes = [
+            # the pages of the author list, see Book.Meta
+            models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_keyset_idx'),
+            models.Index(fields=['last_name_folded'], name='author_last_name_prefix_idx'),
+            models.Index(fields=['first_name_folded'], name='author_first_name_prefix_idx'),
+        ]
 
     def get_absolute_url(self):
         """
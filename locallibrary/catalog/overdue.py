@@ -0,0 +1,99 @@
+"""
+The overdue sweep.
+
+Whether a copy is overdue is stored on the copy with the number of days it is
+overdue (BookInstance.overdue and BookInstance.days_overdue), so the overdue
+copies can be filtered and sorted by an indexed query with
+BookInstance.objects.overdue(). A copy refreshes its own flag when it is saved,
+but a loan becomes overdue simply because a day went by, so the sweep_overdue
+command has to run every day, eg from cron just after midnight:
+
+    5 0 * * * python manage.py sweep_overdue
+
+The sweep updates every copy whose overdue status or days overdue change in a
+single UPDATE query, then recounts the overdue counters of the books whose
+copies became overdue or stopped being overdue.
+"""
+
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Case, F, Func, IntegerField, Q, Value, When
+
+from .api import invalidate_api
+from .availability import recount_availability
+from .fragments import invalidate_fragments
+from .models import Book, BookInstance
+
+
+class DaysBetween(Func):
+    """
+    The number of days from the second date to the first: DaysBetween(end, start).
+    Subtracting two dates gives a number of days on PostgreSQL and Oracle, the
+    other databases need a function.
+    """
+    arity = 2
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATEDIFF(%(expressions)s)', arg_joiner=', ',
+                           **extra_context)
+
+
+def late_condition(today):
+    """
+    Args:
+        today (date): the date of the sweep
+
+    Returns:
+        Q: the condition for a copy to be overdue on that date
+    """
+    return Q(status='o', due_back__lt=today)
+
+
+def sweep_overdue(today=None, using=None):
+    """
+    Store the overdue status of every copy as of a date.
+
+    Args:
+        today (date): the date of the sweep, today by default
+        using (str): the database alias
+
+    Returns:
+        dict: the number of copies updated and of books whose overdue counter was recounted
+    """
+    today = today or datetime.date.today()
+    late = late_condition(today)
+    copies = BookInstance.objects.using(using)
+
+    with transaction.atomic(using=using):
+        # the books whose overdue counters change, ie that have copies changing status
+        book_ids = set(
+            copies.filter((late & Q(overdue=False)) | (~late & Q(overdue=True)))
+            .order_by().values_list('book_id', flat=True).distinct()
+        )
+        book_ids.discard(None)
+
+        updated = copies.filter(late | Q(overdue=True)).update(
+            updated_at=timezone.now(),
+            overdue=Case(When(late, then=Value(True)), default=Value(False)),
+            days_overdue=Case(When(late, then=DaysBetween(Value(today), F('due_back'))), default=Value(0)),
+        )
+        if book_ids:
+            recount_availability(book_ids, using=using)
+
+    # the update does not send signals, so render the pages of the recounted books again
+    invalidate_fragments(Book, book_ids)
+    if updated:
+        invalidate_api(BookInstance, Book)
+    return {'copies': updated, 'books': len(book_ids)}
@@ -0,0 +1,321 @@
+"""
+Keyset (cursor) pagination for the catalog list views.
+
+Django's Paginator counts every row and skips the rows of the previous pages
+with OFFSET, so deep pages get slower the further they are. A cursor page
+instead remembers the sort key of the last row it showed and the next page
+asks for the rows that sort after it:
+
+    WHERE (due_back, id) > (<last due_back>, <last id>) ORDER BY due_back, id LIMIT 11
+
+which an index on the ordering columns answers directly, whatever the depth of
+the page. There is no total count, so cursor pages only link to the previous
+and next pages. The cursors are signed so that they are opaque to the client.
+
+The admin keeps numbered pages, which need a count. EstimatedCountPaginator takes
+the count of an unfiltered table from the statistics of the database instead of
+counting every row.
+"""
+
+from collections.abc import Sequence
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+# salt of the signatures of the cursors, so they cannot be replayed elsewhere
+CURSOR_SALT = 'catalog.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor cannot be decoded, eg because it was tampered with."""
+
+
+class CursorPage(Sequence):
+    """
+    A page of results of a CursorPaginator. It has the same interface as the pages
+    of Django's Paginator where it makes sense, so the templates can use it the
+    same way.
+
+    Args:
+        object_list (list): the objects of the page
+        has_next (bool): whether there are objects after this page
+        has_previous (bool): whether there are objects before this page
+        next_cursor (str): the cursor of the next page, if there is one
+        previous_cursor (str): the cursor of the previous page, if there is one
+    """
+    cursor_paginated = True
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self)} objects>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class CursorPaginator:
+    """
+    Splits an ordered queryset into pages using keyset pagination.
+
+    Args:
+        queryset (QuerySet): the objects to paginate
+        per_page (int): the maximum number of objects on a page
+        ordering (list): the model fields the pages are ordered by, prefixed with '-'
+            for a descending order. The primary key is added as the last key so
+            the order is total.
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.model = queryset.model
+
+        ordering = [name for name in ordering if name.lstrip('-') != 'pk']
+        ordering.append('pk')
+
+        # (field, descending) for every key of the ordering
+        self.keys = []
+        for name in ordering:
+            descending = name.startswith('-')
+            field = self.model._meta.pk if name.lstrip('-') == 'pk' else self.model._meta.get_field(name.lstrip('-'))
+            self.keys.append((field, descending))
+
+        # whether the database sorts NULL after every other value, as PostgreSQL does
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+    def _order_by(self, backwards):
+        return [
+            F(field.attname).asc() if descending == backwards else F(field.attname).desc()
+            for field, descending in self.keys
+        ]
+
+    def _after(self, field, value, descending):
+        """
+        Args:
+            field (Field): a key of the ordering
+            value: the value of the key in the cursor
+            descending (bool): whether the key is sorted in descending order in the query
+
+        Returns:
+            Q: the condition for the key to sort strictly after the value in the query
+        """
+        nulls_first = self.nulls_largest == descending
+        if value is None:
+            return Q(**{f'{field.attname}__isnull': False}) if nulls_first else Q(pk__in=[])
+
+        condition = Q(**{f'{field.attname}__{"lt" if descending else "gt"}': value})
+        if field.null and not nulls_first:
+            condition |= Q(**{f'{field.attname}__isnull': True})
+        return condition
+
+    def _equal(self, field, value):
+        if value is None:
+            return Q(**{f'{field.attname}__isnull': True})
+        return Q(**{field.attname: value})
+
+    def _seek(self, values, backwards):
+        """
+        Args:
+            values (list): the values of the keys of the object the cursor points to
+            backwards (bool): whether to look for the objects before the cursor
+
+        Returns:
+            Q: the condition for the objects that sort after the cursor in the query
+        """
+        condition = None
+        equal = Q()
+        for (field, descending), value in zip(self.keys, values):
+            after = equal & self._after(field, value, descending != backwards)
+            condition = after if condition is None else condition | after
+            equal &= self._equal(field, value)
+
+        # the same rows, bounded by the first key on its own as well. Without it the
+        # databases read the OR as several index searches and sort their rows; with
+        # it they read one range of the index of the ordering, already in order.
+        (field, descending), value = self.keys[0], values[0]
+        if value is None:
+            return condition
+        descending = descending != backwards
+        bound = Q(**{f'{field.attname}__{"lte" if descending else "gte"}': value})
+        if field.null and self.nulls_largest != descending:
+            bound |= Q(**{f'{field.attname}__isnull': True})
+        return bound & condition
+
+    def encode_cursor(self, obj, backwards):
+        """
+        Args:
+            obj (Model): the object the cursor points to
+            backwards (bool): whether the cursor is for the page before the object
+
+        Returns:
+            str: an opaque signed token
+        """
+        values = [field.value_to_string(obj) if getattr(obj, field.attname) is not None else None
+                  for field, _ in self.keys]
+        return signing.dumps({'v': values, 'b': backwards}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """
+        Args:
+            cursor (str): a token made by encode_cursor
+
+        Returns:
+            tuple: the values of the keys of the object and whether to go backwards
+
+        Raises:
+            InvalidCursor: if the token is not a valid cursor for this ordering
+        """
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            if len(data['v']) != len(self.keys):
+                raise ValueError('The cursor does not match the ordering.')
+            values = [field.to_python(value) if value is not None else None
+                      for (field, _), value in zip(self.keys, data['v'])]
+            return values, bool(data['b'])
+        except (signing.BadSignature, ValidationError, KeyError, TypeError, ValueError) as error:
+            raise InvalidCursor(str(error)) from error
+
+    def page_queryset(self, values=None, backwards=False):
+        """
+        Args:
+            values (list): the values of the keys of the object a cursor points to,
+                           None for the first page
+            backwards (bool): whether to look for the objects before the cursor
+
+        Returns:
+            QuerySet: the objects of the page, and one more object to find out if
+                      there is a page after it
+        """
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+        return queryset.order_by(*self._order_by(backwards))[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        """
+        Args:
+            cursor (str): the cursor of the page, the first page when None
+
+        Returns:
+            CursorPage: the page of objects the cursor points to
+
+        Raises:
+            InvalidCursor: if the cursor is not valid
+        """
+        values, backwards = self.decode_cursor(cursor) if cursor else (None, False)
+        objects = list(self.page_queryset(values, backwards))
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+
+        if backwards:
+            objects.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        return CursorPage(
+            objects,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor(objects[-1], False) if has_next and objects else None,
+            previous_cursor=self.encode_cursor(objects[0], True) if has_previous and objects else None,
+        )
+
+
+class CursorPaginationMixin:
+    """
+    A mixin for ListViews that paginates with cursors, in the order given by the
+    view's ordering attribute. Links with a page number (?page=3) still work and use
+    Django's Paginator, so old bookmarks keep working.
+    """
+    cursor_pagination = True
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.cursor_pagination or self.page_kwarg in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size, list(self.get_ordering() or []))
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Invalid page cursor.')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+# the queries reading the number of rows of a table from the statistics of the database
+ESTIMATE_QUERIES = {
+    'postgresql': 'SELECT reltuples FROM pg_class WHERE relname = %s',
+    'mysql': 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+    # written by ANALYZE. The first number of stat is the number of rows of the
+    # index, fewer than the table for a partial index.
+    'sqlite': "SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s",
+}
+
+
+def estimate_count(model, using):
+    """
+    Args:
+        model (Model): the model of a table
+        using (str): the alias of the database
+
+    Returns:
+        int: the number of rows of the table the database last measured, or None if
+             it does not know, eg before the table was ever analyzed
+    """
+    connection = connections[using]
+    sql = ESTIMATE_QUERIES.get(connection.vendor)
+    if sql is None:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [model._meta.db_table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # eg sqlite_stat1 does not exist until the first ANALYZE
+        return None
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator that estimates the number of objects of an unfiltered queryset
+    over a large table instead of counting them, as COUNT(*) reads every row. The
+    counts of small tables and of filtered querysets are exact.
+    """
+    # below this estimate the table is counted
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimate_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,282 @@
+"""
+Slow query log and N+1 query detector.
+
+With CATALOG_QUERY_LOG set, QueryLogMiddleware watches the queries of every
+request through an execute wrapper of the connections:
+
+- the queries are grouped by fingerprint, their SQL with the values and the
+  lengths of the IN lists taken out, so that the queries of a loop, eg
+
+      SELECT ... FROM "catalog_book" WHERE "catalog_book"."id" = 12
+      SELECT ... FROM "catalog_book" WHERE "catalog_book"."id" = 13
+
+  are the same. When a fingerprint runs CATALOG_NPLUSONE_THRESHOLD times or more
+  in a request, it is logged as an N+1 query, with the url name of the request and
+  where the query came from: the line of the template being rendered, eg
+  catalog/author_detail.html, line 25, or else the line of the code of the site.
+
+- the queries taking CATALOG_SLOW_QUERY_MS or more are logged with their plan, as
+  given by the EXPLAIN of the database. Their parameters can be secrets, eg the
+  key of a session, so they are only logged with CATALOG_QUERY_LOG_PARAMS set,
+  and otherwise left out of the plan too.
+
+Both are logged to the catalog.queries logger, which the settings send to a
+file rotated by an external tool, eg logrotate. Only the queries of the requests are watched, and the stack is only
+looked at for the queries logged, so the detector can run in production.
+"""
+
+import contextvars
+import logging
+import os
+import re
+import sys
+import time
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, NotSupportedError, connections
+from django.db.backends.signals import connection_created
+from django.template.base import Node
+
+logger = logging.getLogger('catalog.queries')
+
+# the log of the request running
+_log = contextvars.ContextVar('catalog_query_log', default=None)
+
+# the frames of these files are the wrappers around the queries, not their origin
+_WRAPPER_FILES = {
+    os.path.join(os.path.dirname(__file__), filename) for filename in ('querylog.py', 'metrics.py', 'templating.py')
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def query_log_enabled():
+    """
+    Returns:
+        bool: whether the queries of the requests are watched
+    """
+    return getattr(settings, 'CATALOG_QUERY_LOG', False)
+
+
+def log_params():
+    """
+    Returns:
+        bool: whether the parameters of the slow queries are logged
+    """
+    return getattr(settings, 'CATALOG_QUERY_LOG_PARAMS', False)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """
+    Args:
+        sql (str): a query
+
+    Returns:
+        str: the query with its values replaced by ? and its lists of values by (...)
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def query_origin():
+    """
+    Returns:
+        str: the template line being rendered, eg 'catalog/author_detail.html, line 25',
+             or else the innermost line of the code of the site running the query, or
+             None if neither is in the stack
+    """
+    base_dir = str(settings.BASE_DIR)
+    code_line = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code is Node.render_annotated.__code__:
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f'{origin.template_name or origin.name}, line {token.lineno}'
+        elif (
+            code_line is None and code.co_filename.startswith(base_dir)
+            and code.co_filename not in _WRAPPER_FILES
+        ):
+            code_line = f'{os.path.relpath(code.co_filename, base_dir)}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return code_line
+
+
+def explain(connection, sql, params):
+    """
+    Args:
+        connection: the connection the query ran on
+        sql (str): the query
+        params: its parameters
+
+    Returns:
+        str: the plan of the query, one row per line, or why there is none
+    """
+    try:
+        prefix = connection.ops.explain_query_prefix()
+    except NotSupportedError:
+        return f'{connection.vendor} does not explain queries'
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            rows = cursor.fetchall()
+    except DatabaseError as error:
+        return f'EXPLAIN failed: {error}'
+    return '\n'.join(' | '.join(str(value) for value in row) for row in rows)
+
+
+class QueryLog:
+    """
+    The queries of one request.
+
+    Args:
+        request (HttpRequest): the request
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.threshold = getattr(settings, 'CATALOG_NPLUSONE_THRESHOLD', 5)
+        self.slow_seconds = getattr(settings, 'CATALOG_SLOW_QUERY_MS', 100) / 1000
+        # fingerprint -> [count, origin of the query that reached the threshold]
+        self.fingerprints = {}
+        # set while the plan of a slow query is read, which is not watched itself
+        self.explaining = False
+
+    def view(self):
+        """
+        Returns:
+            str: the url name of the request, or its path before it is resolved
+        """
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match is not None and match.url_name else self.request.path
+
+    def executed(self, sql, params, many, connection, seconds):
+        """
+        Count a query, and log it if it is slow.
+        """
+        entry = self.fingerprints.setdefault(fingerprint(sql), [0, None])
+        entry[0] += 1
+        if entry[0] == self.threshold:
+            entry[1] = query_origin()
+
+        if seconds >= self.slow_seconds:
+            plan = 'not explained'
+            if not many and sql.lstrip().upper().startswith('SELECT'):
+                self.explaining = True
+                try:
+                    plan = explain(connection, sql, params)
+                finally:
+                    self.explaining = False
+            if log_params():
+                values = repr(params)
+            else:
+                values = 'not logged'
+                # eg PostgreSQL shows the values of the parameters in the plan
+                plan = _STRING.sub("'?'", plan)
+            logger.warning(
+                'Slow query (%.1f ms) on %s (%s) from %s:\n%s\nparams: %s\nEXPLAIN:\n%s',
+                seconds * 1000, self.view(), self.request.path, query_origin(), sql, values, plan,
+            )
+
+    def repeated(self):
+        """
+        Returns:
+            list: (fingerprint, count, origin) of the queries run at least threshold times,
+                  most run first
+        """
+        repeated = [
+            (sql, count, origin) for sql, (count, origin) in self.fingerprints.items() if count >= self.threshold
+        ]
+        return sorted(repeated, key=lambda query: query[1], reverse=True)
+
+    def finish(self):
+        """
+        Log the N+1 queries of the request.
+        """
+        for sql, count, origin in self.repeated():
+            logger.warning(
+                'N+1 query on %s (%s): %d x %s, from %s', self.view(), self.request.path, count, sql, origin,
+            )
+
+
+def _watch_query(execute, sql, params, many, context):
+    log = _log.get()
+    if log is None or log.explaining:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    log.executed(sql, params, many, context['connection'], time.perf_counter() - start)
+    return result
+
+
+def _watch_connection(sender=None, connection=None, **kwargs):
+    """
+    Watch the queries of a connection for the log of the request running them.
+    """
+    if _watch_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_watch_query)
+
+
+def install():
+    """
+    Watch the queries of the connections. Installing it twice does nothing.
+    """
+    connection_created.connect(_watch_connection, dispatch_uid='catalog_query_log')
+    for connection in connections.all():
+        _watch_connection(connection=connection)
+
+
+class QueryLogMiddleware:
+    """
+    Log the slow and the N+1 queries of the requests when CATALOG_QUERY_LOG is set.
+    Under ASGI it runs on the event loop, so the async views are not moved to a
+    thread because of it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not query_log_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        log = QueryLog(request)
+        token = _log.set(log)
+        try:
+            response = self.get_response(request)
+        finally:
+            _log.reset(token)
+        log.finish()
+        return response
+
+    async def __acall__(self, request):
+        # the threads running the queries of the view get a copy of the context, and
+        # with it the log of the request
+        log = QueryLog(request)
+        token = _log.set(log)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _log.reset(token)
+        log.finish()
+        return response
@@ -0,0 +1,107 @@
+"""
+Renewal of many copies at once.
+
+A librarian renewing a class set would otherwise post the renewal form once per
+copy, and every post loads the copy and saves all of its columns. Here the copies
+are loaded with one query, every renewal date is validated with the rules of
+RenewBookForm, and the valid renewals are written with a single bulk_update in
+one transaction. bulk_update does not send signals, so the availability
+counters, the cached pages of the books and the API ETags are updated here.
+"""
+
+import datetime
+import uuid
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import availability
+from .api import invalidate_api
+from .forms import RenewBookForm
+from .fragments import invalidate_fragments
+from .models import Book, BookInstance
+
+
+def _validate_date(renewal_date):
+    """
+    Args:
+        renewal_date: a date or a string in a format accepted by RenewBookForm
+
+    Returns:
+        tuple: the cleaned date, or None and the list of error messages
+    """
+    # the dates of a JSON body can be any JSON value, which the form cannot parse
+    if renewal_date is not None and not isinstance(renewal_date, (str, datetime.date)):
+        return None, ['Enter a valid date.']
+    form = RenewBookForm(data={'renewal_date': renewal_date})
+    if form.is_valid():
+        return form.cleaned_data['renewal_date'], []
+    return None, form.errors['renewal_date']
+
+
+def renew_copies(renewals, renewal_date=None):
+    """
+    Renew some copies.
+
+    Args:
+        renewals (list): the copies to renew, as their ids or as dicts with an 'id' and
+            optionally a 'renewal_date' for that copy
+        renewal_date: the renewal date of the copies that do not have their own
+
+    Returns:
+        list: a result for every renewal, in order. A result has the 'id' of the copy,
+              its 'status' ('renewed' or 'invalid') and either the new 'due_back' or
+              the 'errors'.
+    """
+    results = []
+    valid = {}
+    for renewal in renewals:
+        if not isinstance(renewal, dict):
+            renewal = {'id': renewal}
+        result = {'id': str(renewal.get('id')), 'status': 'invalid'}
+        results.append(result)
+
+        try:
+            copy_id = uuid.UUID(str(renewal.get('id')))
+        except ValueError:
+            result['errors'] = ['Invalid copy id.']
+            continue
+        result['id'] = str(copy_id)
+        if copy_id in valid:
+            result['errors'] = ['The copy is renewed more than once.']
+            continue
+
+        due_back, errors = _validate_date(renewal.get('renewal_date', renewal_date))
+        if errors:
+            result['errors'] = errors
+            continue
+        valid[copy_id] = (result, due_back)
+
+    if not valid:
+        return results
+
+    now = timezone.now()
+    with transaction.atomic():
+        copies = BookInstance.objects.select_for_update().in_bulk(list(valid))
+        before, after = Counter(), Counter()
+        for copy_id, (result, due_back) in valid.items():
+            copy = copies.get(copy_id)
+            if copy is None:
+                result['errors'] = ['No copy with this id.']
+                continue
+            before.update(availability.copy_state(copy.book_id, copy.status, copy.overdue))
+            copy.due_back = due_back
+            copy.updated_at = now
+            copy.refresh_overdue()
+            after.update(availability.copy_state(copy.book_id, copy.status, copy.overdue))
+            result.update(status='renewed', due_back=due_back.isoformat())
+
+        renewed = [copies[copy_id] for copy_id in valid if copy_id in copies]
+        # the overdue flag is written too, a renewed copy is no longer overdue
+        BookInstance.objects.bulk_update(renewed, ['due_back', 'overdue', 'days_overdue', 'updated_at'])
+        availability.apply_changes(before, after)
+
+    invalidate_fragments(Book, {copy.book_id for copy in renewed})
+    invalidate_api(BookInstance, Book)
+    return results
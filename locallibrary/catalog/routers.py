@@ -0,0 +1,133 @@
+"""
+Routing of the catalog reads to read replicas.
+
+The catalog is read far more than it is written, so the reads of the catalog
+models can be spread over replicas of the default database, listed by alias in
+the CATALOG_READ_REPLICAS setting. Everything else (the writes, and the reads of
+the users, sessions and admin log) stays on the default database, the primary.
+
+A replica lags behind the primary, so reads go to the primary when they must see
+a write that was just made:
+
+- inside a transaction on the primary, eg the row locks of catalog/loans.py;
+- for the rest of a request after it wrote to the primary;
+- for a few seconds after a request that wrote, eg the page a librarian is
+  redirected to after renewing a copy. PrimaryPinningMiddleware pins the
+  browser to the primary with a cookie for CATALOG_PRIMARY_PIN_SECONDS.
+- for a few seconds after the version of a cached namespace was bumped, in the
+  requests of every browser that read the namespace (see catalog/cache.py).
+  Otherwise a request could fill the new version from a replica that has not
+  caught up yet, and the stale data would stay cached until the next change.
+
+The state is kept in a context variable, so each request (and each thread of a
+management command) is pinned on its own.
+"""
+
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# the app whose reads go to the replicas
+REPLICATED_APP = 'catalog'
+
+# the name of the cookie that pins a browser to the primary
+PIN_COOKIE = 'pin_primary'
+
+_pinned = contextvars.ContextVar('catalog_primary_pinned', default=False)
+_wrote = contextvars.ContextVar('catalog_wrote_to_primary', default=False)
+
+
+def read_replicas():
+    """
+    Returns:
+        list: the aliases of the databases the catalog reads can go to
+    """
+    return getattr(settings, 'CATALOG_READ_REPLICAS', [])
+
+
+def pin_seconds():
+    """
+    Returns:
+        int: how long the reads go to the primary after a write, in seconds
+    """
+    return getattr(settings, 'CATALOG_PRIMARY_PIN_SECONDS', 5)
+
+
+def start_pinning(pinned=False):
+    """
+    Start tracking the writes of a request or thread.
+
+    Args:
+        pinned (bool): whether the reads go to the primary from the start, eg
+            because the browser wrote a moment ago
+
+    Returns:
+        tuple: the tokens to restore the previous state with stop_pinning
+    """
+    return _pinned.set(pinned), _wrote.set(False)
+
+
+def stop_pinning(tokens):
+    """
+    Args:
+        tokens (tuple): the tokens returned by start_pinning
+    """
+    pinned, wrote = tokens
+    _wrote.reset(wrote)
+    _pinned.reset(pinned)
+
+
+def pin_to_primary():
+    """
+    Send the reads of the rest of the current request or thread to the primary.
+    """
+    _pinned.set(True)
+
+
+def wrote_to_primary():
+    """
+    Returns:
+        bool: whether the current request or thread wrote to the primary
+    """
+    return _wrote.get()
+
+
+def is_pinned():
+    """
+    Returns:
+        bool: whether the reads of the current request or thread go to the primary
+    """
+    return _pinned.get() or _wrote.get()
+
+
+class PrimaryReplicaRouter:
+    """
+    Database router sending the reads of the catalog models to a random replica,
+    unless they must see recent writes, and every write to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != REPLICATED_APP or is_pinned():
+            return DEFAULT_DB_ALIAS
+        replicas = read_replicas()
+        if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # what is read after a write must see it
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, *read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replicas get their schema from the primary
+        return db not in read_replicas()
@@ -0,0 +1,389 @@
+"""
+Full-text search over the books of the catalog.
+
+Every book has a search document made of its title, summary, isbn, the name of
+its author and the names of its genres. The documents are stored in a full-text
+index inside the catalog database:
+
+    * SQLite: an FTS5 virtual table ranked with bm25
+    * PostgreSQL: a table of weighted tsvectors with a GIN index, ranked with ts_rank
+
+Other databases fall back to a LIKE search without an index. The documents are
+kept up to date by the receivers in catalog/signals.py, which reindex only the
+books affected by a change, and can be rebuilt with the rebuild_search_index
+command.
+"""
+
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Book
+
+# name of the table that holds the search documents
+INDEX_TABLE = 'catalog_book_search'
+
+# number of books reindexed per query when the whole index is rebuilt
+REBUILD_BATCH_SIZE = 2000
+
+# SQL expressions for the columns of a search document, selected from the book
+# table aliased b joined to the author table aliased a
+DOCUMENT_COLUMNS = {
+    'title': 'b.title',
+    'summary': 'b.summary',
+    'isbn': 'b.isbn',
+    'authors': "COALESCE(a.first_name, '') || ' ' || COALESCE(a.last_name, '')",
+}
+
+
+def search_terms(query):
+    """
+    Split what a user typed into search terms. Only letters and digits are kept so
+    the operators of the full-text query languages cannot be injected.
+
+    Args:
+        query (str): the text typed in the search box
+
+    Returns:
+        list: the lowercase search terms
+    """
+    return [term.lower() for term in re.findall(r'\w+', query or '')]
+
+
+class SearchBackend:
+    """
+    Base class of the search backends. A backend owns the full-text index of one
+    database connection.
+
+    Args:
+        connection: the database connection that holds the catalog tables
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create(self):
+        """Create the index tables. Called by the catalog migrations."""
+
+    def drop(self):
+        """Drop the index tables. Called when the migration is reversed."""
+
+    def index_books(self, book_ids):
+        """
+        Rebuild the search documents of some books, eg after one of them is saved.
+        Books that no longer exist are removed from the index.
+
+        Args:
+            book_ids (iterable): the primary keys of the books to reindex
+        """
+
+    def remove_books(self, book_ids):
+        """
+        Args:
+            book_ids (iterable): the primary keys of the books to remove from the index
+        """
+
+    def rebuild(self):
+        """Rebuild the search documents of every book in batches."""
+        book_ids = Book.objects.using(self.connection.alias).order_by('pk').values_list('pk', flat=True)
+        batch = []
+        for book_id in book_ids.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            batch.append(book_id)
+            if len(batch) == REBUILD_BATCH_SIZE:
+                self.index_books(batch)
+                batch = []
+        if batch:
+            self.index_books(batch)
+
+    def search(self, terms, limit, offset=0):
+        """
+        Args:
+            terms (list): the search terms, see search_terms
+            limit (int): the maximum number of results
+            offset (int): the number of best results to skip
+
+        Returns:
+            list: the primary keys of the matching books, the best match first
+        """
+        raise NotImplementedError
+
+    def count(self, terms):
+        """
+        Args:
+            terms (list): the search terms, see search_terms
+
+        Returns:
+            int: the number of books matching the terms
+        """
+        raise NotImplementedError
+
+    def _documents_sql(self, genres_sql, book_ids):
+        """
+        Build the SELECT that computes the search documents of some books.
+
+        Args:
+            genres_sql (str): the expression that joins the names of the genres of book b
+            book_ids (list): the primary keys of the books
+
+        Returns:
+            tuple: the SQL and its parameters
+        """
+        columns = ', '.join(DOCUMENT_COLUMNS.values())
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        sql = (
+            f'SELECT b.id, {columns}, COALESCE(({genres_sql}), \'\') '
+            f'FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id '
+            f'WHERE b.id IN ({placeholders})'
+        )
+        return sql, list(book_ids)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    Search backend using an FTS5 virtual table whose rowid is the book id.
+    """
+
+    # bm25 weights of the columns: a match in the title counts the most
+    WEIGHTS = '10.0, 1.0, 5.0, 5.0, 2.0'
+
+    GENRES_SQL = (
+        "SELECT group_concat(g.name, ' ') FROM catalog_book_genre bg "
+        "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id"
+    )
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+                f'title, summary, isbn, authors, genres, tokenize="unicode61 remove_diacritics 2")'
+            )
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+    def index_books(self, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        self.remove_books(book_ids)
+        sql, params = self._documents_sql(self.GENRES_SQL, book_ids)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {INDEX_TABLE} (rowid, title, summary, isbn, authors, genres) {sql}', params
+            )
+
+    def remove_books(self, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid IN ({placeholders})', book_ids)
+
+    def _match(self, terms):
+        # every term must match, as a prefix so that a partly typed word still matches
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, terms, limit, offset=0):
+        if not terms:
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s '
+                f'ORDER BY bm25({INDEX_TABLE}, {self.WEIGHTS}), rowid LIMIT %s OFFSET %s',
+                [self._match(terms), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, terms):
+        if not terms:
+            return 0
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s', [self._match(terms)])
+            return cursor.fetchone()[0]
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    """
+    Search backend using a table of tsvector documents with a GIN index. The title
+    and isbn weigh the most (A), then the author (B), the genres (C) and the
+    summary (D).
+    """
+
+    GENRES_SQL = (
+        "SELECT string_agg(g.name, ' ') FROM catalog_book_genre bg "
+        "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id"
+    )
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ('
+                f'book_id bigint PRIMARY KEY REFERENCES catalog_book (id) ON DELETE CASCADE '
+                f'DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document ON {INDEX_TABLE} USING GIN (document)')
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+    def index_books(self, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        self.remove_books(book_ids)
+        sql, params = self._documents_sql(self.GENRES_SQL, book_ids)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {INDEX_TABLE} (book_id, document) '
+                f"SELECT d.id, setweight(to_tsvector('english', d.title), 'A') "
+                f"|| setweight(to_tsvector('simple', d.isbn), 'A') "
+                f"|| setweight(to_tsvector('simple', d.authors), 'B') "
+                f"|| setweight(to_tsvector('english', d.genres), 'C') "
+                f"|| setweight(to_tsvector('english', d.summary), 'D') "
+                f'FROM ({sql}) AS d (id, title, summary, isbn, authors, genres)',
+                params,
+            )
+
+    def remove_books(self, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE book_id = ANY(%s)', [book_ids])
+
+    def _query(self, terms):
+        # every term must match, as a prefix so that a partly typed word still matches
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search(self, terms, limit, offset=0):
+        if not terms:
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT book_id FROM {INDEX_TABLE}, to_tsquery('english', %s) query "
+                f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, book_id LIMIT %s OFFSET %s',
+                [self._query(terms), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, terms):
+        if not terms:
+            return 0
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {INDEX_TABLE} WHERE document @@ to_tsquery('english', %s)",
+                [self._query(terms)],
+            )
+            return cursor.fetchone()[0]
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    Fallback for databases without a supported full-text index. It keeps no index
+    and searches the book columns directly, so it is only fit for small catalogs.
+    """
+
+    def _queryset(self, terms):
+        queryset = Book.objects.using(self.connection.alias)
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(summary__icontains=term) | Q(isbn__icontains=term)
+                | Q(author__first_name__icontains=term) | Q(author__last_name__icontains=term)
+                | Q(genre__name__icontains=term)
+            )
+        return queryset.distinct()
+
+    def rebuild(self):
+        pass
+
+    def search(self, terms, limit, offset=0):
+        if not terms:
+            return []
+        return list(self._queryset(terms).order_by('title', 'pk').values_list('pk', flat=True)[offset:offset + limit])
+
+    def count(self, terms):
+        return self._queryset(terms).count() if terms else 0
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_backend(connection=None):
+    """
+    Args:
+        connection: the database connection to search, the one the catalog books
+                    are read from by default
+
+    Returns:
+        SearchBackend: the search backend for the database engine of the connection
+    """
+    if connection is None:
+        connection = connections[router.db_for_read(Book)]
+    return BACKENDS.get(connection.vendor, LikeSearchBackend)(connection)
+
+
+def index_books(book_ids):
+    """
+    Reindex some books in the database the books are written to.
+
+    Args:
+        book_ids (iterable): the primary keys of the books to reindex
+    """
+    get_backend(connections[router.db_for_write(Book)]).index_books(book_ids)
+
+
+def remove_books(book_ids):
+    """
+    Args:
+        book_ids (iterable): the primary keys of the books to remove from the index
+    """
+    get_backend(connections[router.db_for_write(Book)]).remove_books(book_ids)
+
+
+class SearchResults:
+    """
+    The ranked results of a search, loaded one page at a time. It supports len()
+    and slicing so that it can be given to a Django Paginator: only the ids of the
+    requested page are read from the index, then those books are loaded in one
+    query.
+
+    Args:
+        query (str): the text typed in the search box
+    """
+
+    def __init__(self, query):
+        self.terms = search_terms(query)
+        self.backend = get_backend()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.terms)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        offset = index.start or 0
+        limit = (index.stop if index.stop is not None else self.count()) - offset
+        if limit <= 0:
+            return []
+
+        book_ids = self.backend.search(self.terms, limit=limit, offset=offset)
+        books = Book.objects.select_related('author').only(
+            'title', 'summary', 'isbn', 'author__first_name', 'author__last_name'
+        ).in_bulk(book_ids)
+
+        # keep the order of the ranking, skipping ids of books deleted in the meantime
+        return [books[book_id] for book_id in book_ids if book_id in books]
@@ -0,0 +1,259 @@
+"""
+Signal receivers that keep the cached data, the cached detail pages, the API
+ETags and the search index of the catalog app up to date. The receivers are
+connected when the app is ready (see CatalogConfig.ready).
+"""
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import availability, holds, search
+from .api import invalidate_api
+from .autocomplete import invalidate_autocomplete
+from .fragments import invalidate_fragments
+from .models import Author, Book, BookInstance, Genre, Language
+from .stats import invalidate_index_statistics
+
+# models whose rows are counted on the home page
+STATISTICS_MODELS = (Author, Book, BookInstance, Genre)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def catalog_changed(sender, **kwargs):
+    """
+    Invalidate the home page statistics whenever one of the counted models is
+    created, updated or deleted.
+
+    Args:
+        sender (Model): the model class of the instance that changed
+    """
+    if sender in STATISTICS_MODELS:
+        invalidate_index_statistics()
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed(sender, action, **kwargs):
+    """
+    Invalidate the home page statistics when the genres of a book change.
+
+    Args:
+        sender (Model): the intermediate model between Book and Genre
+        action (str): the kind of change, eg 'post_add'
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_index_statistics()
+
+
+# Full-text search index. Only the books whose search document changes are
+# reindexed: a book when it is saved, the books of an author or genre when the
+# author or genre is renamed or deleted, and a book when its genres change.
+
+def _related_book_ids(instance):
+    """
+    Args:
+        instance (Author or Genre): an object that appears in the search documents
+
+    Returns:
+        list: the primary keys of the books whose documents contain the object
+    """
+    return list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, **kwargs):
+    search.index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    search.remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def book_relation_saved(sender, instance, created, **kwargs):
+    if not created:
+        search.index_books(_related_book_ids(instance))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+def book_relation_deleting(sender, instance, **kwargs):
+    # the links to the books are gone by the time post_delete is sent, so remember
+    # which books have to be reindexed
+    instance._search_book_ids = _related_book_ids(instance)
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def book_relation_deleted(sender, instance, **kwargs):
+    search.index_books(getattr(instance, '_search_book_ids', []))
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_reindex(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Reindex the books whose genres changed. The change can be made from either
+    side of the relation: book.genre.add(genre) or genre.book_set.add(book).
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index_books([instance.pk])
+    elif action == 'pre_clear':
+        instance._search_book_ids = _related_book_ids(instance)
+    elif action == 'post_clear':
+        search.index_books(getattr(instance, '_search_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        search.index_books(pk_set or [])
+
+
+# Cached detail pages (see catalog/fragments.py). The page of a book shows its
+# author, language, genres and copies, and the page of an author lists their
+# books, so a change to any of them renders the pages that show it again.
+
+def _book_ids_of(instance, stash):
+    """
+    Args:
+        instance (Author, Genre or Language): an object shown on the pages of books
+        stash (str): the attribute where pre_delete remembered the books of the object
+
+    Returns:
+        list: the primary keys of the books that show the object
+    """
+    book_ids = getattr(instance, stash, None)
+    return _related_book_ids(instance) if book_ids is None else book_ids
+
+
+@receiver(pre_save, sender=Book)
+def book_saving(sender, instance, **kwargs):
+    # the page of the previous author lists the book too when it changes author
+    if instance.pk is not None:
+        instance._fragment_author_id = (
+            Book.objects.filter(pk=instance.pk).values_list('author_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_fragments_changed(sender, instance, **kwargs):
+    invalidate_fragments(Book, [instance.pk])
+    invalidate_fragments(Author, [instance.author_id, getattr(instance, '_fragment_author_id', None)])
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def copy_fragments_changed(sender, instance, **kwargs):
+    invalidate_fragments(Book, [instance.book_id])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def author_fragments_changed(sender, instance, **kwargs):
+    invalidate_fragments(Author, [instance.pk])
+    # the books of a deleted author were remembered by book_relation_deleting
+    invalidate_fragments(Book, _book_ids_of(instance, '_search_book_ids'))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def genre_fragments_changed(sender, instance, **kwargs):
+    invalidate_fragments(Book, _book_ids_of(instance, '_search_book_ids'))
+
+
+@receiver(pre_delete, sender=Language)
+def language_deleting(sender, instance, **kwargs):
+    instance._fragment_book_ids = _related_book_ids(instance)
+
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def language_fragments_changed(sender, instance, **kwargs):
+    invalidate_fragments(Book, _book_ids_of(instance, '_fragment_book_ids'))
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_fragments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_fragments(Book, [instance.pk])
+    elif action == 'post_clear':
+        invalidate_fragments(Book, getattr(instance, '_search_book_ids', []))
+    else:
+        invalidate_fragments(Book, pk_set or [])
+
+
+# Availability counters of the books (see catalog/availability.py). The state of
+# a copy in the database is read before it changes and the difference with its
+# new state is applied to the counters of its books.
+
+@receiver(pre_save, sender=BookInstance)
+@receiver(pre_delete, sender=BookInstance)
+def copy_changing(sender, instance, using, **kwargs):
+    instance._availability_before = availability.saved_state(instance, using)
+
+
+@receiver(post_save, sender=BookInstance)
+def copy_saved(sender, instance, using, **kwargs):
+    after = availability.copy_state(instance.book_id, instance.status, instance.overdue)
+    availability.apply_changes(getattr(instance, '_availability_before', {}), after, using)
+
+
+@receiver(post_delete, sender=BookInstance)
+def copy_deleted(sender, instance, using, **kwargs):
+    availability.apply_changes(getattr(instance, '_availability_before', {}), {}, using)
+
+
+# Hold queues (see catalog/holds.py). A copy made available by a save, eg in the
+# admin or through the API, goes to the waiting holds of its book once the change
+# is committed. catalog/loans.py and catalog/holds.py change the copies with
+# QuerySet.update and allocate them on their own.
+
+@receiver(post_save, sender=BookInstance)
+def copy_made_available(sender, instance, using, **kwargs):
+    book_id = instance.book_id
+    if instance.status != 'a' or book_id is None:
+        return
+    if getattr(instance, '_availability_before', {}).get((book_id, 'copies_available')):
+        # the copy was already available in this book
+        return
+    transaction.on_commit(lambda: holds.allocate_holds([book_id]), using=using)
+
+
+# ETags of the JSON API (see catalog/api.py). The responses showing a model
+# change with it, and with the models whose changes reach it: the availability
+# counters of a book change with its copies, and a book loses its author,
+# language or genre when they are deleted.
+API_DEPENDENTS = {
+    Book: (Book,),
+    BookInstance: (BookInstance, Book),
+    Author: (Author, Book),
+    Genre: (Genre, Book),
+    Language: (Language, Book),
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def api_objects_changed(sender, **kwargs):
+    if sender in API_DEPENDENTS:
+        invalidate_api(*API_DEPENDENTS[sender])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def api_book_genres_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_api(Book)
+
+
+# the cached autocomplete results of the book forms (see catalog/autocomplete.py)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def autocomplete_objects_changed(sender, **kwargs):
+    invalidate_autocomplete(sender)
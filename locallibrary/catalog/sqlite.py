@@ -0,0 +1,87 @@
+"""
+Tuning of the SQLite connections for production.
+
+Stock SQLite suits a development server: it uses a rollback journal, so a writer
+locks out the readers until it commits, and it syncs the file to disk on every
+commit. The branches that run the library on SQLite serve many readers and a few
+writers at once, which the 'production' profile is tuned for:
+
+- journal_mode=WAL: readers keep reading the last commit while a writer writes;
+- synchronous=NORMAL: with WAL, a commit is only synced at checkpoints. A power
+  cut can lose the last commits but never corrupts the database;
+- busy_timeout: a writer waits for the lock instead of failing at once;
+- mmap_size and cache_size: the pages are read from memory;
+- temp_store=MEMORY: sorts and temporary tables stay in memory.
+
+Set CATALOG_SQLITE_PROFILE to 'production' to apply the pragmas to every new
+SQLite connection. The settings then keep the connections open between
+requests (CONN_MAX_AGE), so the pragmas and the page cache are set up once per
+connection rather than once per request. Compare the throughput with and without
+the profile with the benchmark_sqlite command.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# the pragmas of every profile, applied in order
+PROFILES = {
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        # negative sizes are in KiB
+        'cache_size': -20000,
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def profile_pragmas(profile):
+    """
+    Args:
+        profile (str): the name of a profile, or '' for none
+
+    Returns:
+        dict: the pragmas of the profile
+
+    Raises:
+        ImproperlyConfigured: if there is no such profile
+    """
+    if not profile:
+        return {}
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f'Unknown CATALOG_SQLITE_PROFILE {profile!r}, use one of {", ".join(sorted(PROFILES))}.'
+        )
+
+
+def apply_pragmas(connection, pragmas):
+    """
+    Args:
+        connection: a DB-API connection to an SQLite database
+        pragmas (dict): the values of the pragmas to set
+    """
+    cursor = connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Receiver of connection_created applying the pragmas of CATALOG_SQLITE_PROFILE
+    to the new SQLite connections.
+
+    Args:
+        connection (DatabaseWrapper): the new connection
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = profile_pragmas(getattr(settings, 'CATALOG_SQLITE_PROFILE', ''))
+    if pragmas:
+        apply_pragmas(connection.connection, pragmas)
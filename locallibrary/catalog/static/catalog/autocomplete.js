@@ -0,0 +1,64 @@
+// Autocomplete of the selects rendered by the widgets of catalog/autocomplete.py.
+// A select only holds its chosen options. A search box is added before it, and
+// the objects whose name starts with what is typed are offered as its options.
+(function () {
+  'use strict';
+
+  var DELAY_MS = 200;
+
+  function replaceOptions(select, results) {
+    // keep the chosen options and the empty choice, offer the results after them
+    Array.prototype.slice.call(select.options).forEach(function (option) {
+      if (!option.selected && option.value !== '') {
+        select.removeChild(option);
+      }
+    });
+    var present = {};
+    Array.prototype.forEach.call(select.options, function (option) {
+      present[option.value] = true;
+    });
+    results.forEach(function (result) {
+      if (!present[String(result.id)]) {
+        select.appendChild(new Option(result.text, result.id));
+      }
+    });
+    if (!select.multiple && results.length) {
+      select.size = Math.min(results.length + 1, 10);
+    }
+  }
+
+  function setUp(select) {
+    var input = document.createElement('input');
+    var timer = null;
+    var request = 0;
+    input.type = 'search';
+    input.placeholder = 'Type to search';
+    input.autocomplete = 'off';
+    select.parentNode.insertBefore(input, select);
+
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var current = ++request;
+        var url = select.dataset.autocompleteUrl + '?q=' + encodeURIComponent(input.value);
+        fetch(url, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+          .then(function (response) { return response.json(); })
+          .then(function (data) {
+            // an older answer must not replace the results of what was typed since
+            if (current === request) {
+              replaceOptions(select, data.results);
+            }
+          });
+      }, DELAY_MS);
+    });
+    select.addEventListener('change', function () {
+      if (!select.multiple) {
+        select.size = 0;
+      }
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    Array.prototype.forEach.call(document.querySelectorAll('select[data-autocomplete-url]'), setUp);
+  });
+})();
@@ -0,0 +1,110 @@
+"""
+Statistics displayed on the home page of the catalog app.
+
+All the counters are computed by a single query and then kept in the cache until
+one of the catalog models changes (see catalog/signals.py), so a warm home page
+does not touch the catalog tables at all. The copies are not counted: their
+numbers are summed from the availability counters of the books (see
+catalog/availability.py).
+"""
+
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .cache import bump_version, versioned_key
+from .models import Author, Book, Genre
+
+# name of the versioned cache namespace that holds the index statistics
+STATS_NAMESPACE = 'index-stats'
+
+# the statistics are invalidated by signals, the timeout is only a safety net
+STATS_TIMEOUT = 60 * 60
+
+
+def _aggregate(queryset, **aggregates):
+    """
+    Turn a queryset into a query returning one row with the given aggregates
+    computed over the whole table. Grouping by a constant value stops Django
+    from adding a GROUP BY clause, so the aggregates cover every row.
+
+    Args:
+        queryset (QuerySet): the rows to aggregate
+        aggregates: the aggregate expressions keyed by their column name
+
+    Returns:
+        QuerySet: a values queryset whose SQL can be embedded in another query
+    """
+    return queryset.order_by().annotate(_all=Value(1)).values('_all').annotate(**aggregates).values(*aggregates)
+
+
+def _statistics_querysets():
+    """
+    Returns:
+        list: a one row queryset for every table the home page counts. Rows
+              that are counted from the same table share a single scan using
+              conditional aggregation.
+    """
+    return [
+        _aggregate(
+            Book.objects.all(),
+            num_books=Count('pk'),
+            # get all books with 'The' in the summary
+            the_books=Count('pk', filter=Q(summary__contains='The')),
+            num_instances=Coalesce(Sum('copies_total'), 0),
+            # Available books (status = 'a')
+            num_instances_available=Coalesce(Sum('copies_available'), 0),
+        ),
+        _aggregate(Genre.objects.all(), num_genre=Count('pk')),
+        _aggregate(Author.objects.all(), num_authors=Count('pk')),
+    ]
+
+
+def compute_index_statistics():
+    """
+    Compute the home page counters straight from the database. Every table is
+    aggregated in a derived table and the derived tables are cross joined, so
+    the database returns all the counters in one row from one query.
+
+    Returns:
+        dict: the counters keyed by the names used in the index template
+    """
+    querysets = _statistics_querysets()
+    using = router.db_for_read(Book)
+
+    tables = []
+    params = []
+    for number, queryset in enumerate(querysets):
+        sql, table_params = queryset.query.sql_with_params()
+        tables.append(f'({sql}) stats_{number}')
+        params.extend(table_params)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT * FROM {", ".join(tables)}', params)
+        row = cursor.fetchone()
+        columns = [column[0] for column in cursor.description]
+
+    return dict(zip(columns, row))
+
+
+def get_index_statistics():
+    """
+    Get the home page counters, from the cache when they are there.
+
+    Returns:
+        dict: the counters keyed by the names used in the index template
+    """
+    key = versioned_key(STATS_NAMESPACE)
+    statistics = cache.get(key)
+    if statistics is None:
+        statistics = compute_index_statistics()
+        cache.set(key, statistics, STATS_TIMEOUT)
+    return statistics
+
+
+def invalidate_index_statistics():
+    """
+    Make the next call to get_index_statistics recompute the counters.
+    """
+    bump_version(STATS_NAMESPACE)
@@ -0,0 +1,294 @@
+"""
+Template loading for production, and profiling of the template rendering.
+
+With CATALOG_TEMPLATE_MODE set to 'production' the settings load the templates
+through Django's cached loader, so every template is read and compiled once per
+process instead of on every render, whatever DEBUG is. The templates of the
+site (catalog/templates and templates/registration) are also compiled when the
+process starts (see warm_templates), so the first requests do not pay for it.
+
+With CATALOG_TEMPLATE_PROFILING set, TemplateProfilingMiddleware measures how
+long every template and every {% block %} of a request takes to render, and how
+many queries run while it renders, eg the queries of a loop over a relation that
+was not prefetched. The times are inclusive: a template includes the blocks and
+the templates it renders. The measurements are summed per process and shown to
+the staff by the template_profile page, with the last requests profiled.
+
+Django has no hook around the rendering of a template, so the profiling wraps
+Template._render and BlockNode.render, as Django's test runner does for the
+template_rendered signal. The wrappers only measure inside a profiled request.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import engines
+from django.template.base import Template
+from django.template.loader_tags import BlockNode
+from django.urls import Resolver404, resolve
+
+# the profile of the request being rendered
+_profile = contextvars.ContextVar('catalog_template_profile', default=None)
+
+# the measurements of the process: the totals per template and block, and the last requests
+_lock = threading.Lock()
+_totals = {}
+_requests = deque(maxlen=getattr(settings, 'CATALOG_TEMPLATE_PROFILE_HISTORY', 50))
+
+
+def profiling_enabled():
+    """
+    Returns:
+        bool: whether the rendering of the requests is profiled
+    """
+    return getattr(settings, 'CATALOG_TEMPLATE_PROFILING', False)
+
+
+def site_template_names():
+    """
+    Returns:
+        list: the names of the templates of catalog/templates and of the templates
+              directories of the settings, eg templates/registration
+    """
+    directories = [os.path.join(apps.get_app_config('catalog').path, 'templates')]
+    for engine in settings.TEMPLATES:
+        directories.extend(str(directory) for directory in engine.get('DIRS', []))
+
+    names = []
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith(('.html', '.txt')):
+                    names.append(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/'))
+    return sorted(set(names))
+
+
+def warm_templates():
+    """
+    Compile the templates of the site into the cached loader. Without the cached
+    loader, the templates are only checked for syntax errors.
+
+    Returns:
+        int: the number of templates compiled
+    """
+    engine = engines['django']
+    names = site_template_names()
+    for name in names:
+        engine.get_template(name)
+    return len(names)
+
+
+class Profile:
+    """
+    The measurements of one request.
+
+    Args:
+        path (str): the path of the request
+        view (str): the name of the url of the request
+    """
+
+    def __init__(self, path, view):
+        self.path = path
+        self.view = view
+        self.queries = 0
+        # (calls, seconds, queries) for every template and block
+        self.entries = {}
+
+    def measure(self, name, render):
+        """
+        Args:
+            name (str): the name of the template or block
+            render (callable): renders it
+
+        Returns:
+            str: what render returned
+        """
+        queries = self.queries
+        start = time.perf_counter()
+        try:
+            return render()
+        finally:
+            calls, seconds, count = self.entries.get(name, (0, 0.0, 0))
+            self.entries[name] = (calls + 1, seconds + time.perf_counter() - start, count + self.queries - queries)
+
+
+def _count_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is not None:
+        profile.queries += 1
+    return execute(sql, params, many, context)
+
+
+def _watch_connection(sender=None, connection=None, **kwargs):
+    """
+    Count the queries of a connection for the profile of the request running them.
+    """
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def _profiled_render(render):
+    def _render(self, context):
+        profile = _profile.get()
+        if profile is None:
+            return render(self, context)
+        return profile.measure(f'template {self.name or "<string>"}', lambda: render(self, context))
+    _render.profiled = True
+    return _render
+
+
+def _profiled_block(render):
+    def block_render(self, context):
+        profile = _profile.get()
+        if profile is None:
+            return render(self, context)
+        template = (context.template and context.template.name) or '<string>'
+        return profile.measure(f'block {self.name} of {template}', lambda: render(self, context))
+    block_render.profiled = True
+    return block_render
+
+
+def install():
+    """
+    Wrap the rendering of the templates and blocks and the queries of the
+    connections with the profiling. Installing it twice does nothing.
+    """
+    if not getattr(Template._render, 'profiled', False):
+        Template._render = _profiled_render(Template._render)
+    if not getattr(BlockNode.render, 'profiled', False):
+        BlockNode.render = _profiled_block(BlockNode.render)
+    connection_created.connect(_watch_connection, dispatch_uid='catalog_template_profiling')
+    for connection in connections.all():
+        _watch_connection(connection=connection)
+
+
+def record(profile, seconds):
+    """
+    Add the measurements of a request to the ones of the process.
+
+    Args:
+        profile (Profile): the measurements of the request
+        seconds (float): how long the request took
+    """
+    with _lock:
+        for name, (calls, time_spent, queries) in profile.entries.items():
+            total_calls, total_time, total_queries = _totals.get(name, (0, 0.0, 0))
+            _totals[name] = (total_calls + calls, total_time + time_spent, total_queries + queries)
+        slowest = sorted(profile.entries.items(), key=lambda entry: entry[1][1], reverse=True)
+        _requests.append({
+            'path': profile.path,
+            'view': profile.view,
+            'ms': round(seconds * 1000, 3),
+            'queries': profile.queries,
+            'slowest': [(name, round(time_spent * 1000, 3)) for name, (_, time_spent, _) in slowest[:3]],
+        })
+
+
+def report():
+    """
+    Returns:
+        dict: the templates and blocks, slowest in total first, with their calls, total
+              and mean time in milliseconds and queries per call, and the last requests
+              profiled, most recent first
+    """
+    with _lock:
+        totals = dict(_totals)
+        requests = list(_requests)
+    rows = [
+        {
+            'name': name,
+            'calls': calls,
+            'total_ms': round(seconds * 1000, 3),
+            'mean_ms': round(seconds * 1000 / calls, 3),
+            'queries_per_call': round(queries / calls, 2),
+        }
+        for name, (calls, seconds, queries) in totals.items()
+    ]
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return {'templates': rows, 'requests': requests[::-1]}
+
+
+def reset():
+    """
+    Forget the measurements of the process.
+    """
+    with _lock:
+        _totals.clear()
+        _requests.clear()
+
+
+class TemplateProfilingMiddleware:
+    """
+    Profile the rendering of the requests when CATALOG_TEMPLATE_PROFILING is set.
+    The template_profile page itself is not profiled. Under ASGI it runs on the
+    event loop, so the async views are not moved to a thread because of it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # installed with the first request rather than when the app is ready, as the
+        # test runner replaces Template._render in between
+        install()
+
+    def profiled(self, request):
+        """
+        Returns:
+            Profile: the profile of the request, or None if it is not profiled
+        """
+        try:
+            view = resolve(request.path_info).url_name
+        except Resolver404:
+            view = None
+        return None if view == 'template-profile' else Profile(request.path, view)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = self.profiled(request)
+        if profile is None:
+            return self.get_response(request)
+
+        token = _profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            # a TemplateResponse renders once the view has returned
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+        finally:
+            _profile.reset(token)
+        record(profile, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        profile = self.profiled(request)
+        if profile is None:
+            return await self.get_response(request)
+
+        # the threads rendering the templates of the view get a copy of the context,
+        # and with it the profile of the request
+        token = _profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            if hasattr(response, 'render') and callable(response.render):
+                await sync_to_async(response.render)()
+        finally:
+            _profile.reset(token)
+        record(profile, time.perf_counter() - start)
+        return response
@@ -0,0 +1,15 @@
+"""
+The urls of the site with the async read-only catalog pages, as locallibrary/asgi.py serves them.
+"""
+
+from django.urls import URLPattern, include, path
+
+from catalog import urls as catalog_urls
+
+urlpatterns = [
+    path('catalog/', include([
+        URLPattern(pattern.pattern, catalog_urls.async_read_views.get(pattern.name, pattern.callback), name=pattern.name)
+        for pattern in catalog_urls.urlpatterns
+    ])),
+    path('accounts/', include('django.contrib.auth.urls')),
+]
@@ -0,0 +1,185 @@
+import datetime
+import json
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import loans
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.tests.utils import QueryBudgetMixin
+
+
+def collection_url(resource, **params):
+    url = reverse('api-collection', args=[resource])
+    return url + '?' + '&'.join(f'{name}={value}' for name, value in params.items()) if params else url
+
+
+class ApiReadTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.librarian = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.language = Language.objects.create(name='English', code='en')
+        cls.genres = [Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Poetry')]
+        cls.books = [cls.add_book(number) for number in range(3)]
+        cls.copy = BookInstance.objects.create(
+            book=cls.books[0], imprint='Imprint', status='o', borrower=cls.user,
+            due_back=datetime.date.today() + datetime.timedelta(days=5),
+        )
+
+    @classmethod
+    def add_book(cls, number):
+        book = Book.objects.create(
+            title=f'Book {number:03d}', summary='Summary', isbn=f'{number:013d}',
+            author=cls.author, language=cls.language,
+        )
+        book.genre.set(cls.genres)
+        return book
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+
+    def test_list(self):
+        response = self.client.get(collection_url('books'))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([book['title'] for book in body['data']], ['Book 000', 'Book 001', 'Book 002'])
+        self.assertEqual(body['data'][0]['author'], self.author.pk)
+        self.assertEqual(body['data'][0]['genre'], [genre.pk for genre in self.genres])
+        self.assertEqual(body['data'][0]['copies_on_loan'], 1)
+        self.assertIsNone(body['next'])
+
+    def test_sparse_fieldset_selects_only_the_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(collection_url('books', fields='title'))
+        self.assertEqual(response.json()['data'][0], {'id': self.books[0].pk, 'title': 'Book 000'})
+        query = next(query['sql'] for query in context.captured_queries if 'FROM "catalog_book"' in query['sql'])
+        self.assertNotIn('summary', query)
+
+    def test_unknown_fields(self):
+        self.assertEqual(self.client.get(collection_url('books', fields='secret')).status_code, 400)
+        self.assertEqual(self.client.get(collection_url('books', include='summary')).status_code, 400)
+        self.assertEqual(self.client.get(collection_url('shelves')).status_code, 404)
+
+    def test_included_relations_take_a_fixed_number_of_queries(self):
+        url = collection_url('books', include='author,genre,language')
+        response = self.client.get(url)
+        book = response.json()['data'][0]
+        self.assertEqual(book['author']['last_name'], 'Smith')
+        self.assertEqual(book['language'], {'id': self.language.pk, 'name': 'English', 'code': 'en'})
+        self.assertEqual([genre['name'] for genre in book['genre']], ['Fantasy', 'Poetry'])
+        # the session, the user, the books with their author and language, the genres
+        self.assertConstantQueries(url, 4, lambda: [self.add_book(number) for number in range(3, 10)])
+
+    def test_cursor_pagination(self):
+        body = self.client.get(collection_url('books', fields='title', limit=2)).json()
+        self.assertEqual([book['title'] for book in body['data']], ['Book 000', 'Book 001'])
+        body = self.client.get(body['next']).json()
+        self.assertEqual([book['title'] for book in body['data']], ['Book 002'])
+        self.assertIsNone(body['next'])
+        self.assertIsNotNone(body['previous'])
+        self.assertEqual(self.client.get(collection_url('books', cursor='bad')).status_code, 400)
+
+    def test_detail(self):
+        response = self.client.get(reverse('api-detail', args=['copies', self.copy.pk]) + '?include=book')
+        copy = response.json()['data']
+        self.assertEqual(copy['book']['title'], 'Book 000')
+        self.assertEqual(copy['status'], 'o')
+        # only the librarians see who borrowed a copy
+        self.assertNotIn('borrower', copy)
+        self.assertEqual(self.client.get(reverse('api-detail', args=['copies', 'nope'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api-detail', args=['books', 999])).status_code, 404)
+
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('api-detail', args=['copies', self.copy.pk]))
+        self.assertEqual(response.json()['data']['borrower'], self.user.pk)
+
+    def test_etag(self):
+        url = collection_url('books', include='author')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        # polling an unchanged collection does not query the catalog
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in context.captured_queries if 'catalog_' in query['sql']])
+
+        # a change to a book, an author or a copy changes the ETag
+        for change in (
+            lambda: self.author.save(),
+            lambda: loans.return_copy(self.copy),
+            lambda: self.books[1].genre.clear(),
+        ):
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(collection_url('books')).status_code, 401)
+
+
+class ApiWriteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.editor = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        cls.editor.user_permissions.add(*Permission.objects.filter(codename__in=[
+            'add_book', 'change_book', 'delete_book', 'delete_author',
+        ]))
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.genre = Genre.objects.create(name='Fantasy')
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+
+    def send(self, method, url, payload):
+        return getattr(self.client, method)(url, json.dumps(payload), content_type='application/json')
+
+    def test_create_update_delete(self):
+        response = self.send('post', collection_url('books'), {
+            'title': 'New Book', 'summary': 'Summary', 'isbn': '1234567890123',
+            'author': self.author.pk, 'genre': [self.genre.pk],
+        })
+        self.assertEqual(response.status_code, 201)
+        book = response.json()['data']
+        self.assertEqual((book['title'], book['genre'], book['copies_total']), ('New Book', [self.genre.pk], 0))
+
+        url = reverse('api-detail', args=['books', book['id']])
+        response = self.send('patch', url, {'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['summary'], 'Summary')
+        self.assertEqual(Book.objects.get(pk=book['id']).genre.get(), self.genre)
+
+        # a book with copies cannot be deleted
+        BookInstance.objects.create(book_id=book['id'], imprint='Imprint', status='a')
+        self.assertEqual(self.client.delete(url).status_code, 409)
+        BookInstance.objects.all().delete()
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Book.objects.exists())
+
+    def test_invalid_objects(self):
+        response = self.send('post', collection_url('books'), {'title': 'New Book'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('summary', response.json()['errors'])
+        self.assertEqual(self.send('post', collection_url('books'), {'copies_total': 5}).status_code, 400)
+        self.assertEqual(self.client.post(collection_url('books'), '{', content_type='application/json').status_code, 400)
+
+    def test_permissions(self):
+        self.assertEqual(self.send('post', collection_url('authors'), {'first_name': 'Jane'}).status_code, 403)
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.send('post', collection_url('books'), {'title': 'New Book'}).status_code, 403)
+        response = self.client.delete(reverse('api-detail', args=['authors', self.author.pk]))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.delete(collection_url('books')).status_code, 405)
@@ -0,0 +1,139 @@
+import asyncio
+import datetime
+import threading
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from catalog import async_views, metrics
+from catalog.models import Author, Book, BookInstance, Hold
+
+
+@override_settings(ROOT_URLCONF='catalog.tests.async_urls', CATALOG_ASYNC_PARALLEL_QUERIES=False)
+class AsyncViewsTest(TestCase):
+    """
+    The async pages show the same content as the sync ones. The TestCase
+    transaction is only visible to the request thread, so the steps run in turn.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG', author=cls.author)
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint='Imprint', status='o', borrower=cls.user,
+            due_back=datetime.date.today() + datetime.timedelta(days=5),
+        )
+        Hold.objects.create(book=cls.book, user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.async_client.force_login(self.user)
+
+    async def test_pages(self):
+        pages = {
+            reverse('index'): 'The Library has the following books counts',
+            reverse('books'): 'Book Title',
+            reverse('book-detail', args=[self.book.pk]): 'Imprint',
+            reverse('authors'): 'Smith',
+            reverse('author-detail', args=[self.author.pk]): 'Book Title',
+            reverse('my-borrowed'): 'waiting since',
+        }
+        for url, text in pages.items():
+            response = await self.async_client.get(url)
+            self.assertContains(response, text, msg_prefix=url)
+
+    async def test_the_views_are_async(self):
+        match = await sync_to_async(lambda: self.client.get(reverse('books')).resolver_match)()
+        self.assertTrue(asyncio.iscoroutinefunction(match.func))
+
+    async def test_index_counts_visits(self):
+        await self.async_client.get(reverse('index'))
+        response = await self.async_client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 1)
+
+    async def test_login_required(self):
+        await sync_to_async(self.async_client.logout)()
+        for url in (reverse('index'), reverse('books'), reverse('book-detail', args=[self.book.pk])):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 302, url)
+            self.assertTrue(response.url.startswith('/accounts/login'), url)
+
+    async def test_missing_book(self):
+        response = await self.async_client.get(reverse('book-detail', args=[self.book.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    ROOT_URLCONF='catalog.tests.async_urls', CATALOG_ASYNC_PARALLEL_QUERIES=False, DEBUG=True,
+    CATALOG_METRICS=True, CATALOG_METRICS_SAMPLE_RATE=1.0, CATALOG_QUERY_LOG=True, CATALOG_TEMPLATE_PROFILING=True,
+)
+class AsyncMiddlewareTest(TestCase):
+    """
+    The middleware of the catalog runs on the event loop under ASGI, so an async
+    view is not run in a thread because of the middleware around it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        # the middleware is set up on the event loop, which does not see the connection
+        # the test opened on this thread before
+        metrics.install()
+        self.async_client.force_login(self.user)
+
+    async def test_the_middleware_is_not_adapted(self):
+        # Django logs every middleware it wraps in sync_to_async when DEBUG is on
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            response = await self.async_client.get(reverse('books'))
+        self.assertContains(response, 'Book Title')
+
+        # the queries run in the threads of the view are still measured
+        counters, _ = metrics.collect()
+        self.assertGreater(counters[('catalog_db_queries_total', (('view', 'books'),))], 0)
+
+
+@override_settings(ROOT_URLCONF='catalog.tests.async_urls', CATALOG_ASYNC_PARALLEL_QUERIES=True)
+class AsyncParallelQueriesTest(TransactionTestCase):
+    """
+    Outside a transaction the independent steps of a page run on their own
+    threads and connections.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        self.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', borrower=self.user)
+        self.async_client.force_login(self.user)
+
+    async def test_gather_runs_the_steps_at_once(self):
+        # both steps must be running for either to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def step(name):
+            barrier.wait()
+            return name
+
+        results = await async_views.gather(lambda: step('first'), lambda: step('second'))
+        self.assertEqual(results, ['first', 'second'])
+
+    async def test_pages(self):
+        pages = {
+            reverse('index'): 'The Library has the following books counts',
+            reverse('books'): 'Book Title',
+            reverse('my-borrowed'): 'Book Title',
+        }
+        for url, text in pages.items():
+            response = await self.async_client.get(url)
+            self.assertContains(response, text, msg_prefix=url)
@@ -0,0 +1,143 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog import autocomplete
+from catalog.forms import BookForm
+from catalog.models import Author, Book, Genre, Language
+
+
+class AutocompleteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.austen = Author.objects.create(first_name='Jane', last_name='Austen')
+        cls.auster = Author.objects.create(first_name='Paul', last_name='Auster')
+        cls.smith = Author.objects.create(first_name='Zadie', last_name='Smith')
+        for name in ('Fantasy', 'Fiction', 'History'):
+            Genre.objects.create(name=name)
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.hot_prefixes.clear()
+        self.client.force_login(self.user)
+
+    def lookup(self, source, prefix):
+        response = self.client.get(reverse('autocomplete', args=[source]), {'q': prefix})
+        self.assertEqual(response.status_code, 200)
+        return [result['text'] for result in response.json()['results']]
+
+    def test_prefix_of_any_case(self):
+        self.assertEqual(self.lookup('authors', 'AUST'), ['Austen, Jane', 'Auster, Paul'])
+        self.assertEqual(self.lookup('authors', 'austen'), ['Austen, Jane'])
+        self.assertEqual(self.lookup('genres', 'f'), ['Fantasy', 'Fiction'])
+        self.assertEqual(self.lookup('genres', 'x'), [])
+
+    def test_non_ascii_names(self):
+        Author.objects.create(first_name='Émile', last_name='Zola')
+        Author.objects.create(first_name='Kurt', last_name='Ölsner')
+        # the folded names are filled by bulk_create too
+        Author.objects.bulk_create([Author(first_name='Σοφία', last_name='Weißmann')])
+        self.assertEqual(self.lookup('authors', 'émi'), ['Zola, Émile'])
+        self.assertEqual(self.lookup('authors', 'ÉMILE'), ['Zola, Émile'])
+        self.assertEqual(self.lookup('authors', 'öls'), ['Ölsner, Kurt'])
+        self.assertEqual(self.lookup('authors', 'ΣΟΦ'), ['Weißmann, Σοφία'])
+        # folding turns ß into ss, on both sides
+        self.assertEqual(self.lookup('authors', 'weiss'), ['Weißmann, Σοφία'])
+
+    def test_first_name(self):
+        self.assertEqual(self.lookup('authors', 'zad'), ['Smith, Zadie'])
+
+    def test_empty_prefix_lists_the_first_objects(self):
+        self.assertEqual(self.lookup('genres', ''), ['Fantasy', 'Fiction', 'History'])
+
+    def test_results_are_limited(self):
+        for number in range(autocomplete.MAX_RESULTS + 5):
+            Genre.objects.create(name=f'Fable {number:02}')
+        self.assertEqual(len(self.lookup('genres', 'fab')), autocomplete.MAX_RESULTS)
+
+    def test_unknown_source(self):
+        response = self.client.get(reverse('autocomplete', args=['users']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('autocomplete', args=['authors']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_hot_prefixes_are_cached(self):
+        autocomplete.search('authors', 'aus')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(autocomplete.search('authors', 'Aus')), 2)
+        # longer prefixes are looked up every time
+        autocomplete.search('authors', 'auste')
+        with self.assertNumQueries(1):
+            autocomplete.search('authors', 'auste')
+
+    def test_change_drops_the_cached_results(self):
+        autocomplete.search('authors', 'aus')
+        Author.objects.create(first_name='Mary', last_name='Austin')
+        self.assertEqual(len(autocomplete.search('authors', 'aus')), 3)
+
+        self.austen.delete()
+        self.assertEqual(len(autocomplete.search('authors', 'aus')), 2)
+
+    def test_prefix_lookup_uses_the_index(self):
+        for source, index in (('authors', 'author_last_name_prefix_idx'), ('genres', 'genre_name_prefix_idx')):
+            sql, params = autocomplete.prefix_queryset(source, 'fa').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn(index, plan, source)
+
+
+class BookFormTest(TestCase):
+    """
+    The book form only renders the chosen author, language and genres.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.authors = [Author.objects.create(first_name='First', last_name=f'Author {number}') for number in range(5)]
+        cls.genres = [Genre.objects.create(name=f'Genre {number}') for number in range(5)]
+        cls.language = Language.objects.create(name='English', code='en')
+        cls.book = Book.objects.create(
+            title='Book Title', summary='Summary', isbn='ABCDEFG', author=cls.authors[0], language=cls.language,
+        )
+        cls.book.genre.set(cls.genres[:2])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_update_form_renders_the_chosen_objects(self):
+        response = self.client.get(reverse('book-update', args=[self.book.pk]))
+        self.assertContains(response, 'data-autocomplete-url="/catalog/autocomplete/authors/"')
+        self.assertContains(response, 'catalog/autocomplete.js')
+        self.assertContains(response, 'Author 0')
+        self.assertNotContains(response, 'Author 1')
+        self.assertContains(response, 'Genre 1')
+        self.assertNotContains(response, 'Genre 2')
+
+    def test_create_form_renders_no_objects(self):
+        response = self.client.get(reverse('book-create'))
+        self.assertNotContains(response, 'Author 0')
+        self.assertNotContains(response, 'Genre 0')
+
+    def test_any_object_can_be_chosen(self):
+        form = BookForm(data={
+            'title': 'Other Title', 'summary': 'Summary', 'isbn': 'HIJKLMN',
+            'author': self.authors[4].pk, 'genre': [self.genres[4].pk], 'language': '',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        book = form.save()
+        self.assertEqual(book.author, self.authors[4])
+        self.assertEqual(list(book.genre.all()), [self.genres[4]])
+
+    def test_invalid_choice(self):
+        form = BookForm(data={'title': 'Other Title', 'summary': 'Summary', 'isbn': 'HIJKLMN', 'author': 'abc'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('author', form.errors)
+        self.assertIn('<select', str(form['author']))
@@ -0,0 +1,102 @@
+import datetime
+import io
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from catalog.availability import COUNTER_FIELDS, recount_availability
+from catalog.fragments import fragment_version
+from catalog.models import Book, BookInstance
+
+
+class AvailabilityCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        cls.other = Book.objects.create(title='Other Title', summary='Summary', isbn='HIJKLMN')
+
+    def counters(self, book):
+        return Book.objects.values(*COUNTER_FIELDS).get(pk=book.pk)
+
+    def assertCounters(self, book, **expected):
+        counters = {field: 0 for field in COUNTER_FIELDS}
+        counters.update(expected)
+        self.assertEqual(self.counters(book), counters)
+
+    def test_new_copies_are_counted(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='r')
+        BookInstance.objects.create(book=self.book, imprint='Imprint')
+        self.assertCounters(
+            self.book, copies_total=3, copies_available=1, copies_reserved=1, copies_maintenance=1,
+        )
+
+    def test_status_change_moves_the_copy(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy.status = 'o'
+        copy.due_back = datetime.date.today() + datetime.timedelta(days=7)
+        copy.save()
+        self.assertCounters(self.book, copies_total=1, copies_on_loan=1)
+
+        # saving again without a change does not count the copy twice
+        copy.save()
+        self.assertCounters(self.book, copies_total=1, copies_on_loan=1)
+
+    def test_overdue_loans_are_counted(self):
+        copy = BookInstance.objects.create(
+            book=self.book, imprint='Imprint', status='o',
+            due_back=datetime.date.today() - datetime.timedelta(days=1),
+        )
+        self.assertCounters(self.book, copies_total=1, copies_on_loan=1, copies_overdue=1)
+
+        copy.status = 'a'
+        copy.due_back = None
+        copy.save()
+        self.assertCounters(self.book, copies_total=1, copies_available=1)
+
+    def test_copy_moved_to_another_book(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy.book = self.other
+        copy.save()
+        self.assertCounters(self.book)
+        self.assertCounters(self.other, copies_total=1, copies_available=1)
+
+    def test_deleted_copies_are_uncounted(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy.delete()
+        self.assertCounters(self.book)
+
+    def test_recount_repairs_the_counters(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(
+            book=self.book, imprint='Imprint', status='o',
+            due_back=datetime.date.today() - datetime.timedelta(days=3),
+        )
+        expected = self.counters(self.book)
+        Book.objects.update(copies_total=10, copies_available=0, copies_overdue=5)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(recount_availability([self.book.pk]), 1)
+        self.assertEqual(self.counters(self.book), expected)
+        # the other book was not recounted
+        self.assertEqual(self.counters(self.other)['copies_total'], 10)
+
+    def test_recount_availability_command(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        Book.objects.update(copies_total=0, copies_available=0)
+
+        out = io.StringIO()
+        call_command('recount_availability', stdout=out)
+        self.assertIn('2 books', out.getvalue())
+        self.assertCounters(self.book, copies_total=1, copies_available=1)
+
+    def test_recount_renders_the_pages_again(self):
+        versions = {book.pk: fragment_version(Book, book.pk) for book in (self.book, self.other)}
+        recount_availability([self.book.pk])
+        self.assertNotEqual(fragment_version(Book, self.book.pk), versions[self.book.pk])
+        self.assertEqual(fragment_version(Book, self.other.pk), versions[self.other.pk])
+
+        versions = {book.pk: fragment_version(Book, book.pk) for book in (self.book, self.other)}
+        call_command('recount_availability', stdout=io.StringIO())
+        for pk, version in versions.items():
+            self.assertNotEqual(fragment_version(Book, pk), version)
@@ -0,0 +1,73 @@
+import io
+import json
+
+from django.core.management import call_command
+from django.test import LiveServerTestCase, TestCase
+
+from catalog import urls as catalog_urls
+from catalog.benchmarks import (
+    POST_ONLY_ROUTES, catalog_routes, compare_reports, run_benchmark, run_http_benchmark, run_session_benchmark,
+    seed_catalog,
+)
+from catalog.models import Author, Book, BookInstance
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(authors=5, books=20, copies=50, batch_size=7)
+
+    def test_seed_creates_requested_rows(self):
+        self.assertEqual(Author.objects.count(), 5)
+        self.assertEqual(Book.objects.count(), 20)
+        self.assertEqual(BookInstance.objects.count(), 50)
+        self.assertEqual(Book.genre.through.objects.count(), 20)
+
+    def test_every_route_is_benchmarked(self):
+        names = {name for name, url in catalog_routes()}
+        expected = {pattern.name for pattern in catalog_urls.urlpatterns if pattern.name} - POST_ONLY_ROUTES
+        self.assertEqual(names, expected)
+
+    def test_report_contains_measurements(self):
+        report = run_benchmark(iterations=2, warmup=0, routes=['index', 'books'])
+        self.assertEqual(report['dataset'], {'authors': 5, 'books': 20, 'copies': 50})
+        self.assertEqual(set(report['routes']), {'index', 'books'})
+        for result in report['routes'].values():
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+    def test_compare_reports(self):
+        report = run_benchmark(iterations=1, warmup=0, routes=['books'])
+        changes = compare_reports(report, report)
+        self.assertEqual(changes['books']['queries']['change'], 0)
+
+    def test_command_writes_json(self):
+        out = io.StringIO()
+        call_command('benchmark_catalog', '--iterations', '1', '--route', 'authors', stdout=out, stderr=io.StringIO())
+        report = json.loads(out.getvalue())
+        self.assertIn('authors', report['routes'])
+
+    def test_session_benchmark(self):
+        report = run_session_benchmark(requests=5)
+        self.assertEqual(report['per-visit']['writes_per_request'], 1)
+        for mode in ('db', 'cached_db', 'cache', 'signed_cookies'):
+            self.assertEqual(report[f'batched-{mode}']['writes'], 0, mode)
+
+    def test_session_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_sessions', '--requests', '2', '--mode', 'cache', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report) - {'requests', 'flush_interval'}, {'per-visit', 'batched-cache'})
+
+
+class HttpBenchmarkTest(LiveServerTestCase):
+    def setUp(self):
+        seed_catalog(authors=2, books=5, copies=10)
+
+    def test_report_contains_measurements(self):
+        # the live server shares the in-memory test database, one request at a time
+        report = run_http_benchmark(self.live_server_url, concurrency=1, requests=3, routes=['index', 'books'])
+        self.assertEqual(set(report['routes']), {'index', 'books'})
+        for result in report['routes'].values():
+            self.assertEqual(result['failed'], 0)
+            self.assertGreater(result['requests_per_second'], 0)
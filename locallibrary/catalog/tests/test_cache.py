@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.test import TestCase, override_settings
+
+from catalog import routers
+from catalog.cache import bump_version, bumped_key, get_version
+
+
+class BumpVersionTest(TestCase):
+    def test_bumped_again_on_commit(self):
+        # the test runs in a transaction: the version changes at once, and again
+        # when the transaction commits
+        before = get_version('test-namespace')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            bumped = bump_version('test-namespace')
+            self.assertGreater(bumped, before)
+            self.assertEqual(get_version('test-namespace'), bumped)
+        self.assertEqual(len(callbacks), 1)
+        self.assertGreater(get_version('test-namespace'), bumped)
+
+
+@override_settings(CATALOG_READ_REPLICAS=['replica'])
+class BumpedVersionPinningTest(TestCase):
+    def read_version(self):
+        """
+        Returns:
+            bool: whether a new request reading the version reads from the primary
+        """
+        tokens = routers.start_pinning()
+        try:
+            get_version('test-namespace')
+            return routers.is_pinned()
+        finally:
+            routers.stop_pinning(tokens)
+
+    def test_readers_of_a_bumped_version_read_from_the_primary(self):
+        self.assertFalse(self.read_version())
+        bump_version('test-namespace')
+        self.assertTrue(self.read_version())
+        # once CATALOG_PRIMARY_PIN_SECONDS are over, the replicas have caught up
+        cache.delete(bumped_key('test-namespace'))
+        self.assertFalse(self.read_version())
+
+    @override_settings(CATALOG_READ_REPLICAS=[])
+    def test_bumps_are_not_remembered_without_replicas(self):
+        bump_version('test-namespace')
+        self.assertIsNone(cache.get(bumped_key('test-namespace')))
+
+
+class SharedCacheCheckTest(TestCase):
+    def warnings(self):
+        return [message.id for message in run_checks(include_deployment_checks=True) if message.id.startswith('catalog.')]
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_cache_is_reported(self):
+        self.assertEqual(self.warnings(), ['catalog.W001'])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'catalog_cache',
+    }})
+    def test_shared_cache_is_accepted(self):
+        self.assertEqual(self.warnings(), [])
@@ -0,0 +1,197 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from catalog import loans
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.overdue import sweep_overdue
+from catalog.renewals import renew_copies
+
+
+class ConditionalGetTest(TestCase):
+    """
+    The book and author pages send validators and answer conditional GETs with
+    a 304 until something they show changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.other_user = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(
+            title='Book Title', summary='My book summary', isbn='ABCDEFG', author=cls.author,
+        )
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.book_url = reverse('book-detail', args=[self.book.pk])
+        self.author_url = reverse('author-detail', args=[self.author.pk])
+        self.urls = [self.book_url, self.author_url, reverse('books'), reverse('authors')]
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def assertChanged(self, url, etag):
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertNotEqual(response['ETag'], etag, url)
+
+    def test_pages_send_validators(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertTrue(response['ETag'].startswith('"'), url)
+            self.assertIn('private', response['Cache-Control'], url)
+            self.assertIn('no-cache', response['Cache-Control'], url)
+        # the lists are only versioned
+        for url in self.urls[:2]:
+            self.assertIn('Last-Modified', self.client.get(url), url)
+        for url in self.urls[2:]:
+            self.assertNotIn('Last-Modified', self.client.get(url), url)
+
+    def test_unchanged_page_is_not_modified(self):
+        for url in self.urls:
+            etag = self.client.get(url)['ETag']
+            # the session, the user and, for a detail page, the state of the page.
+            # The state of a list is read from the cache, it never reads the table.
+            queries = 3 if url in self.urls[:2] else 2
+            with self.assertNumQueries(queries), self.assertTemplateNotUsed('catalog/base_generic.html'):
+                response = self.revalidate(url, etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag, url)
+            self.assertEqual(response.content, b'', url)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.book_url)
+        response = self.client.get(self.book_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        earlier = http_date((self.book.updated_at - datetime.timedelta(minutes=1)).timestamp())
+        response = self.client.get(self.book_url, HTTP_IF_MODIFIED_SINCE=earlier)
+        self.assertEqual(response.status_code, 200)
+
+    def test_last_modified_is_the_latest_change(self):
+        self.copy.imprint = 'Second Imprint'
+        self.copy.save()
+        response = self.client.get(self.book_url)
+        self.copy.refresh_from_db()
+        self.assertEqual(response['Last-Modified'], http_date(self.copy.updated_at.timestamp()))
+
+    def test_book_change(self):
+        # the list of authors does not show the books
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls[:3]}
+        self.book.title = 'New Title'
+        self.book.save()
+        for url, etag in etags.items():
+            self.assertChanged(url, etag)
+
+    def test_author_change(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        self.author.last_name = 'Smithers'
+        self.author.save()
+        for url, etag in etags.items():
+            self.assertChanged(url, etag)
+
+    def test_copy_change(self):
+        etag = self.client.get(self.book_url)['ETag']
+        self.copy.imprint = 'Second Imprint'
+        self.copy.save()
+        self.assertChanged(self.book_url, etag)
+
+    def test_copy_delete(self):
+        other = BookInstance.objects.create(book=self.book, imprint='Second Imprint', status='a')
+        etag = self.client.get(self.book_url)['ETag']
+        other.delete()
+        self.assertChanged(self.book_url, etag)
+
+    def test_genre_change(self):
+        etag = self.client.get(self.book_url)['ETag']
+        self.book.genre.add(Genre.objects.create(name='Fantasy'))
+        self.assertChanged(self.book_url, etag)
+
+    def test_language_delete(self):
+        language = Language.objects.create(name='English')
+        self.book.language = language
+        self.book.save()
+        etag = self.client.get(self.book_url)['ETag']
+        language.delete()
+        self.assertChanged(self.book_url, etag)
+
+    def test_book_delete_changes_lists(self):
+        other = Book.objects.create(title='Other Title', summary='Summary', isbn='HIJKLMN', author=self.author)
+        url = reverse('books')
+        etag = self.client.get(url)['ETag']
+        other.delete()
+        self.assertChanged(url, etag)
+
+    def test_loans_change_the_book(self):
+        changes = [
+            lambda: loans.checkout(self.book, self.user),
+            lambda: renew_copies([self.copy.pk], datetime.date.today() + datetime.timedelta(weeks=2)),
+            lambda: sweep_overdue(today=datetime.date.today() + datetime.timedelta(weeks=3)),
+            lambda: loans.return_copy(self.copy.pk),
+        ]
+        for change in changes:
+            etags = {url: self.client.get(url)['ETag'] for url in (self.book_url, reverse('books'))}
+            change()
+            for url, etag in etags.items():
+                self.assertChanged(url, etag)
+
+    def test_other_user(self):
+        etag = self.client.get(self.book_url)['ETag']
+        self.client.force_login(self.other_user)
+        self.assertEqual(self.revalidate(self.book_url, etag).status_code, 200)
+
+    def test_other_page(self):
+        etag = self.client.get(reverse('books'))['ETag']
+        self.assertEqual(self.revalidate(reverse('books') + '?sort=title', etag).status_code, 200)
+
+    def test_missing_object_is_404(self):
+        response = self.client.get(reverse('book-detail', args=[self.book.pk + 100]), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+@override_settings(ROOT_URLCONF='catalog.tests.async_urls', CATALOG_ASYNC_PARALLEL_QUERIES=False)
+class AsyncConditionalGetTest(TestCase):
+    """
+    The async pages answer the conditional GETs as the sync ones do. The async
+    test client does not send the extra headers of a request in this version of
+    Django, so the sync client calls the async views.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_unchanged_page_is_not_modified(self):
+        urls = [
+            reverse('books'), reverse('authors'),
+            reverse('book-detail', args=[self.book.pk]), reverse('author-detail', args=[self.author.pk]),
+        ]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_changed_page(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        self.book.title = 'New Title'
+        self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'New Title')
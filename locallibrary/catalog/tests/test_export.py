@@ -0,0 +1,77 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.exporters import export_catalog
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+class ExportCatalogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Chinua', last_name='Achebe')
+        language = Language.objects.create(name='English', code='en')
+        book = Book.objects.create(title='Things Fall Apart', summary='Summary', isbn='9780385474542',
+                                   author=author, language=language)
+        book.genre.set([Genre.objects.create(name='History'), Genre.objects.create(name='Fiction')])
+        for _ in range(3):
+            BookInstance.objects.create(book=book, imprint='Heinemann', status='a')
+        Book.objects.create(title='No Copies', summary='Summary', isbn='123')
+
+        User.objects.create_user(username='staff', password='1X<ISRUkw+tuK', is_staff=True)
+        User.objects.create_user(username='reader', password='2HJ1vRV0Z&3iD')
+
+    def test_csv_export(self):
+        rows = list(csv.DictReader(io.StringIO(''.join(export_catalog('csv', chunk_size=2)))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['author'], 'Achebe, Chinua')
+        self.assertEqual(rows[0]['genres'], 'Fiction; History')
+        self.assertEqual(rows[0]['language'], 'English')
+        self.assertEqual(rows[0]['status'], 'Available')
+        self.assertEqual(rows[3]['title'], 'No Copies')
+        self.assertEqual(rows[3]['copy_id'], '')
+
+    def test_export_reads_genres_once_per_chunk(self):
+        # one query for the copies, one for the genres, one for the books without copies
+        # and one for their genres
+        with self.assertNumQueries(4):
+            list(export_catalog('jsonl', chunk_size=10))
+
+    def test_gzip_jsonl_export(self):
+        data = gzip.decompress(b''.join(export_catalog('jsonl', compress=True)))
+        rows = [json.loads(line) for line in data.decode().splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['isbn'], '9780385474542')
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'inventory.csv.gz')
+            call_command('export_catalog', '--gzip', '--output', path, stderr=io.StringIO())
+            with gzip.open(path, 'rt') as export:
+                self.assertEqual(len(list(csv.DictReader(export))), 4)
+
+    def test_view_is_staff_only(self):
+        self.client.login(username='reader', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('catalog-export'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_view_streams_export(self):
+        self.client.login(username='staff', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('catalog-export'), {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        data = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(data.decode().splitlines()), 4)
+
+    def test_view_rejects_unknown_format(self):
+        self.client.login(username='staff', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('catalog-export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
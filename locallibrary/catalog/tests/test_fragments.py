@@ -0,0 +1,99 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.tests.utils import QueryBudgetMixin
+
+
+class DetailFragmentCacheTest(QueryBudgetMixin, TestCase):
+    """
+    The content of the book and author detail pages is cached per object and
+    rendered again when something the page shows changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.language = Language.objects.create(name='English')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.book = Book.objects.create(
+            title='Book Title', summary='My book summary', isbn='ABCDEFG',
+            author=cls.author, language=cls.language,
+        )
+        cls.book.genre.add(cls.genre)
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint='Unlikely Imprint, 2016', status='a',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.book_url = reverse('book-detail', args=[self.book.pk])
+        self.author_url = reverse('author-detail', args=[self.author.pk])
+
+    def test_warm_book_detail_skips_the_relations(self):
+        _, cold = self.get_query_count(self.book_url)
+        response, warm = self.get_query_count(self.book_url)
+        self.assertLess(len(warm), len(cold))
+        self.assertContains(response, 'Book Title')
+        self.assertContains(response, 'Fantasy')
+        self.assertContains(response, 'Unlikely Imprint, 2016')
+
+    def test_warm_author_detail_skips_the_books(self):
+        _, cold = self.get_query_count(self.author_url)
+        response, warm = self.get_query_count(self.author_url)
+        self.assertLess(len(warm), len(cold))
+        self.assertContains(response, 'Book Title')
+
+    def test_missing_object_is_404(self):
+        self.client.get(self.book_url)
+        response = self.client.get(reverse('book-detail', args=[self.book.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_loan_renders_book_again(self):
+        self.client.get(self.book_url)
+        self.copy.status = 'o'
+        self.copy.due_back = datetime.date(2030, 1, 2)
+        self.copy.borrower = self.user
+        self.copy.save()
+        response = self.client.get(self.book_url)
+        self.assertContains(response, 'On Loan')
+        self.assertNotContains(response, 'Available')
+
+    def test_new_copy_renders_book_again(self):
+        self.client.get(self.book_url)
+        BookInstance.objects.create(book=self.book, imprint='Second Imprint', status='a')
+        self.assertContains(self.client.get(self.book_url), 'Second Imprint')
+
+    def test_genre_change_renders_book_again(self):
+        self.client.get(self.book_url)
+        self.book.genre.add(Genre.objects.create(name='Science Fiction'))
+        self.assertContains(self.client.get(self.book_url), 'Science Fiction')
+
+        self.genre.name = 'High Fantasy'
+        self.genre.save()
+        self.assertContains(self.client.get(self.book_url), 'High Fantasy')
+
+    def test_author_rename_renders_both_pages_again(self):
+        self.client.get(self.book_url)
+        self.client.get(self.author_url)
+        self.author.last_name = 'Jones'
+        self.author.save()
+        self.assertContains(self.client.get(self.book_url), 'Jones')
+        self.assertContains(self.client.get(self.author_url), 'Jones')
+
+    def test_book_changes_render_author_pages_again(self):
+        other = Author.objects.create(first_name='Jane', last_name='Doe')
+        other_url = reverse('author-detail', args=[other.pk])
+        self.client.get(self.author_url)
+        self.client.get(other_url)
+
+        self.book.author = other
+        self.book.save()
+        self.assertNotContains(self.client.get(self.author_url), 'Book Title')
+        self.assertContains(self.client.get(other_url), 'Book Title')
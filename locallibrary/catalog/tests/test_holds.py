@@ -0,0 +1,171 @@
+import datetime
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import holds, loans
+from catalog.models import Book, BookInstance, Hold
+
+
+class HoldQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'testuser{number}', password='1X<ISRUkw+tuK')
+            for number in range(4)
+        ]
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        cls.copies = [
+            BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a') for _ in range(2)
+        ]
+
+    def counters(self):
+        return Book.objects.values_list('copies_available', 'copies_on_loan', 'copies_reserved').get(pk=self.book.pk)
+
+    def lend_every_copy(self):
+        return [loans.checkout(self.book, self.users[0]) for _ in self.copies]
+
+    def test_hold_is_ready_when_a_copy_is_available(self):
+        hold = holds.place_hold(self.book, self.users[1])
+        self.assertEqual(hold.status, 'r')
+        self.assertEqual(hold.copy.status, 'r')
+        self.assertEqual(hold.copy.borrower, self.users[1])
+        self.assertEqual(hold.copy.due_back, datetime.date.today() + loans.RESERVATION_PERIOD)
+        self.assertEqual(self.counters(), (1, 0, 1))
+
+        # borrowing the reserved copy fulfills the hold
+        self.assertEqual(loans.checkout(self.book, self.users[1]).pk, hold.copy_id)
+        self.assertEqual(Hold.objects.get(pk=hold.pk).status, 'f')
+
+    def test_returned_copies_go_to_the_oldest_holds(self):
+        lent = self.lend_every_copy()
+        waiting = [holds.place_hold(self.book, user) for user in self.users[1:]]
+        self.assertEqual([hold.status for hold in waiting], ['w', 'w', 'w'])
+        self.assertEqual([holds.queue_position(hold) for hold in waiting], [1, 2, 3])
+
+        # both copies come back at once and are allocated together
+        with CaptureQueriesContext(connection) as context:
+            loans.return_copies(lent)
+        self.assertLess(len(context.captured_queries), 25)
+
+        statuses = dict(Hold.objects.values_list('user__username', 'status'))
+        self.assertEqual(statuses, {'testuser1': 'r', 'testuser2': 'r', 'testuser3': 'w'})
+        self.assertEqual(
+            set(BookInstance.objects.values_list('borrower__username', flat=True)), {'testuser1', 'testuser2'}
+        )
+        self.assertEqual(self.counters(), (0, 0, 2))
+
+    def test_cancelled_ready_hold_passes_the_copy_on(self):
+        self.lend_every_copy()
+        first, second = holds.place_hold(self.book, self.users[1]), holds.place_hold(self.book, self.users[2])
+        loans.return_copy(BookInstance.objects.filter(status='o').first())
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'r')
+
+        with self.assertRaises(holds.HoldError):
+            holds.cancel_hold(first, user=self.users[2])
+        holds.cancel_hold(first, user=self.users[1])
+        second.refresh_from_db()
+        self.assertEqual((Hold.objects.get(pk=first.pk).status, second.status), ('c', 'r'))
+        self.assertEqual(second.copy_id, first.copy_id)
+
+    def test_expired_hold_passes_the_copy_on(self):
+        self.lend_every_copy()
+        first, second = holds.place_hold(self.book, self.users[1]), holds.place_hold(self.book, self.users[2])
+        loans.return_copy(BookInstance.objects.filter(status='o').first())
+
+        self.assertEqual(holds.expire_holds(), 0)
+        self.assertEqual(holds.expire_holds(datetime.date.today() + loans.RESERVATION_PERIOD * 2), 1)
+        self.assertEqual(Hold.objects.get(pk=first.pk).status, 'e')
+        self.assertEqual(Hold.objects.get(pk=second.pk).status, 'r')
+
+    def test_one_active_hold_per_user_and_book(self):
+        self.lend_every_copy()
+        holds.place_hold(self.book, self.users[1])
+        with self.assertRaises(holds.HoldError):
+            holds.place_hold(self.book, self.users[1])
+
+
+class SavedCopyAllocationTest(TestCase):
+    """A copy made available outside of catalog/loans.py still goes to the queue."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_superuser(
+            username='librarian', password='1X<ISRUkw+tuK', email='librarian@example.com',
+        )
+        cls.reader = User.objects.create_user(username='reader', password='2HJ1vRV0Z&3iD')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Imprint', status='m')
+
+    def setUp(self):
+        self.hold = holds.place_hold(self.book, self.reader)
+        self.assertEqual(self.hold.status, 'w')
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+
+    def assertReservedForTheHold(self):
+        self.hold.refresh_from_db()
+        self.assertEqual((self.hold.status, self.hold.copy_id), ('r', self.copy.pk))
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        self.assertEqual((copy.status, copy.borrower), ('r', self.reader))
+
+    def test_copy_made_available_in_the_admin(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:catalog_bookinstance_change', args=[self.copy.pk]), {
+                'book': self.book.pk, 'imprint': 'Imprint', 'id': self.copy.pk, 'status': 'a',
+                'due_back': '', 'borrower': '',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertReservedForTheHold()
+
+    def test_copy_made_available_through_the_api(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('api-detail', args=['copies', self.copy.pk]),
+                json.dumps({'status': 'a'}), content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertReservedForTheHold()
+
+    def test_copy_saved_while_available_is_not_allocated_again(self):
+        self.copy.status = 'a'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.copy.save()
+        self.assertReservedForTheHold()
+        holds.cancel_hold(self.hold)
+        with mock.patch.object(holds, 'allocate_holds') as allocate_holds:
+            with self.captureOnCommitCallbacks(execute=True):
+                BookInstance.objects.get(pk=self.copy.pk).save()
+        allocate_holds.assert_not_called()
+
+
+class HoldViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+
+    def setUp(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+
+    def test_place_and_cancel_a_hold(self):
+        response = self.client.post(reverse('place-hold', args=[self.book.pk]), follow=True)
+        self.assertRedirects(response, reverse('my-borrowed'))
+        self.assertContains(response, 'You are number 1 in the queue for Book Title.')
+        self.assertContains(response, 'waiting since')
+
+        hold = Hold.objects.get()
+        response = self.client.post(reverse('cancel-hold', args=[hold.pk]), follow=True)
+        self.assertContains(response, 'Your hold was cancelled.')
+        self.assertContains(response, 'You have no holds.')
+
+    def test_book_detail_has_a_hold_button(self):
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertContains(response, reverse('place-hold', args=[self.book.pk]))
+
+    def test_holds_are_placed_with_post(self):
+        self.assertEqual(self.client.get(reverse('place-hold', args=[self.book.pk])).status_code, 405)
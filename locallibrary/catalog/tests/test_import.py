@@ -0,0 +1,144 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from catalog.cache import get_version
+from catalog.fragments import fragment_namespace
+from catalog.importers import CatalogImporter, CatalogImportError, normalise
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.search import SearchResults
+
+CSV_FEED = """title,author,summary,isbn,genres,language,language_code,copies,imprint
+A Wizard of Earthsea,"Le Guin, Ursula",A young mage.,9780553383041,Fantasy;Young Adult,English,en,2,Parnassus
+The Dispossessed,"Le Guin, Ursula",An anarchist moon.,9780061054884,Science Fiction,English,en,1,Harper
+Things Fall Apart,Chinua Achebe,A village in Nigeria.,9780385474542,Fiction|History,English,en,3,Heinemann
+"""
+
+MARC_FEED = """020 9780099448792
+100 Achebe, Chinua
+245 Arrow of God
+520 A chief priest.
+546 English
+650 Fiction
+852 Heinemann 1964
+852 Anchor 2016
+
+020 9782070360024
+100 Camus, Albert
+245 L'Etranger
+546 French
+041 fr
+650 Fiction
+"""
+
+class ImportCatalogTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as feed:
+            feed.write(content)
+        return path
+
+    def test_import_csv(self):
+        Genre.objects.create(name='Fantasy')
+        counts = CatalogImporter(chunk_size=2).run(self.write('feed.csv', CSV_FEED))
+
+        self.assertEqual(counts['records'], 3)
+        self.assertEqual(Book.objects.count(), 3)
+        # the author of two books and the existing genre are not duplicated
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Genre.objects.count(), 5)
+        self.assertEqual(Language.objects.count(), 1)
+        self.assertEqual(BookInstance.objects.count(), 6)
+
+        book = Book.objects.get(isbn='9780553383041')
+        self.assertEqual(str(book.author), 'Le Guin, Ursula')
+        self.assertEqual(book.display_genre(), 'Fantasy, Young Adult')
+        self.assertEqual(book.language.code, 'en')
+        # bulk_create skips the signals, the importer recounts the copies itself
+        self.assertEqual(Book.objects.get(isbn='9780385474542').copies_total, 3)
+
+    def test_import_jsonl(self):
+        records = [
+            {'title': 'Beloved', 'first_name': 'Toni', 'last_name': 'Morrison', 'isbn': '9781400033416',
+             'genres': ['Fiction'], 'copies': 1, 'status': 'o'},
+        ]
+        path = self.write('feed.jsonl', '\n'.join(json.dumps(record) for record in records))
+        CatalogImporter().run(path)
+        self.assertEqual(BookInstance.objects.get().status, 'o')
+        self.assertEqual(Book.objects.get().author.last_name, 'Morrison')
+
+    def test_import_marc(self):
+        CatalogImporter().run(self.write('feed.mrc', MARC_FEED))
+        self.assertEqual(Book.objects.get(isbn='9780099448792').bookinstance_set.count(), 2)
+        self.assertEqual(Book.objects.get(isbn='9782070360024').language.code, 'fr')
+        self.assertEqual(Author.objects.count(), 2)
+
+    def test_import_twice_does_not_duplicate(self):
+        path = self.write('feed.csv', CSV_FEED)
+        self.assertEqual(CatalogImporter().run(path)['copies'], 6)
+        # the copies already written are skipped, and not reported again
+        self.assertEqual(CatalogImporter().run(path)['copies'], 0)
+        self.assertEqual(Book.objects.count(), 3)
+        self.assertEqual(BookInstance.objects.count(), 6)
+
+    def test_pages_of_existing_books_and_authors_are_invalidated(self):
+        author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        book = Book.objects.create(title='A Wizard of Earthsea', summary='A young mage.', isbn='9780553383041', author=author)
+        book_version = get_version(fragment_namespace(Book, book.pk))
+        author_version = get_version(fragment_namespace(Author, author.pk))
+
+        CatalogImporter().run(self.write('feed.csv', CSV_FEED))
+        # the book got two copies and the author another book
+        self.assertNotEqual(get_version(fragment_namespace(Book, book.pk)), book_version)
+        self.assertNotEqual(get_version(fragment_namespace(Author, author.pk)), author_version)
+
+    def test_imported_books_are_searchable(self):
+        CatalogImporter().run(self.write('feed.csv', CSV_FEED))
+        self.assertEqual([book.isbn for book in SearchResults('anarchist')[:10]], ['9780061054884'])
+
+    def test_resume_after_failure(self):
+        path = self.write('feed.csv', CSV_FEED + 'Broken,,,,,,,1,\n' + 'Half of a Yellow Sun,Chimamanda Adichie,,9781400095209,,,,1,\n')
+
+        with self.assertRaises(CommandError):
+            call_command('import_catalog', path, '--chunk-size', '2', stdout=io.StringIO())
+        # the chunks before the invalid record are committed
+        self.assertEqual(Book.objects.count(), 2)
+
+        self.write('feed.csv', CSV_FEED + 'Fixed,Some One,,9780000000001,,,,1,\n' + 'Half of a Yellow Sun,Chimamanda Adichie,,9781400095209,,,,1,\n')
+        call_command('import_catalog', path, '--chunk-size', '2', '--resume', stdout=io.StringIO())
+        self.assertEqual(Book.objects.count(), 5)
+        self.assertEqual(BookInstance.objects.count(), 8)
+        self.assertFalse(os.path.exists(path + '.import-state'))
+
+    def test_normalise_splits_author_names(self):
+        record = normalise({'title': 'T', 'isbn': '978-0-00', 'author': 'Chinua Achebe'})
+        self.assertEqual(record['author'], ('Chinua', 'Achebe'))
+        self.assertEqual(record['isbn'], '978000')
+
+    def test_numeric_json_values_are_text(self):
+        path = self.write('feed.jsonl', json.dumps({
+            'title': 1984, 'isbn': 9780451524935, 'author': 'George Orwell', 'genres': [1, 'Fiction'],
+            'imprints': ['Secker', 1949],
+        }) + '\n')
+        CatalogImporter().run(path)
+        book = Book.objects.get()
+        self.assertEqual((book.title, book.isbn), ('1984', '9780451524935'))
+        self.assertEqual(sorted(book.genre.values_list('name', flat=True)), ['1', 'Fiction'])
+        self.assertEqual(sorted(BookInstance.objects.values_list('imprint', flat=True)), ['1949', 'Secker'])
+
+    def test_record_that_is_not_an_object(self):
+        path = self.write('feed.jsonl', json.dumps({'title': 'T', 'isbn': '978000'}) + '\n["T", "978001"]\n')
+        with self.assertRaisesMessage(CommandError, 'A record must be an object'):
+            call_command('import_catalog', path, stdout=io.StringIO())
+        with self.assertRaisesMessage(CatalogImportError, 'must be a list'):
+            normalise({'title': 'T', 'isbn': '978000', 'imprints': 'Secker'})
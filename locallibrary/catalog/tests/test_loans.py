@@ -0,0 +1,90 @@
+import datetime
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from catalog import loans
+from catalog.loadtest import run_checkout_load_test
+from catalog.models import Book, BookInstance
+
+
+class LoanServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.other = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        cls.copies = [
+            BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a') for _ in range(2)
+        ]
+
+    def counters(self):
+        return Book.objects.values_list('copies_available', 'copies_on_loan', 'copies_reserved').get(pk=self.book.pk)
+
+    def test_checkout_lends_an_available_copy(self):
+        copy = loans.checkout(self.book, self.user)
+        self.assertEqual(copy.status, 'o')
+        self.assertEqual(copy.borrower, self.user)
+        self.assertEqual(copy.due_back, datetime.date.today() + loans.LOAN_PERIOD)
+        self.assertEqual(self.counters(), (1, 1, 0))
+
+        second = loans.checkout(self.book.pk, self.other)
+        self.assertNotEqual(copy.pk, second.pk)
+        with self.assertRaises(loans.NoCopyAvailable):
+            loans.checkout(self.book, self.other)
+
+    def test_copies_in_maintenance_are_not_lent(self):
+        BookInstance.objects.filter(book=self.book).update(status='m')
+        with self.assertRaises(loans.NoCopyAvailable):
+            loans.checkout(self.book, self.user)
+
+    def test_reserved_copy_is_lent_to_its_borrower(self):
+        reserved = loans.reserve(self.book, self.user)
+        self.assertEqual(reserved.status, 'r')
+        self.assertEqual(self.counters(), (1, 0, 1))
+
+        # another borrower gets the other copy, then there is none left for them
+        self.assertNotEqual(loans.checkout(self.book, self.other).pk, reserved.pk)
+        with self.assertRaises(loans.NoCopyAvailable):
+            loans.checkout(self.book, self.other)
+
+        self.assertEqual(loans.checkout(self.book, self.user).pk, reserved.pk)
+        self.assertEqual(self.counters(), (0, 2, 0))
+
+    def test_return_makes_the_copy_available(self):
+        copy = loans.checkout(self.book, self.user, due_back=datetime.date.today() - datetime.timedelta(days=1))
+        copy.refresh_from_db()
+        copy.save()  # marks it overdue
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_overdue, 1)
+
+        returned = loans.return_copy(copy)
+        self.assertEqual((returned.status, returned.borrower, returned.due_back), ('a', None, None))
+        self.assertEqual(self.counters(), (2, 0, 0))
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_overdue, 0)
+
+        with self.assertRaises(loans.InvalidLoanState):
+            loans.return_copy(copy.pk)
+
+
+class CheckoutLoadTest(TransactionTestCase):
+    """
+    Many concurrent borrowers of the same book never get the same copy.
+    """
+
+    def test_no_copy_is_lent_twice(self):
+        report = run_checkout_load_test(workers=120, copies=40)
+        self.assertEqual(report['double_lent'], 0)
+        self.assertEqual(report['checkouts'], 40)
+        self.assertEqual(report['unavailable'], 80)
+        self.assertTrue(report['counters_match'])
+        self.assertTrue(report['borrowers_match'])
+        # the data of the run is removed
+        self.assertFalse(Book.objects.exists())
+
+    def test_loadtest_loans_command(self):
+        out = io.StringIO()
+        call_command('loadtest_loans', '--workers', '10', '--copies', '5', stdout=out)
+        self.assertIn('5 checkouts, no copy lent twice', out.getvalue())
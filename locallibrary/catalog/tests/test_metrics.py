@@ -0,0 +1,113 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import metrics
+from catalog.models import Author, Book
+
+
+@override_settings(CATALOG_METRICS=True, CATALOG_METRICS_SAMPLE_RATE=1.0, CATALOG_METRICS_TOKEN='scraper-token')
+class RequestMetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG', author=author)
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.client.force_login(self.user)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def test_requests_are_measured_per_url_name(self):
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+        self.client.get(reverse('authors'))
+
+        text = self.scrape()
+        self.assertIn('catalog_http_requests_total{view="books",method="GET",status="200"} 2', text)
+        self.assertIn('catalog_http_requests_total{view="authors",method="GET",status="200"} 1', text)
+        self.assertIn('catalog_http_request_duration_seconds_bucket{view="books",le="+Inf"} 2', text)
+        self.assertIn('catalog_http_request_duration_seconds_count{view="books"} 2', text)
+        self.assertIn('catalog_http_response_size_bytes_count{view="books"} 2', text)
+        self.assertIn('# TYPE catalog_http_request_duration_seconds histogram', text)
+        # the metrics endpoint is not measured
+        self.assertNotIn('view="metrics"', text)
+
+    def test_queries_and_response_size(self):
+        response = self.client.get(reverse('authors'))
+        counters, histograms = metrics.collect()
+        labels = (('view', 'authors'),)
+        self.assertGreater(counters[('catalog_db_queries_total', labels)], 0)
+        self.assertGreater(counters[('catalog_db_query_duration_seconds_total', labels)], 0)
+        self.assertEqual(histograms[('catalog_http_response_size_bytes', labels)][-2], len(response.content))
+
+    def test_cache_hits_and_misses(self):
+        metrics.install()
+        cache.set('catalog:test:present', 1)
+        sample = metrics.Sample()
+        token = metrics._sample.set(sample)
+        try:
+            self.assertEqual(cache.get('catalog:test:present'), 1)
+            self.assertEqual(cache.get('catalog:test:missing', 'default'), 'default')
+            self.assertEqual(cache.get_many(['catalog:test:present', 'catalog:test:missing']), {'catalog:test:present': 1})
+        finally:
+            metrics._sample.reset(token)
+        self.assertEqual((sample.cache_hits, sample.cache_misses), (2, 2))
+
+    def test_unnamed_urls(self):
+        self.client.get('/catalog/no-such-page/')
+        self.assertIn('catalog_http_requests_total{view="<unnamed>",method="GET",status="404"} 1', self.scrape())
+
+    @override_settings(CATALOG_METRICS_SAMPLE_RATE=0.0)
+    def test_sampling(self):
+        self.client.get(reverse('books'))
+        text = self.scrape()
+        self.assertNotIn('view="books"', text)
+        self.assertIn('catalog_metrics_sample_rate 0.0', text)
+
+    def test_endpoint_needs_the_token_or_the_staff(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer other-token').status_code, 403)
+        # the address of the client is not trusted
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(CATALOG_METRICS_TOKEN='')
+    def test_empty_token_is_refused(self):
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    def test_shards_of_ended_threads_are_merged(self):
+        def request():
+            metrics.record('books', 'GET', 200, 0.01, 100, metrics.Sample())
+
+        for _ in range(3):
+            thread = threading.Thread(target=request)
+            thread.start()
+            thread.join()
+        counters, _ = metrics.collect()
+        labels = (('view', 'books'), ('method', 'GET'), ('status', '200'))
+        self.assertEqual(counters[('catalog_http_requests_total', labels)], 3)
+        self.assertTrue(all(thread.is_alive() for thread in metrics._shards))
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(metrics._labels((('view', 'a"b\\c'),)), '{view="a\\"b\\\\c"}')
+
+
+@override_settings(CATALOG_METRICS=False)
+class RequestMetricsDisabledTest(TestCase):
+    def test_endpoint_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
@@ -0,0 +1,108 @@
+import datetime
+import io
+
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Book, BookInstance
+from catalog.overdue import sweep_overdue
+
+TODAY = datetime.date.today()
+
+
+class OverdueSweepTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        cls.late = BookInstance.objects.create(
+            book=cls.book, imprint='Imprint', status='o', due_back=TODAY + datetime.timedelta(days=2),
+        )
+        cls.on_time = BookInstance.objects.create(
+            book=cls.book, imprint='Imprint', status='o', due_back=TODAY + datetime.timedelta(days=10),
+        )
+        cls.available = BookInstance.objects.create(
+            book=cls.book, imprint='Imprint', status='a', due_back=TODAY - datetime.timedelta(days=30),
+        )
+
+    def test_saving_a_copy_refreshes_its_flag(self):
+        self.late.due_back = TODAY - datetime.timedelta(days=3)
+        self.late.save()
+        self.assertTrue(self.late.overdue)
+        self.assertEqual(self.late.days_overdue, 3)
+        self.assertFalse(BookInstance.objects.get(pk=self.available.pk).overdue)
+
+    def test_sweep_marks_the_copies_that_became_overdue(self):
+        self.assertFalse(BookInstance.objects.overdue().exists())
+
+        # five days later the first loan is three days late
+        result = sweep_overdue(TODAY + datetime.timedelta(days=5))
+        self.assertEqual(result, {'copies': 1, 'books': 1})
+        self.assertEqual(list(BookInstance.objects.overdue().values_list('pk', 'days_overdue')), [(self.late.pk, 3)])
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_overdue, 1)
+
+        # the next day both loans are late, the days overdue of the first one go up
+        sweep_overdue(TODAY + datetime.timedelta(days=12))
+        self.assertEqual(
+            list(BookInstance.objects.overdue().order_by('due_back').values_list('days_overdue', flat=True)),
+            [10, 2],
+        )
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_overdue, 2)
+
+    def test_sweep_clears_copies_that_are_no_longer_overdue(self):
+        sweep_overdue(TODAY + datetime.timedelta(days=5))
+        # a change that bypasses save, eg a bulk renewal
+        BookInstance.objects.filter(pk=self.late.pk).update(due_back=TODAY + datetime.timedelta(days=20))
+
+        sweep_overdue(TODAY + datetime.timedelta(days=5))
+        self.assertFalse(BookInstance.objects.overdue().exists())
+        self.assertEqual(BookInstance.objects.get(pk=self.late.pk).days_overdue, 0)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_overdue, 0)
+
+    def test_sweep_updates_the_copies_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            sweep_overdue(TODAY + datetime.timedelta(days=12))
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        # the copies, then the counters of their book
+        self.assertEqual(len(updates), 2)
+        self.assertIn('"catalog_bookinstance"', updates[0])
+
+    def test_sweep_overdue_command(self):
+        out = io.StringIO()
+        call_command('sweep_overdue', '--date', (TODAY + datetime.timedelta(days=5)).isoformat(), stdout=out)
+        self.assertIn('Updated 1 copies', out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('sweep_overdue', '--date', 'tomorrow', stdout=out)
+
+
+class OverdueBooksListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.user.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        BookInstance.objects.create(
+            book=book, imprint='Late Imprint', status='o', borrower=cls.user,
+            due_back=TODAY - datetime.timedelta(days=4),
+        )
+        BookInstance.objects.create(
+            book=book, imprint='On Time Imprint', status='o', borrower=cls.user,
+            due_back=TODAY + datetime.timedelta(days=4),
+        )
+
+    def test_lists_only_the_overdue_copies(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('all-overdue'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['bookinstance_list']), 1)
+        self.assertContains(response, '4 days overdue')
+
+    def test_requires_permission(self):
+        User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.assertEqual(self.client.get(reverse('all-overdue')).status_code, 403)
@@ -0,0 +1,101 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import CursorPaginator, InvalidCursor
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # several authors share a last name so the primary key has to break the ties
+        for number in range(11):
+            Author.objects.create(first_name=f'First {number % 4}', last_name=f'Last {number % 3}')
+
+        book = Book.objects.create(title='Book', summary='Summary', isbn='ABC')
+        today = datetime.date.today()
+        for number in range(9):
+            # some copies have no due date, NULL must sort consistently with the cursor
+            due_back = today + datetime.timedelta(days=number % 3) if number % 4 else None
+            BookInstance.objects.create(book=book, imprint='Imprint', due_back=due_back)
+
+    def walk(self, queryset, ordering, per_page):
+        """Follow the next cursors from the first page, then the previous cursors back."""
+        paginator = CursorPaginator(queryset, per_page, ordering)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+
+        backwards = [pages[-1]]
+        while backwards[-1].has_previous():
+            backwards.append(paginator.page(backwards[-1].previous_cursor))
+        return pages, backwards
+
+    def assertWalksInOrder(self, queryset, ordering, per_page):
+        expected = list(queryset.order_by(*ordering, 'pk'))
+        pages, backwards = self.walk(queryset, ordering, per_page)
+
+        self.assertEqual([obj for page in pages for obj in page], expected)
+        self.assertEqual([obj for page in reversed(backwards) for obj in page], expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertFalse(backwards[-1].has_previous())
+
+    def test_walk_with_ties(self):
+        self.assertWalksInOrder(Author.objects.all(), ['last_name', 'first_name'], 3)
+
+    def test_walk_descending(self):
+        self.assertWalksInOrder(Author.objects.all(), ['-last_name', 'first_name'], 4)
+
+    def test_walk_with_nulls(self):
+        self.assertWalksInOrder(BookInstance.objects.all(), ['due_back'], 2)
+        self.assertWalksInOrder(BookInstance.objects.all(), ['-due_back'], 2)
+
+    def test_page_does_not_count_rows(self):
+        paginator = CursorPaginator(Author.objects.all(), 4, ['last_name'])
+        with CaptureQueriesContext(connection) as context:
+            paginator.page(paginator.page().next_cursor)
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertNotIn('COUNT', ' '.join(query['sql'] for query in context.captured_queries))
+
+    def test_tampered_cursor_is_rejected(self):
+        paginator = CursorPaginator(Author.objects.all(), 4, ['last_name'])
+        cursor = paginator.page().next_cursor
+        with self.assertRaises(InvalidCursor):
+            paginator.page(cursor[:-2] + 'xx')
+
+    def test_cursor_of_another_ordering_is_rejected(self):
+        cursor = CursorPaginator(Author.objects.all(), 4, ['last_name']).page().next_cursor
+        with self.assertRaises(InvalidCursor):
+            CursorPaginator(Author.objects.all(), 4, ['last_name', 'first_name']).page(cursor)
+
+
+class CursorPaginationViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(7):
+            Author.objects.create(first_name=f'Christian {number}', last_name=f'Surname {number}')
+        User.objects.create_user('phem2', 'phem@yahoo.com', 'don012345672')
+
+    def setUp(self):
+        self.client.login(username='phem2', password='don012345672')
+
+    def test_next_link_uses_cursor(self):
+        response = self.client.get(reverse('authors'))
+        page = response.context['page_obj']
+        self.assertTrue(response.context['is_paginated'])
+        self.assertContains(response, '?cursor=')
+        self.assertNotContains(response, 'Previous')
+
+        response = self.client.get(reverse('authors'), {'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['author_list']), 3)
+        self.assertEqual(response.context['author_list'][0].last_name, 'Surname 4')
+        self.assertContains(response, 'Previous')
+        self.assertNotContains(response, 'Next')
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse('authors'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
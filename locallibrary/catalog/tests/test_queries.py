@@ -0,0 +1,140 @@
+import datetime
+import io
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.management.commands.check_query_plans import FULL_SCAN_PATTERNS, SORT_PATTERNS, _scanned_table
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.tests.utils import QueryBudgetMixin
+
+class CatalogQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    Every catalog page must render in a fixed number of queries. Four of the queries
+    of every page are the session, the logged in user and the user and group
+    permissions checked by the sidebar. The lists use cursor pagination, which
+    does not count the rows.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.user.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.language = Language.objects.create(name='English')
+        cls.genres = [Genre.objects.create(name=f'Genre {number}') for number in range(3)]
+        cls.book = cls.create_book(0)
+        cls.add_copies(cls.book, 2)
+
+    @classmethod
+    def create_book(cls, number):
+        book = Book.objects.create(
+            title=f'Book Title {number}',
+            summary='My book summary',
+            isbn='ABCDEFG',
+            author=Author.objects.create(first_name='Jane', last_name=f'Doe {number}'),
+            language=cls.language,
+        )
+        book.genre.set(cls.genres)
+        return book
+
+    @classmethod
+    def add_copies(cls, book, number):
+        for _ in range(number):
+            BookInstance.objects.create(
+                book=book,
+                imprint='Unlikely Imprint, 2016',
+                due_back=datetime.date.today() + datetime.timedelta(days=5),
+                borrower=cls.user,
+                status='o',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+
+    def add_books(self):
+        for number in range(1, 4):
+            book = self.create_book(number)
+            self.add_copies(book, 2)
+
+    def test_index(self):
+        # the statistics take one query on a cold cache and none on a warm one
+        self.assertQueryBudget(reverse('index'), 8)
+        self.assertQueryBudget(reverse('index'), 7)
+        self.add_books()
+        self.assertQueryBudget(reverse('index'), 8)
+
+    # the book and author detail pages take one more query for their ETag, the lists
+    # read theirs from the cache (see test_conditional)
+    def test_book_list(self):
+        self.assertConstantQueries(reverse('books'), 5, self.add_books)
+
+    # the detail pages are measured without their fragment cache (see test_fragments)
+    @override_settings(CATALOG_DETAIL_CACHE_TIMEOUT=0)
+    def test_book_detail(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.assertConstantQueries(url, 8, lambda: self.add_copies(self.book, 5))
+
+    def test_author_list(self):
+        self.assertConstantQueries(reverse('authors'), 5, self.add_books)
+
+    @override_settings(CATALOG_DETAIL_CACHE_TIMEOUT=0)
+    def test_author_detail(self):
+        url = reverse('author-detail', args=[self.author.pk])
+
+        def add_books_by_author():
+            for number in range(3):
+                Book.objects.create(title=f'Other {number}', summary='Summary', isbn='ABC', author=self.author)
+
+        self.assertConstantQueries(url, 7, add_books_by_author)
+
+    def test_my_borrowed(self):
+        # one more query lists the holds of the user
+        self.assertConstantQueries(reverse('my-borrowed'), 6, self.add_books)
+
+    def test_all_borrowed(self):
+        self.assertConstantQueries(reverse('all-borrowed'), 5, self.add_books)
+
+    def test_all_overdue(self):
+        BookInstance.objects.update(due_back=datetime.date.today() - datetime.timedelta(days=1))
+        call_command('sweep_overdue', stdout=io.StringIO())
+        self.assertConstantQueries(reverse('all-overdue'), 5, self.add_books)
+
+    def test_renew_book_librarian(self):
+        copy = BookInstance.objects.first()
+        self.assertQueryBudget(reverse('renew-book-librarian', args=[copy.pk]), 5)
+
+
+class QueryPlanCheckTest(TestCase):
+    def test_loan_status_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+    def test_list_pages_are_read_in_index_order(self):
+        out = io.StringIO()
+        call_command('check_query_plans', stdout=out)
+        for view in ('BookListView', 'AuthorListView', 'AllBorrowedBooks', 'OverdueBooksListView'):
+            self.assertIn(f'OK         {view}: next page', out.getvalue())
+        self.assertNotIn('SORT', out.getvalue())
+
+    def test_sorts_are_detected(self):
+        self.assertIsNotNone(SORT_PATTERNS['sqlite'].search('66 0 0 USE TEMP B-TREE FOR ORDER BY'))
+        self.assertIsNotNone(SORT_PATTERNS['postgresql'].search('  ->  Sort  (cost=10.0..10.1 rows=4 width=8)'))
+        self.assertIsNone(SORT_PATTERNS['sqlite'].search('5 0 0 SEARCH catalog_author USING INDEX author_name_keyset_idx'))
+
+    def test_full_scans_are_detected(self):
+        sqlite = FULL_SCAN_PATTERNS['sqlite']
+        self.assertEqual(_scanned_table(sqlite, '2 0 0 SCAN catalog_bookinstance'), 'catalog_bookinstance')
+        self.assertEqual(_scanned_table(sqlite, '2 0 0 SCAN TABLE catalog_bookinstance'), 'catalog_bookinstance')
+        self.assertIsNone(_scanned_table(sqlite, '6 0 0 SCAN catalog_bookinstance USING INDEX bookinst_borrowed_idx'))
+        self.assertIsNone(_scanned_table(sqlite, '4 0 0 SEARCH catalog_bookinstance USING INDEX bookinst_due_back_idx'))
+
+        postgresql = FULL_SCAN_PATTERNS['postgresql']
+        self.assertEqual(_scanned_table(postgresql, 'Seq Scan on catalog_bookinstance  (cost=0.00..1.01)'), 'catalog_bookinstance')
+        self.assertIsNone(_scanned_table(postgresql, 'Index Scan using bookinst_due_back_idx on catalog_bookinstance'))
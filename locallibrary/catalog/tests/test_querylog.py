@@ -0,0 +1,105 @@
+from django.contrib.auth.models import User
+from django.template import engines
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from catalog import querylog
+from catalog.models import Author, Book
+
+
+class FingerprintTest(TestCase):
+    def test_values_are_removed(self):
+        self.assertEqual(
+            querylog.fingerprint("SELECT * FROM \"catalog_book\" WHERE id = 12 AND title = 'It''s'"),
+            'SELECT * FROM "catalog_book" WHERE id = ? AND title = ?',
+        )
+
+    def test_lists_are_collapsed(self):
+        self.assertEqual(
+            querylog.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            querylog.fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+        )
+
+
+@override_settings(CATALOG_QUERY_LOG=True, CATALOG_NPLUSONE_THRESHOLD=3, CATALOG_SLOW_QUERY_MS=60 * 1000)
+class QueryLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='1X<ISRUkw+tuK')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        for number in range(4):
+            Book.objects.create(title=f'Book {number}', summary='Summary', isbn=f'ISBN{number}', author=cls.author)
+
+    def watch(self, run):
+        querylog.install()
+        log = querylog.QueryLog(RequestFactory().get('/catalog/books/'))
+        token = querylog._log.set(log)
+        try:
+            run()
+        finally:
+            querylog._log.reset(token)
+        return log
+
+    def test_template_loop_is_flagged_with_its_line(self):
+        template = engines['django'].from_string(
+            '<ul>\n{% for book in books %}\n<li>{{ book.author.last_name }}</li>\n{% endfor %}\n</ul>'
+        )
+        log = self.watch(lambda: template.render({'books': Book.objects.all()}))
+
+        [(sql, count, origin)] = log.repeated()
+        self.assertIn('"catalog_author"', sql)
+        self.assertEqual(count, 4)
+        self.assertEqual(origin, '<unknown source>, line 3')
+
+        with self.assertLogs('catalog.queries', 'WARNING') as logs:
+            log.finish()
+        self.assertIn('N+1 query on /catalog/books/ (/catalog/books/): 4 x SELECT', logs.output[0])
+
+    def test_code_loop_is_flagged_with_its_line(self):
+        log = self.watch(lambda: [book.author for book in Book.objects.all()])
+        [(_, count, origin)] = log.repeated()
+        self.assertEqual(count, 4)
+        self.assertRegex(origin, r'^catalog/tests/test_querylog.py:\d+ in <listcomp>$')
+
+    def test_prefetched_loop_is_not_flagged(self):
+        log = self.watch(lambda: [book.author for book in Book.objects.select_related('author')])
+        self.assertEqual(log.repeated(), [])
+
+    def test_requests_are_watched(self):
+        self.client.force_login(self.user)
+        with override_settings(CATALOG_NPLUSONE_THRESHOLD=1), self.assertLogs('catalog.queries', 'WARNING') as logs:
+            self.client.get(reverse('authors'))
+        self.assertTrue(all('N+1 query on authors (/catalog/authors/)' in line for line in logs.output))
+
+    @override_settings(CATALOG_SLOW_QUERY_MS=0)
+    def test_slow_queries_are_explained(self):
+        with self.assertLogs('catalog.queries', 'WARNING') as logs:
+            self.watch(lambda: list(Book.objects.filter(title='Book 1')))
+        [line] = logs.output
+        self.assertIn('Slow query', line)
+        self.assertIn('catalog/tests/test_querylog.py', line)
+        self.assertIn('EXPLAIN:\n', line)
+        self.assertIn('catalog_book', line.split('EXPLAIN:\n')[1])
+
+    @override_settings(CATALOG_SLOW_QUERY_MS=0)
+    def test_slow_query_params_are_not_logged(self):
+        with self.assertLogs('catalog.queries', 'WARNING') as logs:
+            self.watch(lambda: list(Book.objects.filter(title='secret-session-key')))
+        [line] = logs.output
+        self.assertNotIn('secret-session-key', line)
+        self.assertIn('params: not logged', line)
+
+    @override_settings(CATALOG_SLOW_QUERY_MS=0, CATALOG_QUERY_LOG_PARAMS=True)
+    def test_slow_query_params_can_be_logged(self):
+        with self.assertLogs('catalog.queries', 'WARNING') as logs:
+            self.watch(lambda: list(Book.objects.filter(title='Book 1')))
+        self.assertIn("params: ('Book 1',)", logs.output[0])
+
+
+@override_settings(CATALOG_QUERY_LOG=False)
+class QueryLogDisabledTest(TestCase):
+    def test_requests_are_not_watched(self):
+        user = User.objects.create_user(username='user', password='1X<ISRUkw+tuK')
+        self.client.force_login(user)
+        with override_settings(CATALOG_NPLUSONE_THRESHOLD=1), self.assertNoLogs('catalog.queries'):
+            self.client.get(reverse('authors'))
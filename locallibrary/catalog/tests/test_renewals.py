@@ -0,0 +1,146 @@
+import datetime
+import json
+import uuid
+
+from django.contrib.auth.models import Permission, User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Book, BookInstance
+from catalog.renewals import renew_copies
+
+TODAY = datetime.date.today()
+
+
+class RenewCopiesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        cls.copies = [
+            BookInstance.objects.create(
+                book=cls.book, imprint='Imprint', status='o', due_back=TODAY - datetime.timedelta(days=2),
+            )
+            for _ in range(3)
+        ]
+
+    def test_renews_every_copy_with_one_update(self):
+        renewal_date = TODAY + datetime.timedelta(weeks=2)
+        with CaptureQueriesContext(connection) as context:
+            results = renew_copies([copy.pk for copy in self.copies], renewal_date)
+
+        self.assertEqual([result['status'] for result in results], ['renewed'] * 3)
+        self.assertEqual(
+            set(BookInstance.objects.values_list('due_back', flat=True)), {renewal_date}
+        )
+        updates = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('UPDATE "catalog_bookinstance"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_renewed_copies_are_no_longer_overdue(self):
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_overdue, 3)
+        renew_copies([self.copies[0].pk], TODAY + datetime.timedelta(weeks=1))
+        self.assertFalse(BookInstance.objects.get(pk=self.copies[0].pk).overdue)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_overdue, 2)
+
+    def test_every_renewal_gets_a_result(self):
+        missing = uuid.uuid4()
+        results = renew_copies([
+            {'id': str(self.copies[0].pk), 'renewal_date': (TODAY - datetime.timedelta(days=1)).isoformat()},
+            {'id': str(self.copies[1].pk), 'renewal_date': (TODAY + datetime.timedelta(weeks=5)).isoformat()},
+            'not-a-uuid',
+            str(missing),
+            str(self.copies[2].pk),
+            str(self.copies[2].pk),
+        ], (TODAY + datetime.timedelta(days=7)).isoformat())
+
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['invalid', 'invalid', 'invalid', 'invalid', 'renewed', 'invalid'],
+        )
+        # the rules of RenewBookForm.clean_renewal_date apply to every copy
+        self.assertEqual(results[0]['errors'], ['Invalid date: Your renewal date is in the past.'])
+        self.assertIn('more than 4 weeks', results[1]['errors'][0])
+        self.assertEqual(results[2]['errors'], ['Invalid copy id.'])
+        self.assertEqual(results[3]['errors'], ['No copy with this id.'])
+        self.assertEqual(results[4]['due_back'], (TODAY + datetime.timedelta(days=7)).isoformat())
+
+        # the invalid renewals are not applied
+        self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).due_back, TODAY - datetime.timedelta(days=2))
+
+
+class RenewBooksViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        cls.copies = [
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=cls.librarian,
+                due_back=TODAY + datetime.timedelta(days=1),
+            )
+            for _ in range(2)
+        ]
+
+    def test_bulk_renewal_form(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        renewal_date = TODAY + datetime.timedelta(weeks=3)
+        response = self.client.post(reverse('renew-books-librarian'), {
+            'copies': [str(copy.pk) for copy in self.copies],
+            'renewal_date': renewal_date.isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '2 of 2 books renewed')
+        self.assertEqual(set(BookInstance.objects.values_list('due_back', flat=True)), {renewal_date})
+
+    def test_bulk_renewal_form_requires_permission(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.post(reverse('renew-books-librarian'), {'copies': [str(self.copies[0].pk)]})
+        self.assertEqual(response.status_code, 403)
+
+    def test_borrowed_list_links_to_bulk_renewal(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('all-borrowed'))
+        self.assertContains(response, reverse('renew-books-librarian'))
+        self.assertContains(response, f'value="{self.copies[0].pk}"')
+
+    def post_api(self, payload):
+        return self.client.post(reverse('api-renewals'), json.dumps(payload), content_type='application/json')
+
+    def test_api(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.post_api({
+            'renewal_date': (TODAY + datetime.timedelta(weeks=1)).isoformat(),
+            'copies': [str(self.copies[0].pk), {'id': str(self.copies[1].pk), 'renewal_date': 'soon'}],
+        })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['renewed'], 1)
+        self.assertEqual([result['status'] for result in body['results']], ['renewed', 'invalid'])
+
+    def test_api_rejects_dates_that_are_not_strings(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.post_api({
+            'renewal_date': (TODAY + datetime.timedelta(weeks=1)).isoformat(),
+            'copies': [{'id': str(self.copies[0].pk), 'renewal_date': ['2022-02-01']}, str(self.copies[1].pk)],
+        })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([result['status'] for result in body['results']], ['invalid', 'renewed'])
+        self.assertEqual(body['results'][0]['errors'], ['Enter a valid date.'])
+
+    def test_api_rejects_bad_requests(self):
+        self.assertEqual(self.post_api({'copies': []}).status_code, 401)
+
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.assertEqual(self.post_api({'copies': []}).status_code, 403)
+
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.post_api({'copies': 'all'}).status_code, 400)
+        self.assertEqual(self.post_api({'copies': [], 'renewal_date': 20220201}).status_code, 400)
+        response = self.client.post(reverse('api-renewals'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-renewals')).status_code, 405)
@@ -0,0 +1,76 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from catalog import routers
+from catalog.middleware import PrimaryPinningMiddleware
+from catalog.models import Book
+from catalog.routers import PIN_COOKIE, PrimaryReplicaRouter
+
+
+@override_settings(CATALOG_READ_REPLICAS=['replica'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    databases = {DEFAULT_DB_ALIAS}
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.tokens = routers.start_pinning()
+
+    def tearDown(self):
+        routers.stop_pinning(self.tokens)
+
+    def test_catalog_reads_go_to_a_replica(self):
+        self.assertEqual(self.router.db_for_read(Book), 'replica')
+        # the users and sessions stay on the primary
+        self.assertEqual(self.router.db_for_read(User), DEFAULT_DB_ALIAS)
+
+    @override_settings(CATALOG_READ_REPLICAS=[])
+    def test_reads_go_to_the_primary_without_replicas(self):
+        self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Book), DEFAULT_DB_ALIAS)
+        self.assertTrue(routers.wrote_to_primary())
+        self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'catalog'))
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'catalog'))
+
+    def test_pinned_browser_reads_from_the_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Book))
+            return HttpResponse()
+
+        middleware = PrimaryPinningMiddleware(view)
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        response = middleware(request)
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(seen, [DEFAULT_DB_ALIAS, 'replica'])
+        # reading does not renew the pin
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class PrimaryPinningMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+
+    def test_writing_pins_the_browser_to_the_primary(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.post(reverse('place-hold', args=[self.book.pk]))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+    def test_reading_does_not_pin_the_browser(self):
+        response = self.client.get(reverse('books'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
@@ -0,0 +1,112 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, Genre
+from catalog.search import SearchResults, get_backend, search_terms
+
+class SearchIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.wizard = Book.objects.create(
+            title='A Wizard of Earthsea', summary='A young mage learns his true name.',
+            isbn='9780553383041', author=cls.author,
+        )
+        cls.wizard.genre.set([cls.genre])
+        cls.other = Book.objects.create(
+            title='The Left Hand of Darkness', summary='An envoy visits a wizard planet.',
+            isbn='9780441478125', author=Author.objects.create(first_name='Jane', last_name='Doe'),
+        )
+
+    def search(self, query):
+        return list(SearchResults(query)[:10])
+
+    def test_search_terms_drop_query_syntax(self):
+        self.assertEqual(search_terms('"wizard" OR name*'), ['wizard', 'or', 'name'])
+
+    def test_search_by_title_summary_isbn_author_and_genre(self):
+        self.assertEqual(self.search('earthsea'), [self.wizard])
+        self.assertEqual(self.search('mage'), [self.wizard])
+        self.assertEqual(self.search('9780441478125'), [self.other])
+        self.assertEqual(self.search('guin'), [self.wizard])
+        self.assertEqual(self.search('fantasy'), [self.wizard])
+
+    def test_prefix_search(self):
+        self.assertEqual(self.search('earth'), [self.wizard])
+
+    def test_title_match_ranks_first(self):
+        # 'wizard' is in the title of one book and the summary of the other
+        self.assertEqual(self.search('wizard'), [self.wizard, self.other])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('wizard darkness'), [self.other])
+        self.assertEqual(SearchResults('wizard darkness').count(), 1)
+
+    def test_empty_query_has_no_results(self):
+        self.assertEqual(self.search(''), [])
+
+    def test_book_update_is_indexed(self):
+        self.other.title = 'The Dispossessed'
+        self.other.save()
+        self.assertEqual(self.search('dispossessed'), [self.other])
+        self.assertEqual(self.search('darkness'), [])
+
+    def test_deleted_book_is_removed(self):
+        self.other.delete()
+        self.assertEqual(self.search('wizard'), [self.wizard])
+
+    def test_author_rename_is_indexed(self):
+        self.author.last_name = 'Leguin'
+        self.author.save()
+        self.assertEqual(self.search('leguin'), [self.wizard])
+
+    def test_genre_changes_are_indexed(self):
+        self.other.genre.add(self.genre)
+        self.assertCountEqual(self.search('fantasy'), [self.wizard, self.other])
+
+        self.genre.book_set.clear()
+        self.assertEqual(self.search('fantasy'), [])
+
+    def test_deleted_genre_is_removed(self):
+        self.genre.delete()
+        self.assertEqual(self.search('fantasy'), [])
+
+    def test_rebuild(self):
+        backend = get_backend()
+        backend.remove_books([self.wizard.pk, self.other.pk])
+        self.assertEqual(self.search('wizard'), [])
+        backend.rebuild()
+        self.assertEqual(self.search('wizard'), [self.wizard, self.other])
+
+
+class BookSearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        for number in range(13):
+            Book.objects.create(title=f'Garden {number}', summary='Summary', isbn=f'{number:013d}')
+
+    def setUp(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(reverse('search'), {'q': 'garden'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_search.html')
+
+    def test_results_are_paginated(self):
+        response = self.client.get(reverse('search'), {'q': 'garden'})
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['book_list']), 10)
+        self.assertEqual(response.context['paginator'].count, 13)
+
+        response = self.client.get(reverse('search'), {'q': 'garden', 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 3)
+        self.assertContains(response, '?q=garden&page=1')
+
+    def test_no_results(self):
+        response = self.client.get(reverse('search'), {'q': 'nothing'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 0)
@@ -0,0 +1,67 @@
+import io
+import json
+import os
+import sqlite3
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from catalog.benchmarks import run_sqlite_benchmark, seed_catalog
+from catalog.sqlite import PROFILES, apply_pragmas, configure_connection, profile_pragmas
+
+
+class SqliteProfileTest(SimpleTestCase):
+    def test_production_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'library.sqlite3'))
+            try:
+                apply_pragmas(db, profile_pragmas('production'))
+                self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+                # NORMAL
+                self.assertEqual(db.execute('PRAGMA synchronous').fetchone()[0], 1)
+                self.assertEqual(db.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+                self.assertEqual(db.execute('PRAGMA cache_size').fetchone()[0], PROFILES['production']['cache_size'])
+            finally:
+                db.close()
+
+    def test_no_profile(self):
+        self.assertEqual(profile_pragmas(''), {})
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ImproperlyConfigured):
+            profile_pragmas('fastest')
+
+
+class SqliteConnectionTest(TransactionTestCase):
+    # pragmas like synchronous cannot change inside the transaction of a TestCase
+    @override_settings(CATALOG_SQLITE_PROFILE='production')
+    def test_new_connections_get_the_profile(self):
+        configure_connection(sender=connection.__class__, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA temp_store')
+            # MEMORY
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+class SqliteBenchmarkTest(TransactionTestCase):
+    # the database is copied with the SQLite backup API, which waits for the
+    # transaction of a TestCase to end
+    def setUp(self):
+        seed_catalog(authors=2, books=10, copies=20)
+
+    def test_report_compares_both_configurations(self):
+        report = run_sqlite_benchmark(readers=2, writers=1, seconds=0.2)
+        for name in ('stock', 'production'):
+            self.assertGreater(report[name]['reads_per_second'], 0)
+            self.assertGreater(report[name]['writes_per_second'], 0)
+        self.assertEqual(set(report['speedup']), {'reads_per_second', 'writes_per_second'})
+
+    def test_command_writes_json(self):
+        out = io.StringIO()
+        call_command('benchmark_sqlite', '--readers', '1', '--writers', '1', '--seconds', '0.1', stdout=out)
+        self.assertIn('speedup', json.loads(out.getvalue()))
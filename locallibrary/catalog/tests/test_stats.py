@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre
+from catalog.stats import compute_index_statistics, get_index_statistics
+
+class IndexStatisticsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        genre = Genre.objects.create(name='Fantasy')
+        book = Book.objects.create(title='The Book', summary='The summary', isbn='ABCDEFG', author=author)
+        book.genre.set([genre])
+        Book.objects.create(title='Other Book', summary='A summary', isbn='HIJKLMN', author=author)
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o')
+        User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+
+    def setUp(self):
+        # the cache outlives the rollback of each test, so start every test empty
+        cache.clear()
+
+    def test_statistics_are_computed_in_one_query(self):
+        with self.assertNumQueries(1):
+            statistics = compute_index_statistics()
+
+        self.assertEqual(statistics, {
+            'num_books': 2,
+            'the_books': 1,
+            'num_instances': 2,
+            'num_instances_available': 1,
+            'num_genre': 1,
+            'num_authors': 1,
+        })
+
+    def test_warm_cache_does_not_query_the_database(self):
+        get_index_statistics()
+        with self.assertNumQueries(0):
+            get_index_statistics()
+
+    def test_statistics_are_invalidated_on_save(self):
+        self.assertEqual(get_index_statistics()['num_authors'], 1)
+        Author.objects.create(first_name='Jane', last_name='Doe')
+        self.assertEqual(get_index_statistics()['num_authors'], 2)
+
+    def test_statistics_are_invalidated_on_delete(self):
+        self.assertEqual(get_index_statistics()['num_instances'], 2)
+        BookInstance.objects.filter(status='o').get().delete()
+        self.assertEqual(get_index_statistics()['num_instances'], 1)
+
+    def test_statistics_are_invalidated_on_genre_change(self):
+        get_index_statistics()
+        book = Book.objects.get(title='The Book')
+        book.genre.clear()
+        with self.assertNumQueries(1):
+            get_index_statistics()
+
+    def test_index_view_uses_statistics(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_books'], 2)
+        self.assertEqual(response.context['num_instances_available'], 1)
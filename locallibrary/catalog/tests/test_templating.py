@@ -0,0 +1,112 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.template import Context, Template, engines
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import templating
+from catalog.models import Author, Book
+
+
+def production_templates():
+    templates = copy.deepcopy(settings.TEMPLATES)
+    templates[0]['APP_DIRS'] = False
+    templates[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+    return templates
+
+
+class WarmTemplatesTest(TestCase):
+    def test_site_templates(self):
+        names = templating.site_template_names()
+        self.assertIn('catalog/index.html', names)
+        self.assertIn('registration/login.html', names)
+
+    def test_templates_are_compiled_into_the_cached_loader(self):
+        with override_settings(TEMPLATES=production_templates()):
+            loader = engines['django'].engine.template_loaders[0]
+            self.assertEqual(loader.get_template_cache, {})
+            self.assertEqual(templating.warm_templates(), len(templating.site_template_names()))
+            self.assertIn('catalog/index.html', loader.get_template_cache)
+            self.assertIn('registration/login.html', loader.get_template_cache)
+
+
+@override_settings(CATALOG_TEMPLATE_PROFILING=True)
+class TemplateProfilingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', password='1X<ISRUkw+tuK', is_staff=True)
+        cls.user = User.objects.create_user(username='user', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG', author=author)
+
+    def setUp(self):
+        templating.reset()
+        self.addCleanup(templating.reset)
+
+    def test_templates_and_blocks_are_measured(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('books'))
+
+        rows = {row['name']: row for row in templating.report()['templates']}
+        self.assertIn('template catalog/book_list.html', rows)
+        self.assertIn('template catalog/base_generic.html', rows)
+        self.assertIn('block content of catalog/book_list.html', rows)
+        self.assertEqual(rows['template catalog/book_list.html']['calls'], 1)
+
+        requests = templating.report()['requests']
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0]['view'], 'books')
+        self.assertGreater(requests[0]['queries'], 0)
+
+    def test_queries_of_a_block_are_counted(self):
+        templating.install()
+        template = Template('{% block title %}Authors{% endblock %}{% block content %}{% for author in authors %}{{ author }}{% endfor %}{% endblock %}')
+        profile = templating.Profile('/', None)
+        token = templating._profile.set(profile)
+        try:
+            template.render(Context({'authors': Author.objects.all()}))
+        finally:
+            templating._profile.reset(token)
+
+        self.assertEqual(profile.queries, 1)
+        self.assertEqual(profile.entries['block content of <string>'][2], 1)
+        self.assertEqual(profile.entries['block title of <string>'][2], 0)
+        self.assertEqual(profile.entries['template <string>'][0], 1)
+
+    def test_report_is_staff_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('template-profile'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_report(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('authors'))
+        response = self.client.get(reverse('template-profile'))
+        self.assertContains(response, 'template catalog/author_list.html')
+        self.assertContains(response, '/catalog/authors/')
+        # the report itself is not profiled
+        self.assertEqual(len(templating.report()['requests']), 1)
+
+    def test_reset(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('authors'))
+        response = self.client.post(reverse('template-profile'))
+        self.assertRedirects(response, reverse('template-profile'))
+        self.assertEqual(templating.report(), {'templates': [], 'requests': []})
+
+
+@override_settings(CATALOG_TEMPLATE_PROFILING=False)
+class TemplateProfilingDisabledTest(TestCase):
+    def test_requests_are_not_profiled(self):
+        templating.reset()
+        user = User.objects.create_user(username='user', password='1X<ISRUkw+tuK')
+        self.client.force_login(user)
+        self.client.get(reverse('authors'))
+        self.assertEqual(templating.report()['requests'], [])
@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import visits
+
+
+class VisitCounterTest(TestCase):
+    """
+    The visits of the home page are counted in the cache and saved in the session
+    once per flush interval.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def visit(self):
+        return self.client.get(reverse('index')).context['num_visits']
+
+    def session_writes(self):
+        with CaptureQueriesContext(connection) as context:
+            self.visit()
+        return [query for query in context.captured_queries if 'django_session' in query['sql'] and
+                query['sql'].startswith(('INSERT', 'UPDATE'))]
+
+    def test_counts_the_visits(self):
+        self.assertEqual([self.visit() for _ in range(4)], [0, 1, 2, 3])
+
+    def test_session_saved_once_per_interval(self):
+        # the first visit flushes the count
+        self.assertEqual(len(self.session_writes()), 1)
+        for _ in range(3):
+            self.assertEqual(self.session_writes(), [])
+        self.assertEqual(self.client.session[visits.COUNT_KEY], 1)
+
+        later = self.client.session[visits.FLUSHED_KEY] + visits.flush_interval()
+        with mock.patch('catalog.visits.time.time', return_value=later):
+            self.assertEqual(len(self.session_writes()), 1)
+        self.assertEqual(self.client.session[visits.COUNT_KEY], 5)
+        self.assertEqual(self.visit(), 5)
+
+    @override_settings(CATALOG_VISITS_FLUSH_INTERVAL=0)
+    def test_no_interval_saves_every_visit(self):
+        for count in range(3):
+            self.assertEqual(len(self.session_writes()), 1)
+            self.assertEqual(self.client.session[visits.COUNT_KEY], count + 1)
+
+    def test_evicted_visits_are_lost(self):
+        for _ in range(3):
+            self.visit()
+        cache.delete(visits.pending_key(self.client.session))
+        self.assertEqual(self.visit(), 1)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+class SignedCookieVisitCounterTest(TestCase):
+    """
+    The key of a signed cookie session changes every time it is saved.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        self.client.force_login(self.user)
+
+    def test_counts_the_visits(self):
+        counts = [self.client.get(reverse('index')).context['num_visits'] for _ in range(3)]
+        self.assertEqual(counts, [0, 1, 2])
+
+        later = self.client.session[visits.FLUSHED_KEY] + visits.flush_interval()
+        with mock.patch('catalog.visits.time.time', return_value=later):
+            self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 3)
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 4)
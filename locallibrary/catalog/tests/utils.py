@@ -0,0 +1,64 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Test case mixin for checking how many queries a page needs. A page has a
+    query budget: the number of queries it may run. The budget must not depend
+    on the number of rows on the page, so the helpers also check that adding
+    rows does not add queries (an N+1 pattern).
+    """
+
+    def get_query_count(self, url):
+        """
+        Args:
+            url (str): the url of the page to request
+
+        Returns:
+            tuple: the response and the list of queries that rendering it ran
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            # make sure lazily rendered responses run their queries in the block
+            response.content
+        return response, context.captured_queries
+
+    def assertQueryBudget(self, url, budget):
+        """
+        Assert that rendering the page runs at most budget queries.
+
+        Args:
+            url (str): the url of the page to request
+            budget (int): the maximum number of queries allowed
+
+        Returns:
+            HttpResponse: the response of the page
+        """
+        response, queries = self.get_query_count(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{url} ran {len(queries)} queries, the budget is {budget}:\n'
+            + '\n'.join(query['sql'] for query in queries)
+        )
+        return response
+
+    def assertConstantQueries(self, url, budget, add_rows):
+        """
+        Assert that the page stays within its budget and runs the same number of
+        queries after more rows are added to it.
+
+        Args:
+            url (str): the url of the page to request
+            budget (int): the maximum number of queries allowed
+            add_rows (callable): adds more rows that are displayed on the page
+        """
+        self.assertQueryBudget(url, budget)
+        _, before = self.get_query_count(url)
+        add_rows()
+        _, after = self.get_query_count(url)
+        self.assertEqual(
+            len(before), len(after),
+            f'{url} went from {len(before)} to {len(after)} queries when rows were added'
+        )
@@ -1,19 +1,51 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, autocomplete, metrics, views
+
+# the read-only pages, and their async versions served under ASGI (see catalog/async_views.py)
+sync_read_views = {
+    'index': views.index,
+    'books': views.BookListView.as_view(),
+    'book-detail': views.BookDetailView.as_view(),
+    'authors': views.AuthorListView.as_view(),
+    'author-detail': views.AuthorDetailView.as_view(),
+    'my-borrowed': views.LoanedBooksByUserListView.as_view(),
+}
+async_read_views = {
+    'index': async_views.index,
+    'books': async_views.book_list,
+    'book-detail': async_views.book_detail,
+    'authors': async_views.author_list,
+    'author-detail': async_views.author_detail,
+    'my-borrowed': async_views.loaned_books_by_user,
+}
+read_views = async_read_views if getattr(settings, 'CATALOG_ASYNC_VIEWS', False) else sync_read_views
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('books/', views.BookListView.as_view(), name='books'),
-    path('book/<int:pk>/', views.BookDetailView.as_view(), name='book-detail'),
-    path('authors/', views.AuthorListView.as_view(), name='authors'),
-    path('author/<int:pk>/', views.AuthorDetailView.as_view(), name='author-detail'),
-    path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
+    path('', read_views['index'], name='index'),
+    path('books/', read_views['books'], name='books'),
+    path('book/<int:pk>/', read_views['book-detail'], name='book-detail'),
+    path('authors/', read_views['authors'], name='authors'),
+    path('author/<int:pk>/', read_views['author-detail'], name='author-detail'),
+    path('search/', views.BookSearchView.as_view(), name='search'),
+    path('mybooks/', read_views['my-borrowed'], name='my-borrowed'),
     path('allborrowed/', views.AllBorrowedBooks.as_view(), name='all-borrowed'),
+    path('overdue/', views.OverdueBooksListView.as_view(), name='all-overdue'),
+    path('export/', views.export_catalog, name='catalog-export'),
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('book/renew/', views.renew_books_librarian, name='renew-books-librarian'),
+    path('api/renewals/', views.renew_books_api, name='api-renewals'),
+    path('api/<slug:resource>/', api.collection, name='api-collection'),
+    path('api/<slug:resource>/<str:pk>/', api.detail, name='api-detail'),
+    path('book/<int:pk>/hold/', views.place_hold, name='place-hold'),
+    path('hold/<int:pk>/cancel/', views.cancel_hold, name='cancel-hold'),
     path('author/create/', views.AuthorCreate.as_view(), name='author-create'),
     path('author/<int:pk>/update/', views.AuthorUpdate.as_view(), name='author-update'),
     path('author/<int:pk>/delete/', views.AuthorDelete.as_view(), name='author-delete'),
     path('book/create/', views.BookCreate.as_view(), name='book-create'),
     path('book/<int:pk>/update/', views.BookUpdate.as_view(), name='book-update'),
     path('book/<int:pk>/delete/', views.BookDelete.as_view(), name='book-delete'),
+    path('autocomplete/<slug:source>/', autocomplete.lookup, name='autocomplete'),
+    path('profiling/templates/', views.template_profile, name='template-profile'),
+    path('metrics/', metrics.export, name='metrics'),
 ]
\ No newline at end of file
@@ -1,13 +1,26 @@
 
 from django.shortcuts import render, get_object_or_404
-from .models import Book, Author, BookInstance, Language, Genre
+from .models import Book, Author, BookInstance, Hold, Language, Genre
 from django.views.generic import ListView, DetailView
+from django.db.models import Prefetch
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required, permission_required
-from django.http import HttpResponseRedirect
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.views.decorators.http import require_POST
 import datetime
-from .forms import RenewBookForm
+import json
+import uuid
+from . import exporters, holds, templating, visits
+from .conditional import ConditionalGetMixin
+from .forms import BookForm, RenewBookForm
+from .fragments import FragmentCacheMixin
+from .pagination import CursorPaginationMixin
+from .renewals import renew_copies
+from .search import SearchResults
+from .stats import get_index_statistics
 
 
 @login_required(login_url='/accounts/login')
@@ -22,39 +35,23 @@ def index(request):
     Returns:
         html that is displayed to the end-user.
     """    
-    # get the count of most of the items
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    num_genre = Genre.objects.all().count()
+    # get the counts of the catalog items. They are computed in a single query and
+    # cached until a book, copy, genre or author changes.
+    statistics = get_index_statistics()
 
-    # get all books with 'The' in the summary
-    the_books = Book.objects.filter(summary__contains='The').count()
-
-    # Available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-
-    # The 'all()' is implied by default.
-    num_authors = Author.objects.count()
-
-    # count the number of times someone has visited the homepage and store that information
-    # in a session
-    num_visits = request.session.get('num_visits', 0)
-    request.session['num_visits'] = num_visits + 1
+    # count the number of times someone has visited the homepage. The visits are counted
+    # in the cache and only saved in the session now and then (see catalog/visits.py).
+    num_visits = visits.record_visit(request)
 
     context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-        'the_books': the_books,
-        'num_genre': num_genre,
+        **statistics,
         'num_visits': num_visits
     }
 
     # Render the HTML template index.html with the data in the context variable
     return render(request, 'catalog/index.html', context=context)
 
-class BookListView(LoginRequiredMixin, ListView):
+class BookListView(LoginRequiredMixin, ConditionalGetMixin, CursorPaginationMixin, ListView):
     """
     Generates a list all books in the database. It extends Django's generic view ListView 
     which does most of the work of retrieving the data and displaying using the appropriate 
@@ -70,12 +67,24 @@ class BookListView(LoginRequiredMixin, ListView):
     """    
 
     model = Book
+
+    # the list only shows the title, the author and the availability of every book. Load the
+    # author with the book in the same query and skip the columns the template does not use.
+    queryset = Book.objects.select_related('author').only(
+        'title', 'copies_total', 'copies_available', 'author__first_name', 'author__last_name'
+    )
+    ordering = ['title']
+
+    # the page changes with the books and their authors, whose changes bump the version of
+    # the books too. A 304 is sent when none changed.
+    version_models = (Book,)
+
     # paginate enables the list view to fetch a certain number of records per page. This is
     # useful when the records are plenty and it is not possible to display all in one page.
     paginate_by = 3 
 
 
-class BookDetailView(LoginRequiredMixin, DetailView):
+class BookDetailView(LoginRequiredMixin, ConditionalGetMixin, FragmentCacheMixin, DetailView):
     """
     Generates a detail view of books in the database. It extends Django's generic view DetailView 
     which does most of the work of retrieving the data and displaying using the appropriate 
@@ -91,7 +100,21 @@ class BookDetailView(LoginRequiredMixin, DetailView):
     """    
     model = Book
 
-class AuthorListView(LoginRequiredMixin, ListView):
+    # the page shows the author, language, genres and every copy of the book. Load the
+    # foreign keys with a join and the many-valued relations in one query each.
+    queryset = Book.objects.select_related('author', 'language').prefetch_related(
+        'genre', 'bookinstance_set'
+    )
+
+    # the content of the page is cached until the book, its copies, genres, author or
+    # language change. When it is cached only the id of the book is needed.
+    fragment_name = 'book-detail'
+    fragment_queryset = Book.objects.only('pk')
+
+    # a 304 is sent when neither the book, its author nor its copies changed
+    last_modified_fields = ('updated_at', 'author__updated_at', 'bookinstance__updated_at')
+
+class AuthorListView(LoginRequiredMixin, ConditionalGetMixin, CursorPaginationMixin, ListView):
     """
     Generates a list all authors in the database. It extends Django's generic view ListView 
     which does most of the work of retrieving the data and displaying using the appropriate 
@@ -106,12 +129,16 @@ class AuthorListView(LoginRequiredMixin, ListView):
             a HTML view.
     """    
     model = Author
+    ordering = ['last_name', 'first_name']
+
+    # a 304 is sent when no author changed
+    version_models = (Author,)
 
     # paginate enables the list view to fetch a certain number of records per page. This is
     # useful when the records are plenty and it is not possible to display all in one page.
     paginate_by = 4 
 
-class AuthorDetailView(LoginRequiredMixin, DetailView):
+class AuthorDetailView(LoginRequiredMixin, ConditionalGetMixin, FragmentCacheMixin, DetailView):
     """
     Generates a detail view of authors in the database. It extends Django's generic view DetailView 
     which does most of the work of retrieving the data and displaying using the appropriate 
@@ -127,7 +154,19 @@ class AuthorDetailView(LoginRequiredMixin, DetailView):
     """    
     model = Author
 
-class LoanedBooksByUserListView(LoginRequiredMixin, ListView):
+    # the page lists the title and summary of every book by the author in a single query.
+    queryset = Author.objects.prefetch_related(
+        Prefetch('book_set', queryset=Book.objects.only('title', 'summary', 'author'))
+    )
+
+    # the content of the page is cached until the author or one of their books change.
+    fragment_name = 'author-detail'
+    fragment_queryset = Author.objects.only('pk')
+
+    # a 304 is sent when neither the author nor one of their books changed
+    last_modified_fields = ('updated_at', 'book__updated_at')
+
+class LoanedBooksByUserListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     """
     Generates a list of all books instances borrowed by the user. It extends Django's generic view ListView 
     which does most of the work of retrieving the data and displaying using the appropriate 
@@ -144,6 +183,7 @@ class LoanedBooksByUserListView(LoginRequiredMixin, ListView):
     """ 
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
+    ordering = ['due_back']
 
     paginate_by = 10
 
@@ -151,10 +191,25 @@ class LoanedBooksByUserListView(LoginRequiredMixin, ListView):
         """
             Get list of books on loan to user
         """
-        return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')   
+        return (
+            BookInstance.objects.filter(borrower=self.request.user)
+            .filter(status__exact='o')
+            .select_related('book')
+            .order_by(*self.get_ordering())
+        )
+
+    def get_holds(self):
+        """
+            Get the waiting and ready holds of the user, with the copy reserved for the ready ones
+        """
+        return Hold.objects.filter(user=self.request.user, status__in=('w', 'r')).select_related('book', 'copy')
 
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('holds', self.get_holds())
+        return super().get_context_data(**kwargs)
 
-class AllBorrowedBooks(PermissionRequiredMixin, ListView):
+
+class AllBorrowedBooks(PermissionRequiredMixin, CursorPaginationMixin, ListView):
     """
     Generates a list of all books instances borrowed by all users. It extends Django's generic view ListView 
     which does most of the work of retrieving the data and displaying using the appropriate 
@@ -172,6 +227,7 @@ class AllBorrowedBooks(PermissionRequiredMixin, ListView):
     model = BookInstance
     template_name = 'catalog/all_borrowed_books_list.html'
     permission_required = 'catalog.can_mark_returned'
+    ordering = ['borrower']
     
     paginate_by = 10
 
@@ -179,7 +235,59 @@ class AllBorrowedBooks(PermissionRequiredMixin, ListView):
         """Gets a list all books instances that have been borrowed with the borrower
             field not null or empty.
         """
-        return BookInstance.objects.exclude(borrower__isnull=True).order_by('borrower')
+        return (
+            BookInstance.objects.exclude(borrower__isnull=True)
+            .select_related('book', 'borrower')
+            .order_by(*self.get_ordering())
+        )
+
+
+class OverdueBooksListView(AllBorrowedBooks):
+    """
+    Generates a list of the overdue books instances, the longest overdue first. The
+    overdue status is stored on the copies by the overdue sweep (see catalog/overdue.py),
+    so the list is read from an index of the overdue copies.
+    """
+    ordering = ['due_back']
+
+    def get_queryset(self):
+        """Gets a list of the books instances that were overdue at the last sweep."""
+        return BookInstance.objects.overdue().select_related('book', 'borrower').order_by(*self.get_ordering())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['overdue_only'] = True
+        return context
+
+
+class BookSearchView(LoginRequiredMixin, ListView):
+    """
+    Generates a ranked list of the books matching the text typed in the search box. The
+    books are found in the full-text index (see catalog/search.py) which covers the title,
+    summary, isbn, author and genres of every book.
+
+    Args:
+        ListView (Generic View): Django's generic view for displaying a list of model
+        objects.
+
+    Returns:
+            Returns the matching books, the best match first. The list is rendered in
+            a HTML view.
+    """
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+
+    def get_queryset(self):
+        """
+            Get the search results. They are only read from the index one page at a time.
+        """
+        return SearchResults(self.request.GET.get('q', ''))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
 
 
 @login_required
@@ -188,7 +296,7 @@ def renew_book_librarian(request, pk):
     """
         A function for renewing the due_date of a book.
     """    
-    book_instance = get_object_or_404(BookInstance, pk=pk)
+    book_instance = get_object_or_404(BookInstance.objects.select_related('book', 'borrower'), pk=pk)
      
     # if this is a post request, then process the request
     if request.method == 'POST':
@@ -215,6 +323,142 @@ def renew_book_librarian(request, pk):
     return render(request, 'catalog/book_renew_librarian.html', context=context)
 
 
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+@require_POST
+def renew_books_librarian(request):
+    """
+        Renew the copies checked on the list of borrowed books until the same date, in
+        one transaction (see catalog/renewals.py), and show the result for every copy.
+    """
+    results = renew_copies(request.POST.getlist('copies'), request.POST.get('renewal_date'))
+
+    # show the renewed copies with their title and borrower, loaded in one query
+    copies = BookInstance.objects.select_related('book', 'borrower').in_bulk(
+        [result['id'] for result in results if result['status'] == 'renewed']
+    )
+    for result in results:
+        result['copy'] = copies.get(uuid.UUID(result['id'])) if result['status'] == 'renewed' else None
+
+    context = {
+        'results': results,
+        'renewed': len(copies),
+    }
+    return render(request, 'catalog/book_renew_bulk.html', context=context)
+
+
+@require_POST
+def renew_books_api(request):
+    """
+        Renew many copies from a JSON body:
+
+            {"renewal_date": "2022-02-01", "copies": ["<id>", {"id": "<id>", "renewal_date": "2022-02-03"}]}
+
+        A copy given as an object may have its own renewal date. The response has the
+        result of every renewal, in order, and the number of copies renewed.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    if not request.user.has_perm('catalog.can_mark_returned'):
+        return JsonResponse({'error': 'Permission denied.'}, status=403)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'The body is not valid JSON.'}, status=400)
+    if not isinstance(payload, dict) or not isinstance(payload.get('copies'), list):
+        return JsonResponse({'error': 'The body must be an object with a list of copies.'}, status=400)
+    if not isinstance(payload.get('renewal_date', ''), (str, type(None))):
+        return JsonResponse({'error': 'The renewal date must be a string.'}, status=400)
+
+    results = renew_copies(payload['copies'], payload.get('renewal_date'))
+    return JsonResponse({
+        'renewed': sum(result['status'] == 'renewed' for result in results),
+        'results': results,
+    })
+
+
+@login_required
+@require_POST
+def place_hold(request, pk):
+    """
+        Put the user in the queue of a book (see catalog/holds.py). A copy is reserved
+        for them at once when one is available and nobody is waiting.
+    """
+    book = get_object_or_404(Book.objects.only('pk', 'title'), pk=pk)
+    try:
+        hold = holds.place_hold(book, request.user)
+    except holds.HoldError as error:
+        messages.error(request, str(error))
+    else:
+        if hold.status == 'r':
+            messages.success(request, f'A copy of {book.title} is reserved for you.')
+        else:
+            messages.success(request, f'You are number {holds.queue_position(hold)} in the queue for {book.title}.')
+    return HttpResponseRedirect(reverse('my-borrowed'))
+
+
+@login_required
+@require_POST
+def cancel_hold(request, pk):
+    """
+        Take one of the user's holds out of its queue.
+    """
+    try:
+        holds.cancel_hold(pk, user=request.user)
+    except holds.HoldError as error:
+        messages.error(request, str(error))
+    else:
+        messages.success(request, 'Your hold was cancelled.')
+    return HttpResponseRedirect(reverse('my-borrowed'))
+
+
+@staff_member_required
+def export_catalog(request):
+    """
+        Stream the whole inventory of the catalog as CSV or JSON lines, optionally
+        compressed with gzip. The rows are produced while the response is sent, so
+        the size of the catalog does not change the memory used.
+
+        The format is chosen with ?format=csv (default) or ?format=jsonl and the
+        compression with ?gzip=1.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exporters.FORMATS:
+        return HttpResponseBadRequest(f'Unknown export format: {export_format}')
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+
+    content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    filename = f'catalog.{export_format}'
+    response = StreamingHttpResponse(
+        exporters.export_catalog(export_format, compress=compress),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    if compress:
+        # the file is sent compressed, it is not a content encoding of the csv
+        response['Content-Type'] = 'application/gzip'
+        filename += '.gz'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def template_profile(request):
+    """
+        Show the staff the render time and the queries of the templates and blocks
+        measured by catalog.templating.TemplateProfilingMiddleware, slowest first,
+        and the last requests profiled. Posting to the page resets the measurements.
+    """
+    if request.method == 'POST':
+        templating.reset()
+        messages.success(request, 'The template profile was reset.')
+        return HttpResponseRedirect(reverse('template-profile'))
+
+    context = templating.report()
+    context['enabled'] = templating.profiling_enabled()
+    return render(request, 'catalog/template_profile.html', context)
+
+
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 
@@ -233,11 +477,11 @@ class AuthorDelete(LoginRequiredMixin, DeleteView):
 
 class BookCreate(LoginRequiredMixin, CreateView):
     model = Book
-    fields = '__all__'
+    form_class = BookForm
 
 class BookUpdate(LoginRequiredMixin, UpdateView):
     model = Book
-    fields = '__all__'
+    form_class = BookForm
     
 class BookDelete(LoginRequiredMixin, DeleteView):
     model = Book
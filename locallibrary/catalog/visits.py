@@ -0,0 +1,97 @@
+"""
+Batched counting of the visits of the home page.
+
+The home page shows how many times the session visited it. Keeping the count in
+the session changes the session on every visit, and the database session backend
+then writes the session row on every page view.
+
+The visits are counted in the cache instead, under a key of the session, and
+added to the count kept in the session once every CATALOG_VISITS_FLUSH_INTERVAL
+seconds. The session is then only saved when the count is flushed, whatever the
+session backend is (see CATALOG_SESSION_MODE in the settings). Visits not flushed
+yet are lost if the cache evicts them or when the session key changes, eg when
+the user logs in again, which is fine for a count shown to the user. Set the
+interval to 0 to save the count in the session on every visit.
+
+The pending visits need the cache shared by the processes of the site (see
+CATALOG_CACHE_LOCATION in the settings), or the visits a session makes to the
+other workers are missed by the worker that flushes them.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# the count of the flushed visits and when it was last flushed, kept in the session
+COUNT_KEY = 'num_visits'
+FLUSHED_KEY = 'num_visits_flushed_at'
+
+
+def flush_interval():
+    """
+    Returns:
+        int: how often the visits counted in the cache are saved in the session, in seconds
+    """
+    return getattr(settings, 'CATALOG_VISITS_FLUSH_INTERVAL', 5 * 60)
+
+
+def pending_key(session):
+    """
+    Args:
+        session (SessionBase): the session of a request
+
+    Returns:
+        str: the cache key of the visits of the session not flushed yet, or None if
+             the session has no key yet. The key of a signed cookie session is the
+             cookie itself, so it is hashed to keep cache keys short.
+    """
+    if not session.session_key:
+        return None
+    return 'catalog:visits:%s' % hashlib.sha1(session.session_key.encode()).hexdigest()
+
+
+def _count_pending(key):
+    """
+    Args:
+        key (str): the cache key of the visits of a session
+
+    Returns:
+        int: the number of visits not flushed yet, including the one being counted
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the first visit since the last flush. The key is kept as long as the
+        # session cookie, another request may have created it meanwhile.
+        if cache.add(key, 1, timeout=settings.SESSION_COOKIE_AGE):
+            return 1
+        return cache.incr(key)
+
+
+def record_visit(request):
+    """
+    Count a visit of the home page.
+
+    Args:
+        request (HttpRequest): the request, with its session
+
+    Returns:
+        int: the number of earlier visits of the session
+    """
+    session = request.session
+    flushed = session.get(COUNT_KEY, 0)
+    key = pending_key(session)
+    if key is None or not flush_interval():
+        session[COUNT_KEY] = flushed + 1
+        return flushed
+
+    pending = _count_pending(key)
+    now = time.time()
+    if now - session.get(FLUSHED_KEY, 0) >= flush_interval():
+        session[COUNT_KEY] = flushed + pending
+        session[FLUSHED_KEY] = now
+        # visits counted meanwhile by other requests stay pending
+        cache.decr(key, pending)
+    return flushed + pending - 1
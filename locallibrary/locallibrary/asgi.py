@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'locallibrary.settings')
+# serve the read-only catalog pages with async views
+os.environ.setdefault('CATALOG_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.metrics.RequestMetricsMiddleware',
+    'catalog.querylog.QueryLogMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +56,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'catalog.middleware.PrimaryPinningMiddleware',
+    'catalog.templating.TemplateProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'locallibrary.urls'
@@ -74,8 +78,83 @@ TEMPLATES = [
     },
 ]
 
+# In the production template mode the templates are loaded through the cached
+# loader, whatever DEBUG is, and compiled when the process starts (see
+# catalog/templating.py). The loaders replace APP_DIRS, which Django does not
+# allow with them.
+CATALOG_TEMPLATE_MODE = os.environ.get('CATALOG_TEMPLATE_MODE', 'development')
+
+if CATALOG_TEMPLATE_MODE == 'production':
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# Time the rendering of every template and {% block %}, and count its queries.
+# The staff see the results at /catalog/profiling/templates/. The report keeps
+# the last CATALOG_TEMPLATE_PROFILE_HISTORY requests.
+CATALOG_TEMPLATE_PROFILING = bool(os.environ.get('CATALOG_TEMPLATE_PROFILING'))
+CATALOG_TEMPLATE_PROFILE_HISTORY = 50
+
+# Measure the latency, queries, cache lookups and response size of the requests
+# per url name, and serve them in the Prometheus text format at
+# /catalog/metrics/ to the staff and to the scrapers sending CATALOG_METRICS_TOKEN
+# as a bearer token (see catalog/metrics.py). Without a token only the staff can
+# read them. CATALOG_METRICS_SAMPLE_RATE is the share of the requests measured.
+CATALOG_METRICS = bool(os.environ.get('CATALOG_METRICS'))
+CATALOG_METRICS_SAMPLE_RATE = float(os.environ.get('CATALOG_METRICS_SAMPLE_RATE', '1'))
+CATALOG_METRICS_TOKEN = os.environ.get('CATALOG_METRICS_TOKEN', '')
+
+# Log the queries of the requests taking CATALOG_SLOW_QUERY_MS or more, with
+# their EXPLAIN, and the queries run CATALOG_NPLUSONE_THRESHOLD times or more by
+# a request, with the template line or code they came from (see
+# catalog/querylog.py). The parameters of the slow queries can be secrets, eg
+# session keys, and are only logged with CATALOG_QUERY_LOG_PARAMS set.
+#
+# The log is written to CATALOG_QUERY_LOG_FILE by every process of the site. A
+# file cannot be rotated safely by several processes, so it is rotated by an
+# external tool, eg logrotate: the processes reopen the file once it was moved.
+CATALOG_QUERY_LOG = bool(os.environ.get('CATALOG_QUERY_LOG'))
+CATALOG_QUERY_LOG_PARAMS = bool(os.environ.get('CATALOG_QUERY_LOG_PARAMS'))
+CATALOG_SLOW_QUERY_MS = 100
+CATALOG_NPLUSONE_THRESHOLD = 5
+CATALOG_QUERY_LOG_FILE = os.environ.get('CATALOG_QUERY_LOG_FILE', os.path.join(BASE_DIR, 'queries.log'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'timestamped': {
+            'format': '%(asctime)s %(levelname)s %(message)s',
+        },
+    },
+    'handlers': {
+        'catalog_queries': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': CATALOG_QUERY_LOG_FILE,
+            'formatter': 'timestamped',
+            # the file is only created once a query is logged
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'catalog.queries': {
+            'handlers': ['catalog_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 WSGI_APPLICATION = 'locallibrary.wsgi.application'
 
+# Serve the read-only catalog pages with async views (see catalog/async_views.py).
+# locallibrary/asgi.py turns them on.
+CATALOG_ASYNC_VIEWS = bool(os.environ.get('CATALOG_ASYNC_VIEWS'))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -87,6 +166,74 @@ DATABASES = {
     }
 }
 
+# The cached data of the catalog and the versions that invalidate it (see
+# catalog/cache.py) must be shared by every process of the site, or a change made
+# by one worker or by a management command is not seen by the others. Set
+# CATALOG_CACHE_LOCATION to the memcached servers, eg '127.0.0.1:11211' (it needs
+# pymemcache). Without it the cache is kept in the memory of the process, which
+# is only right for a single process, eg runserver and the tests; `manage.py
+# check --deploy` warns about it.
+CATALOG_CACHE_LOCATION = os.environ.get('CATALOG_CACHE_LOCATION', '')
+
+if CATALOG_CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CATALOG_CACHE_LOCATION.split(','),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# The reads of the catalog can go to read replicas of the default database,
+# listed by alias (see catalog/routers.py). Set CATALOG_SQLITE_REPLICA to try it
+# locally with a second SQLite file kept up to date by the sync_replica command.
+CATALOG_READ_REPLICAS = []
+
+if os.environ.get('CATALOG_SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+        # the tests read the replica through the test primary
+        'TEST': {'MIRROR': 'default'},
+    }
+    CATALOG_READ_REPLICAS = ['replica']
+
+DATABASE_ROUTERS = ['catalog.routers.PrimaryReplicaRouter']
+
+# The SQLite tuning profile of catalog/sqlite.py, eg 'production' (WAL journal,
+# mmap, busy timeout). The profile also keeps the connections open between
+# requests. Leave it empty for stock SQLite.
+CATALOG_SQLITE_PROFILE = os.environ.get('CATALOG_SQLITE_PROFILE', '')
+
+if CATALOG_SQLITE_PROFILE:
+    for database in DATABASES.values():
+        database.setdefault('CONN_MAX_AGE', 600)
+
+# How long a browser reads from the primary after it wrote, and the requests
+# reading a cached namespace after its version was bumped, in seconds. It must
+# cover the replication lag.
+CATALOG_PRIMARY_PIN_SECONDS = 5
+
+# Where the sessions are kept, as the name of a session backend of Django: 'db'
+# (the default), 'cached_db' (read from the cache, written to the database),
+# 'cache' (the cache only, which must then be shared by every process) or
+# 'signed_cookies' (in the browser: signed but readable, and cannot be revoked).
+CATALOG_SESSION_MODE = os.environ.get('CATALOG_SESSION_MODE', 'db')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{CATALOG_SESSION_MODE}'
+
+# How often the visits of the home page, counted in the cache, are saved in the
+# session, in seconds (see catalog/visits.py). 0 saves them on every visit. The
+# visits not saved yet are only counted right with a cache shared by every
+# process (see CATALOG_CACHE_LOCATION above): with the cache of each process, a
+# session served by several workers has one pending count per worker, and each
+# flush only saves its own.
+CATALOG_VISITS_FLUSH_INTERVAL = 5 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -132,3 +279,8 @@ STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# How long the rendered content of the book and author detail pages is cached,
+# in seconds. The cache is invalidated when what the page shows changes; 0
+# disables it.
+CATALOG_DETAIL_CACHE_TIMEOUT = 60 * 60